@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""
+HISTORY:
+    Created on Sun Oct 18 21:37:15 2026
+
+Project: Vortex GUI
+
+Author: DIVE-LINK (www.dive-link.net), dive-link@mail.ru
+        Shustov Aleksey (SemperAnte), semte@semte.ru
+
+TODO:
+
+DESCRIPTION:
+    BlockBitmap of received image blocks (BLOCK_BITS of image data each), packed by np.packbits
+    bit order as VX!IMBL bitmap, kept up to date by deltas of VX!IMBD instead of full bitmaps.
+
+    Delta is <base sequence uint32> <sequence uint32> <block count uint32> and (first block, count) uint32
+    pairs of block ranges set after base sequence, run-length encoded from per block sequence stamps
+    by encodeDelta. Delta from base 0 is full bitmap, other side sends it when base is unknown to it
+    (e.g. it is restarted or new image is started), so receiver starts again from it.
+
+    Apply speed vs unpacking of full bitmap:
+        python blockBitmap.py
+"""
+import struct
+
+import numpy as np
+
+BLOCK_BITS = 288 # of image data per block
+DELTA_HEADER = struct.Struct('<III') # base sequence, sequence, block count
+RANGE = np.dtype([('first', '<u4'), ('count', '<u4')])
+
+def blockCount(numByte: int) -> int:
+    ''' blocks of numByte image data '''
+    return -(-numByte * 8 // BLOCK_BITS)
+
+def findRanges(mask: np.ndarray) -> np.ndarray:
+    ''' RANGE array of runs of True in bool array '''
+    mask = np.concatenate(([False], mask, [False]))
+    edges = np.flatnonzero(mask[1:] != mask[:-1])
+    ranges = np.empty(edges.size // 2, dtype = RANGE)
+    ranges['first'] = edges[0::2]
+    ranges['count'] = edges[1::2] - edges[0::2]
+    return ranges
+
+def encodeDelta(stamps: np.ndarray, base: int, seq: int) -> bytes:
+    ''' ranges of blocks set after base, stamps is sequence of setting per block, 0 for block not set '''
+    return DELTA_HEADER.pack(base, seq, stamps.size) + findRanges(stamps > base).tobytes()
+
+class BlockBitmap():
+
+    def __init__(self, count: int = 0):
+        self.reset(count)
+
+    def reset(self, count: int):
+        self.count = count
+        self.packed = np.zeros(-(-count // 8), dtype = np.uint8)
+        self.seq = 0
+        self.base = 0 # of last applied delta, 0 when bitmap is started again from full one
+
+    def setRange(self, first: int, count: int):
+        ''' set bits of blocks first...first + count - 1 in place '''
+        end = min(first + count, self.count)
+        if end <= first:
+            return
+        head, tail = first // 8, (end - 1) // 8
+        headMask = 0xFF >> (first % 8)
+        tailMask = (0xFF << (7 - (end - 1) % 8)) & 0xFF
+        if head == tail:
+            self.packed[head] |= headMask & tailMask
+        else:
+            self.packed[head] |= headMask
+            self.packed[head + 1:tail] = 0xFF
+            self.packed[tail] |= tailMask
+
+    def apply(self, delta) -> np.ndarray:
+        ''' applied ranges of delta, None if it doesn't follow seq (full delta from base 0 is required),
+            raise ValueError for broken delta '''
+        delta = memoryview(delta).cast('B')
+        if delta.nbytes < DELTA_HEADER.size or (delta.nbytes - DELTA_HEADER.size) % RANGE.itemsize:
+            raise ValueError('Wrong size of delta.')
+        base, seq, count = DELTA_HEADER.unpack_from(delta)
+        if base == 0:
+            self.reset(count)
+        elif base != self.seq or count != self.count:
+            return None
+        ranges = np.frombuffer(delta, dtype = RANGE, offset = DELTA_HEADER.size)
+        for first, size in ranges.tolist():
+            self.setRange(first, size)
+        self.seq = seq
+        self.base = base
+        return ranges
+
+    def held(self) -> np.ndarray:
+        ''' bool array of blocks '''
+        return np.unpackbits(self.packed, count = self.count).astype(bool)
+
+# test
+if __name__ == '__main__':
+
+    import time
+
+    rng = np.random.default_rng(1)
+    count = 1001
+    stamps = np.zeros(count, dtype = np.uint32)
+    bitmap = BlockBitmap()
+    for seq in range(1, 30):
+        stamps[(rng.random(count) < 0.05) & (stamps == 0)] = seq
+        assert bitmap.apply(encodeDelta(stamps, bitmap.seq, seq)) is not None
+        assert np.array_equal(bitmap.held(), stamps > 0) and bitmap.seq == seq
+        assert np.array_equal(bitmap.packed, np.packbits(stamps > 0))
+    assert bitmap.apply(encodeDelta(stamps, 3, 30)) is None and bitmap.seq == 29
+    stamps[:] = 0
+    stamps[[0, 7, 8, 15, 16, 1000]] = 31
+    assert bitmap.apply(encodeDelta(stamps, 0, 31)).size == 4 and np.array_equal(bitmap.held(), stamps > 0)
+    try:
+        bitmap.apply(b'\x00' * 13)
+        assert False
+    except ValueError:
+        pass
+
+    # one new block per update of image with count blocks
+    for count in (10 ** 3, 10 ** 5, 10 ** 7):
+        stamps = np.zeros(count, dtype = np.uint32)
+        bitmap = BlockBitmap(count)
+        updateCount = 50
+        encodeTime = applyTime = fullTime = 0.0
+        for seq in range(1, updateCount + 1):
+            stamps[rng.integers(count)] = seq
+            start = time.perf_counter()
+            delta = encodeDelta(stamps, bitmap.seq, seq)
+            encodeTime += time.perf_counter() - start
+            start = time.perf_counter()
+            bitmap.apply(delta)
+            applyTime += time.perf_counter() - start
+            full = np.packbits(stamps > 0).tobytes()
+            start = time.perf_counter()
+            np.unpackbits(np.frombuffer(full, dtype = np.uint8)).astype(bool)
+            fullTime += time.perf_counter() - start
+        print('{:>8d} blocks: delta {:3d} bytes, apply {:6.1f} us (encode {:8.1f} us); '
+              'full {:7d} bytes, unpack {:8.1f} us'.\
+              format(count, len(delta), applyTime / updateCount * 1e6, encodeTime / updateCount * 1e6,
+                     len(full), fullTime / updateCount * 1e6))
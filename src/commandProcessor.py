@@ -11,97 +11,588 @@ Author: DIVE-LINK (www.dive-link.net), dive-link@mail.ru
 TODO:
     [x] rename to commandProcessor
 DESCRIPTION:
-    Find commands with fixed or variable length in continious byte stream
+    Find commands with fixed or variable length in continious byte stream,
+    as bytes copies (process) or as CommandFrame views into processor buffer (processFrame)
+    
+    Memory is bounded on corrupted stream: command (or variable length header) longer than commandLimit,
+    payload size above payloadLimit or variable length command not ended by b'\n' are dropped,
+    then bytes are skipped until next VX! or VX? prefix (resynchronisation). 
+    Dropped bytes and reasons are counted in counter (see DROP_COUNTER).
+    
+    Payload of variable length command can be streamed to sink registered by setPayloadSink:
+    chunks go to sink as they arrive, so multi-MB payload is never held in processor buffer.
+    Command itself is still returned in order with other ones, but with empty payload (b'VX!DATA 0 \n').
+    
+    Variable length commands can also come as binary frames (negotiated by VX?CAPS):
+        <magic 2 bytes> <type 1 byte> <payload length 4 bytes> <payload CRC-32 4 bytes> <payload>
+    little endian, without b'\n' and decimal size field. They are mixed freely with text commands,
+    process() returns them in text form, processFrame() as usual frames with prefix of their type.
+    Frame with wrong CRC is dropped and counted as droppedCrc.
 """
+import collections
+import operator
+import struct
+import zlib
+
+BINARY_MAGIC = b'\xa5\x5a'
+BINARY_HEADER = struct.Struct('<2sBII') # magic, type, payload length, payload CRC-32
+BINARY_TYPE = {b'VX!DATA': 1, b'VX!STAT': 2, b'VX!IMBL': 3, b'VX!CHNK': 4, b'VX!MANI': 5, b'VX!HAVE': 6, b'VX!IMBD': 7}
+BINARY_PREFIX = {value: key for key, value in BINARY_TYPE.items()}
+
+def binaryHeader(prefix: bytes, *payload) -> bytes:
+    ''' header of binary frame for payload of variable length command prefix,
+        payload is given as one or several bytes-like parts '''
+    size = 0
+    crc = 0
+    for part in payload:
+        size += memoryview(part).nbytes
+        crc = zlib.crc32(part, crc)
+    return BINARY_HEADER.pack(BINARY_MAGIC, BINARY_TYPE[prefix], size, crc)
+
+class CommandFrame(tuple):
+    ''' Command found by CommandProcessor.processFrame without copying.
+        data is memoryview of whole command, prefix is command name (e.g. b'VX!DATA'), payload is
+        memoryview of bytes after name (after size field for variable length command) without b'\n'.
+        Views point into processor buffer and are released by next processing call of the processor,
+        so keep bytes(frame) or copy of payload (e.g. np.frombuffer(frame.payload, np.uint8).copy()) 
+        for longer use. Frame is tuple (view, exported, span) made without Python call, views and prefix
+        are made on access, so frame costs less than copy made by process(). '''
+    
+    __slots__ = ()
+    
+    view = property(operator.itemgetter(0), doc = 'memoryview of processor buffer')
+    exported = property(operator.itemgetter(1), doc = 'list of views made on access, released by processor')
+    span = property(operator.itemgetter(2), doc = '(start, end, name end, payload start) found by processor, '
+                                                  'last two are -1 for fixed length command, name end is '
+                                                  'CommandProcessor.BINARY_FRAME for binary frame')
+    
+    @property
+    def fixed(self) -> bool:
+        ''' fixed length command, e.g. parsed from its bytes copy cheaper than from views '''
+        return self[2][2] == -1
+    
+    @property
+    def data(self) -> memoryview:
+        return self._export(self[2][0], self[2][1])
+    
+    @property
+    def prefix(self) -> bytes:
+        view, _, (start, end, nameEnd, payloadIdx) = self
+        if nameEnd == CommandProcessor.BINARY_FRAME:
+            return BINARY_PREFIX[view[start + 2]]
+        return bytes(view[start:self._findName()[0]])
+    
+    @property
+    def payload(self) -> memoryview:
+        start, end, nameEnd, payloadIdx = self[2]
+        if nameEnd == CommandProcessor.BINARY_FRAME:
+            return self._export(payloadIdx, end)
+        payloadIdx = self._findName()[1]
+        return self._export(payloadIdx, max(payloadIdx, end - 1))
+        
+    def __bytes__(self) -> bytes:
+        return bytes(self[0][self[2][0]:self[2][1]])
+    
+    def __len__(self) -> int:
+        return self[2][1] - self[2][0]
+    
+    def __repr__(self) -> str:
+        return 'CommandFrame({!r:.80})'.format(bytes(self))
+    
+    def _export(self, start: int, end: int) -> memoryview:
+        view = self[0][start:end]
+        self[1].append(view)
+        return view
+    
+    def _findName(self) -> tuple:
+        ''' (name end, payload start), name of fixed length command is ended by space or b'\n' '''
+        view, _, (start, end, nameEnd, payloadIdx) = self
+        if nameEnd != -1:
+            return nameEnd, payloadIdx
+        nameEnd = view.obj.find(b' ', start, end - 1)
+        if nameEnd == -1:
+            nameEnd = max(start, end - 1)
+            return nameEnd, nameEnd
+        return nameEnd, nameEnd + 1
+
+class PayloadBuffer():
+    ''' Payload sink writing chunks one after another into writable buffer 
+        (e.g. bytearray, preallocated numpy array, mmap), bytes above its capacity are counted in overflow '''
+    
+    __slots__ = ('view', 'size', 'overflow')
+    
+    def __init__(self, buffer):
+        self.view = memoryview(buffer).cast('B')
+        self.size = 0 # written bytes
+        self.overflow = 0
+        
+    def __call__(self, chunk: memoryview):
+        numByte = min(chunk.nbytes, self.view.nbytes - self.size)
+        self.view[self.size:self.size + numByte] = chunk[:numByte]
+        self.size += numByte
+        self.overflow += chunk.nbytes - numByte
+        
+    def reset(self):
+        self.size = 0
+        self.overflow = 0
 
 class CommandProcessor():
+    ''' Received bytes are appended to bytearray and parsed from read offset, 
+        every byte is scanned once, consumed bytes are removed only occasionally '''
     
-    COMMAND_VARIABLE_PREFIX = [b'VX!DATA', b'VX!STAT', b'VX!IMBL']
+    COMMAND_VARIABLE_PREFIX = [b'VX!DATA', b'VX!STAT', b'VX!IMBL', b'VX!CHNK', b'VX!MANI', b'VX!HAVE', b'VX!IMBD']
+    COMMAND_SYNC_PREFIX = (b'VX!', b'VX?') # resynchronisation restarts parsing from one of them or binary magic
+    COMPACT_SIZE = 2 ** 16 # in bytes, consumed part of buffer removed when larger than this and unconsumed part
+    COMMAND_MAX_SIZE = 2 ** 12 # in bytes, default limit of fixed length command and variable length header
+    PAYLOAD_MAX_SIZE = 2 ** 24 # in bytes, default limit of variable length payload
     
-    def __init__(self):
-        self.packetBuffer = b''
+    DROP_COUNTER = ('droppedBytes',     # skipped by resynchronisation
+                    'droppedOversize',  # commands or headers longer than commandLimit
+                    'droppedHeader',    # broken size field or payload larger than payloadLimit
+                    'droppedTrailer',   # variable length commands not ended by b'\n'
+                    'droppedCrc')       # binary frames with wrong payload CRC
+    BINARY_FRAME = -2 # name end of binary frame span
+    
+    def __init__(self, commandLimit: int = None, payloadLimit: int = None, counter: collections.Counter = None):
+        ''' counter can be shared, e.g. with stats counters of connection '''
+        self.commandLimit = commandLimit if commandLimit is not None else self.COMMAND_MAX_SIZE
+        self.payloadLimit = payloadLimit if payloadLimit is not None else self.PAYLOAD_MAX_SIZE
+        self.counter = counter if counter is not None else collections.Counter()
+        self.counter.update(dict.fromkeys(self.DROP_COUNTER, 0))
+        self.resync = False # skipping bytes until next sync prefix
+        self.payloadSink = {} # prefix: sink
+        self.streamSink = None # sink of currently streamed payload
+        self.streamLeft = 0 # payload bytes not streamed yet
+        self.streamCommand = b'' # returned for streamed command
+        self.streamCrc = 0 # of streamed binary payload
+        self.binary = False # current command is binary frame
+        self.binaryCrc = 0 # expected payload CRC of binary frame
+        self.packetBuffer = bytearray()
+        self.offset = 0 # start of current command
+        self.searchIdx = 0 # bytes before it are scanned already for current command
+        self.spaceIdx = -1 # first space of variable length command header
+        self.payloadIdx = -1 # payload start of variable length command
         self.commandSize = 0 # size for variable-size command
+        self.view = None # memoryview of packetBuffer exported to frames
+        self.exported = [] # views made by frames
+    
+    def setPayloadSink(self, prefix: bytes, sink):
+        ''' stream payload of variable length command with prefix (e.g. b'VX!DATA') to sink:
+            callable(chunk: memoryview), chunk is valid only during call, or writable buffer 
+            wrapped to PayloadBuffer. None sink removes it. Return sink. '''
+        if prefix not in self.COMMAND_VARIABLE_PREFIX:
+            raise ValueError('{!r} is not variable length command.'.format(prefix))
+        if sink is None:
+            self.payloadSink.pop(prefix, None)
+        else:
+            if not callable(sink):
+                sink = PayloadBuffer(sink)
+            self.payloadSink[prefix] = sink
+        return sink
     
     def process(self, packet: bytearray) -> list:
         ''' Find and separate commands from byte stream'''
-
-        self.packetBuffer += packet        
-        commandFound = []        
-        commandNext = True
-        while commandNext:
-            commandNext = False
-            if self.commandSize > 0: # variable length
-                if len(self.packetBuffer) >= self.commandSize:                      
-                    commandFound.append(self.packetBuffer[:self.commandSize])
-                    self.packetBuffer = self.packetBuffer[self.commandSize:]
-                    self.commandSize = 0
-                    commandNext = True    
+        commandSpan = self._parse(packet)
+        with memoryview(self.packetBuffer) as view:
+            return [bytes(view[start:end]) if nameEnd == -1 else self._copyCommand(view, start, end, nameEnd, payloadIdx)
+                    for start, end, nameEnd, payloadIdx in commandSpan]
+        
+    def processFrame(self, packet: bytearray) -> list:
+        ''' Find commands as process() does, but return them as CommandFrame without copying.
+            Frames are valid until next process() or processFrame() call. '''
+        commandSpan = self._parse(packet)
+        if not commandSpan:
+            return []
+        self.view = memoryview(self.packetBuffer)
+        return [CommandFrame((self.view, self.exported, span)) if span[1] is not None else
+                CommandFrame((memoryview(span[0]), self.exported, (0, len(span[0])) + span[2:])) # streamed command
+                for span in commandSpan]
+    
+    def _parse(self, packet: bytearray) -> list:
+        ''' append packet and return (start, end, name end, payload start) of found commands,
+            last two are -1 for fixed length command, name end is BINARY_FRAME for binary frame, 
+            start is command bytes and end is None for streamed command '''
+        self._releaseFrame()
+        self._compact()
+        try:
+            self.packetBuffer += packet
+        except BufferError: # frame data is still used (e.g. by numpy array), leave old buffer to it
+            self._compact(detach = True)
+            self.packetBuffer += packet
+        commandSpan = []
+        while True:
+            if self.resync:
+                if not self._findSync():
+                    break
+                continue
+            elif self.streamSink is not None:
+                if not self._streamPayload():
+                    break
+                if self.binary:
+                    if self.streamCrc != self.binaryCrc:
+                        self._drop('droppedCrc')
+                        continue
+                    endIdx = self.offset
+                elif self.packetBuffer[self.offset] != 0x0A: # b'\n'
+                    self._drop('droppedTrailer')
+                    continue
+                else:
+                    endIdx = self.offset + 1
+                nameEnd = len(self.streamCommand) - 4 # b' 0 \n'
+                commandSpan.append((self.streamCommand, None, nameEnd, nameEnd + 3))
+            elif self.commandSize > 0: # variable length
+                endIdx = self.offset + self.commandSize
+                if endIdx > len(self.packetBuffer):
+                    break
+                if self.binary:
+                    with memoryview(self.packetBuffer) as view:
+                        crc = zlib.crc32(view[self.payloadIdx:endIdx])
+                    if crc != self.binaryCrc:
+                        self._drop('droppedCrc')
+                        continue
+                    commandSpan.append((self.offset, endIdx, self.BINARY_FRAME, self.payloadIdx))
+                elif self.packetBuffer[endIdx - 1] != 0x0A: # b'\n'
+                    self._drop('droppedTrailer')
+                    continue
+                else:
+                    commandSpan.append((self.offset, endIdx, self.spaceIdx, self.payloadIdx))
             else:
-                for prefix in self.COMMAND_VARIABLE_PREFIX:                
-                    if self.packetBuffer.startswith(prefix):
-                        if self.packetBuffer.count(b' ') > 1:
-                            startIdx = self.packetBuffer.index(b' ') + 1
-                            endIdx = startIdx + self.packetBuffer[startIdx:].index(b' ')
-                            self.commandSize = self.packetBuffer[startIdx:endIdx]
-                            try:
-                                self.commandSize = int(self.commandSize)
-                            except ValueError:                        
-                                self.commandSize = 0
-                                self.packetBuffer = self.packetBuffer[endIdx + 1:]
-                            else:
-                                self.commandSize += endIdx + 1 + 1 # for b'\n'             '                    
-                            commandNext = True   
-                            break
+                variable = self._matchPrefix()
+                if variable is None: # not enough bytes to decide
+                    break
+                elif variable == self.BINARY_FRAME:
+                    endIdx = self._parseBinaryHeader()
+                elif variable:
+                    endIdx = self._parseHeader()
                 else: # fixed length
-                    endIdx = self.packetBuffer.find(b'\n')
-                    if endIdx != -1:
-                        commandFound.append(self.packetBuffer[:endIdx + 1])
-                        self.packetBuffer = self.packetBuffer[endIdx + 1:]
-                        commandNext = True
-        return commandFound            
-    
-# test
+                    endIdx = self.packetBuffer.find(b'\n', self.searchIdx)
+                    if endIdx == -1:
+                        self.searchIdx = len(self.packetBuffer)
+                    else:
+                        endIdx += 1
+                if endIdx == -1: # wait for more bytes
+                    if self.searchIdx - self.offset > self.commandLimit:
+                        self._drop('droppedOversize')
+                        continue
+                    break
+                elif endIdx == 0: # header is parsed or dropped
+                    if self.commandSize > 0 and self.payloadSink:
+                        self._startStream()
+                    continue
+                elif endIdx - self.offset > self.commandLimit:
+                    self._drop('droppedOversize')
+                    continue
+                commandSpan.append((self.offset, endIdx, -1, -1))
+            self.offset = endIdx
+            self.searchIdx = endIdx
+            self.spaceIdx = -1
+            self.payloadIdx = -1
+            self.commandSize = 0
+            self.streamSink = None
+            self.binary = False
+        return commandSpan
+    
+    def _copyCommand(self, view: memoryview, start, end: int, nameEnd: int, payloadIdx: int) -> bytes:
+        ''' bytes of variable length command span, binary frame is converted to text form '''
+        if end is None:
+            return start
+        elif nameEnd == self.BINARY_FRAME:
+            return b''.join((BINARY_PREFIX[view[start + 2]], b' %d ' % (end - payloadIdx), view[payloadIdx:end], b'\n'))
+        return bytes(view[start:end])
+    
+    def _matchPrefix(self):
+        ''' True for variable length command, False for fixed one, BINARY_FRAME for binary frame,
+            None if more bytes are required '''
+        available = len(self.packetBuffer) - self.offset
+        if not available:
+            return None
+        elif self.packetBuffer[self.offset] == BINARY_MAGIC[0]:
+            if available < len(BINARY_MAGIC):
+                return None
+            elif self.packetBuffer.startswith(BINARY_MAGIC, self.offset):
+                return self.BINARY_FRAME
+        for prefix in self.COMMAND_VARIABLE_PREFIX:
+            if self.packetBuffer.startswith(prefix, self.offset):
+                return True
+        for prefix in self.COMMAND_VARIABLE_PREFIX:
+            if available < len(prefix) and self.packetBuffer.startswith(prefix[:available], self.offset):
+                return None
+        return False
+    
+    def _parseHeader(self) -> int:
+        ''' scan new bytes of header <prefix> <size> of variable length command.
+            Return end of command for header ended by newline (handled as fixed length command),
+            0 when size is found or header is dropped, -1 when more bytes are required '''
+        while True:
+            spaceIdx = self.packetBuffer.find(b' ', self.searchIdx)
+            lineIdx = self.packetBuffer.find(b'\n', self.searchIdx, 
+                                             spaceIdx if spaceIdx != -1 else len(self.packetBuffer))
+            if lineIdx != -1:
+                return lineIdx + 1
+            if spaceIdx == -1:
+                self.searchIdx = len(self.packetBuffer)
+                return -1
+            self.searchIdx = spaceIdx + 1
+            if self.spaceIdx == -1:
+                self.spaceIdx = spaceIdx
+                continue
+            try:
+                size = int(self.packetBuffer[self.spaceIdx + 1:spaceIdx])
+            except ValueError:
+                size = -1
+            if size < 0 or size > self.payloadLimit:
+                self._drop('droppedHeader')
+            else:
+                self.commandSize = size + spaceIdx + 1 + 1 - self.offset # for b'\n'
+                self.payloadIdx = spaceIdx + 1
+            return 0
+            
+    def _parseBinaryHeader(self) -> int:
+        ''' 0 when header of binary frame is parsed or dropped, -1 when more bytes are required '''
+        if len(self.packetBuffer) - self.offset < BINARY_HEADER.size:
+            self.searchIdx = len(self.packetBuffer)
+            return -1
+        _, frameType, size, crc = BINARY_HEADER.unpack_from(self.packetBuffer, self.offset)
+        if frameType not in BINARY_PREFIX or size > self.payloadLimit:
+            self._drop('droppedHeader')
+        else:
+            self.binary = True
+            self.binaryCrc = crc
+            self.payloadIdx = self.offset + BINARY_HEADER.size
+            self.commandSize = BINARY_HEADER.size + size
+        return 0
+    
+    def _drop(self, reason: str):
+        ''' drop command at offset and start resynchronisation after its first byte '''
+        self.counter[reason] += 1
+        self.searchIdx = self.offset + 1
+        self.spaceIdx = -1
+        self.payloadIdx = -1
+        self.commandSize = 0
+        self.streamSink = None
+        self.binary = False
+        self.resync = True
+        
+    def _startStream(self):
+        ''' stream payload of parsed header if its prefix has sink, header bytes are consumed '''
+        if self.binary:
+            prefix = BINARY_PREFIX[self.packetBuffer[self.offset + 2]]
+        else:
+            prefix = bytes(self.packetBuffer[self.offset:self.spaceIdx])
+        sink = self.payloadSink.get(prefix)
+        if sink is not None:
+            self.streamSink = sink
+            self.streamLeft = self.commandSize - (self.payloadIdx - self.offset) - (not self.binary)
+            self.streamCommand = prefix + b' 0 \n'
+            self.streamCrc = 0
+            self.offset = self.payloadIdx
+            self.searchIdx = self.payloadIdx
+            self.spaceIdx = -1
+            self.payloadIdx = -1
+            self.commandSize = 0
+    
+    def _streamPayload(self) -> bool:
+        ''' pass available payload bytes to sink, True when whole payload is passed 
+            and trailer byte of text command is received '''
+        numByte = min(len(self.packetBuffer) - self.offset, self.streamLeft)
+        if numByte > 0:
+            chunk = memoryview(self.packetBuffer)[self.offset:self.offset + numByte]
+            try:
+                if self.binary:
+                    self.streamCrc = zlib.crc32(chunk, self.streamCrc)
+                self.streamSink(chunk)
+            finally:
+                try:
+                    chunk.release()
+                except BufferError: # kept by sink, buffer is detached on resizing
+                    pass
+            self.offset += numByte
+            self.searchIdx = self.offset
+            self.streamLeft -= numByte
+        return self.streamLeft == 0 and (self.binary or self.offset < len(self.packetBuffer))
+    
+    def _findSync(self) -> bool:
+        ''' skip bytes before next sync prefix, False if more bytes are required '''
+        while True:
+            idx = self.packetBuffer.find(b'VX', self.searchIdx)
+            magicIdx = self.packetBuffer.find(BINARY_MAGIC, self.searchIdx, idx if idx != -1 else len(self.packetBuffer))
+            if magicIdx != -1:
+                idx = magicIdx
+                found = True
+            elif idx == -1: # last byte can be start of prefix
+                idx = max(self.searchIdx, len(self.packetBuffer) - 1)
+                found = False
+            elif idx + 3 > len(self.packetBuffer):
+                found = False
+            elif self.packetBuffer[idx:idx + 3] not in self.COMMAND_SYNC_PREFIX:
+                self.searchIdx = idx + 1
+                continue
+            else:
+                found = True
+            self.counter['droppedBytes'] += idx - self.offset
+            self.offset = idx
+            self.searchIdx = idx
+            self.resync = not found
+            return found
+            
+    def _releaseFrame(self):
+        ''' end lifetime of frames returned by last processFrame call '''
+        if self.view is not None:
+            try:
+                for view in self.exported:
+                    view.release()
+                self.view.release()
+            except BufferError: # still exported, buffer is detached on resizing
+                pass
+            self.view = None
+            self.exported = []
+            
+    def _compact(self, detach: bool = False):
+        ''' remove consumed bytes, detach copies unconsumed ones to new buffer '''
+        if detach:
+            self.packetBuffer = self.packetBuffer[self.offset:]
+        elif self.offset == len(self.packetBuffer) or \
+             (self.offset > self.COMPACT_SIZE and 2 * self.offset > len(self.packetBuffer)):
+            try:
+                del self.packetBuffer[:self.offset]
+            except BufferError:
+                self.packetBuffer = self.packetBuffer[self.offset:]
+        else:
+            return
+        self.searchIdx -= self.offset
+        if self.spaceIdx != -1:
+            self.spaceIdx -= self.offset
+        if self.payloadIdx != -1:
+            self.payloadIdx -= self.offset
+        self.offset = 0
+    
+# test and benchmark
 if __name__ == '__main__':
     
+    import os
     import random
+    import time
     
-    commandProcessor = CommandProcessor()
-
     COMMAND_FIXED = [b'VX!RATE 1/2\n',
                      b'VX!POWERLEVEL 83\n', 
-                     b'VX!BLOCKSIZE 34\n']
+                     b'VX!BLOCKSIZE 34\n',
+                     b'VX!OK\n']
 
-    COMMAND_TOTAL_COUNT = 1000
+    COMMAND_TOTAL_COUNT = 200000
     COMMAND_VARIABLE_MAX_LENGTH = 1000
-    PACKET_MAX_SIZE = 500 # in bytes
+    COMMAND_VARIABLE_RATIO = 0.1 # part of variable length commands, others are short fixed ones
+    PACKET_MAX_SIZE = [500, 2 ** 14, None] # in bytes, random packet length up to it, None for one read
 
     commandSource = []
     for i in range(COMMAND_TOTAL_COUNT):
-        choice = random.randrange(len(COMMAND_FIXED) + len(CommandProcessor.COMMAND_VARIABLE_PREFIX))
-        if choice < len(COMMAND_FIXED):        
-            commandSource.append(COMMAND_FIXED[choice])
+        if random.random() > COMMAND_VARIABLE_RATIO:
+            commandSource.append(random.choice(COMMAND_FIXED))
         else: # variable length
             variableLength = random.randint(1, COMMAND_VARIABLE_MAX_LENGTH)
-            variableByte = bytearray([random.randint(0, 255) for x in range(variableLength)])            
+            variableByte = os.urandom(variableLength)
             commandVariable = random.choice(CommandProcessor.COMMAND_VARIABLE_PREFIX)
             commandVariable += ' {} '.format(variableLength).encode() + variableByte + b'\n'
             commandSource.append(commandVariable)
         
+    # corrupted stream: garbage size, missing trailer, endless line, all followed by valid commands
+    commandProcessor = CommandProcessor(commandLimit = 64, payloadLimit = 1000)
+    commandCorrupted = [b'VX!DATA 99999999 xx', b'VX!OK\n',
+                        b'VX!STAT 3 abcd', b'VX!RATE 1/2\n',
+                        b'noise' * 100, b'VX?INFO\n',
+                        b'VX!IMBL -4 ', b'VX!OK\n']
+    commandFound = []
+    for singleByte in b''.join(commandCorrupted):
+        commandFound.extend(commandProcessor.process(bytes([singleByte])))
+    assert commandFound == [b'VX!OK\n', b'VX!RATE 1/2\n', b'VX?INFO\n', b'VX!OK\n'], commandFound
+    assert commandProcessor.counter['droppedHeader'] == 2
+    assert commandProcessor.counter['droppedTrailer'] == 1
+    assert commandProcessor.counter['droppedOversize'] == 1
+    for _ in range(1000): # noisy link does not grow buffer
+        commandProcessor.process(os.urandom(1000).replace(b'\n', b' '))
+    assert len(commandProcessor.packetBuffer) < 2 * CommandProcessor.COMPACT_SIZE + 1000
+    print('resynchronisation:', dict(commandProcessor.counter))
+    
+    # streaming of multi-MB payloads to preallocated array, processor buffer stays small
+    import numpy as np
+    PAYLOAD_SIZE = 2 ** 23
+    image = np.random.randint(0, 256, 4 * PAYLOAD_SIZE, dtype = np.uint8)
+    imageSink = np.zeros_like(image)
+    for stream in (False, True):
+        commandProcessor = CommandProcessor()
+        if stream:
+            payloadBuffer = commandProcessor.setPayloadSink(b'VX!DATA', imageSink)
+        bufferMaxSize = 0
+        start = time.perf_counter()
+        for idx in range(0, image.size, PAYLOAD_SIZE):
+            payload = memoryview(image[idx:idx + PAYLOAD_SIZE])
+            commandProcessor.process('VX!DATA {:d} '.format(payload.nbytes).encode())
+            for packetStart in range(0, payload.nbytes, 2 ** 14):
+                commandFound = commandProcessor.process(payload[packetStart:packetStart + 2 ** 14])
+                bufferMaxSize = max(bufferMaxSize, len(commandProcessor.packetBuffer))
+            commandFound = commandProcessor.process(b'\n')
+            assert len(commandFound) == 1
+        duration = time.perf_counter() - start
+        if stream:
+            assert payloadBuffer.size == image.size and np.array_equal(image, imageSink)
+        print('{:<12s} {:d} MiB payloads: {:8.1f} MB/s, max buffer {:8.1f} KiB'.\
+              format('stream' if stream else 'buffer', PAYLOAD_SIZE // 2 ** 20,
+                     image.size / duration / 1e6, bufferMaxSize / 1024))
+    
     commandStream = b''.join(commandSource)
     
-    # split continious stream to packets with random length
-    commandPacket = []
-    packetStart = 0
-    packetEnd = 0
-    while packetStart < len(commandStream):
-        packetLng = random.randint(1, PACKET_MAX_SIZE)
-        packetEnd = packetStart + packetLng
-        commandPacket.append(commandStream[packetStart:packetEnd])
-        packetStart = packetEnd
-    assert sum([len(x) for x in commandPacket]) == sum([len(x) for x in commandSource])
-  
-    commandFound = []
-    for singlePacket in commandPacket:
-        commandFound.extend(commandProcessor.process(singlePacket))
+    for packetMaxSize in PACKET_MAX_SIZE:
+        # split continious stream to packets with random length
+        commandPacket = []
+        packetStart = 0
+        while packetStart < len(commandStream):
+            packetLng = random.randint(1, packetMaxSize) if packetMaxSize is not None else len(commandStream)
+            commandPacket.append(commandStream[packetStart:packetStart + packetLng])
+            packetStart += packetLng
+        assert sum([len(x) for x in commandPacket]) == sum([len(x) for x in commandSource])
+        
+        for frame in (False, True):
+            commandProcessor = CommandProcessor()
+            process = commandProcessor.processFrame if frame else commandProcessor.process
+            commandCount = commandSize = 0
+            start = time.perf_counter()
+            for singlePacket in commandPacket: # commands are handled and dropped, frames are valid until next call
+                for command in process(singlePacket):
+                    commandCount += 1
+                    commandSize += len(command)
+            duration = time.perf_counter() - start
+            
+            assert commandCount == len(commandSource) and commandSize == len(commandStream)
+            commandProcessor = CommandProcessor()
+            process = commandProcessor.processFrame if frame else commandProcessor.process
+            assert commandSource == [bytes(x) for singlePacket in commandPacket for x in process(singlePacket)]
+            print('{:<12s} packets up to {:>8s} bytes: {:8.1f} MB/s, {:10.0f} commands/s'.\
+                  format('processFrame' if frame else 'process', 
+                         str(packetMaxSize) if packetMaxSize is not None else 'all', 
+                         len(commandStream) / duration / 1e6, commandCount / duration))
     
-    assert commandSource == commandFound
\ No newline at end of file
+    # text vs binary framing of variable length commands: bytes on wire and parse cost
+    for payloadSize in (16, 256, 8192, 2 ** 20):
+        payload = os.urandom(payloadSize)
+        commandCount = max(16, 2 ** 24 // payloadSize) if payloadSize > 16 else 200000
+        for binary in (False, True):
+            if binary:
+                command = binaryHeader(b'VX!DATA', payload) + payload
+            else:
+                command = b'VX!DATA %d ' % payloadSize + payload + b'\n'
+            commandStream = command * commandCount
+            commandPacket = [commandStream[idx:idx + 2 ** 14] for idx in range(0, len(commandStream), 2 ** 14)]
+            for frame in (False, True):
+                commandProcessor = CommandProcessor()
+                commandFound = 0
+                start = time.perf_counter()
+                for singlePacket in commandPacket:
+                    if frame:
+                        commandFound += len(commandProcessor.processFrame(singlePacket))
+                    else:
+                        commandFound += len(commandProcessor.process(singlePacket))
+                duration = time.perf_counter() - start
+                assert commandFound == commandCount
+                print('{:<6s} {:<12s} payload {:>7d} bytes: overhead {:2d} bytes, {:8.1f} MB/s, {:5.2f} us/command'.\
+                      format('binary' if binary else 'text', 'processFrame' if frame else 'process', payloadSize,
+                             len(command) - payloadSize, len(commandStream) / duration / 1e6, 
+                             duration / commandCount * 1e6))
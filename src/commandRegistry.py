@@ -0,0 +1,469 @@
+# -*- coding: utf-8 -*-
+"""
+HISTORY:
+    Created on Sun Oct 18 14:20:37 2026
+
+Project: Vortex GUI
+
+Author: DIVE-LINK (www.dive-link.net), dive-link@mail.ru
+        Shustov Aleksey (SemperAnte), semte@semte.ru
+
+TODO:
+
+DESCRIPTION:
+    Registry of VX commands shared by UpperLayerConnector and UpperLayerEmulator.
+    Every command is a small __slots__ class with encode/parse, found by its name in COMMAND:
+        command = commandRegistry.parse(b'VX!RATE 1/2\n') # RateCommand('1/2')
+        data = commandRegistry.RateCommand('1/2').encode() # b'VX!RATE 1/2\n'
+    Parameter commands of ModemWidget are also found by parameter key in PARAMETER.
+    New command is one class with NAME and register decorator.
+    Variable length commands are encoded as binary frames (see commandProcessor) with binary = True,
+    after VX?CAPS <max frame> request was answered by VX!CAPS <agreed max frame> above zero.
+"""
+import commandProcessor
+
+COMMAND = {} # name: command class
+PARAMETER = {} # parameter key: command class
+
+def register(cls):
+    ''' class decorator, add command class to registry '''
+    COMMAND[cls.NAME] = cls
+    if cls.KEY is not None:
+        PARAMETER[cls.KEY] = cls
+    return cls
+
+def parse(data: bytes):
+    ''' command object for whole received command, None for unknown or broken one '''
+    data = bytes(data)
+    idx = data.find(b' ')
+    if idx == -1:
+        name, args = data.rstrip(b'\n'), b''
+    else:
+        name, args = data[:idx], data[idx + 1:-1]
+    cls = COMMAND.get(name)
+    if cls is None:
+        return None
+    try:
+        return cls.parse(args)
+    except ValueError:
+        return None
+
+def parseFrame(frame):
+    ''' command object for commandProcessor.CommandFrame, payload of variable length command
+        is kept as memoryview valid as long as frame is '''
+    if frame.fixed: # short, copy is parsed faster than views
+        return parse(bytes(frame))
+    cls = COMMAND.get(frame.prefix)
+    if cls is None:
+        return None
+    elif issubclass(cls, VariableCommand):
+        try:
+            return cls.fromPayload(frame.payload)
+        except ValueError:
+            return None
+    try:
+        return cls.parse(bytes(frame.payload))
+    except ValueError:
+        return None
+
+class Command():
+    ''' command without arguments '''
+
+    __slots__ = ()
+    NAME = b''
+    KEY = None # parameter key of ModemWidget
+
+    def encode(self) -> bytes:
+        return self.NAME + b'\n'
+
+    def buffers(self) -> tuple:
+        ''' buffers for scatter/gather write '''
+        return (self.encode(),)
+
+    @classmethod
+    def parse(cls, args: bytes):
+        return cls()
+
+    @classmethod
+    def fields(cls) -> tuple:
+        ''' slots of class and its bases '''
+        return tuple(x for base in reversed(cls.__mro__) for x in base.__dict__.get('__slots__', ()))
+
+    def __eq__(self, other):
+        return type(self) is type(other) and \
+               all(getattr(self, x) == getattr(other, x) for x in self.fields())
+
+    def __repr__(self):
+        return '{}({})'.format(type(self).__name__, ', '.join(repr(getattr(self, x)) for x in self.fields()))
+
+class ValueCommand(Command):
+    ''' command with one argument converted by TYPE '''
+
+    __slots__ = ('value',)
+    TYPE = str
+
+    def __init__(self, value):
+        self.value = value
+
+    def encode(self) -> bytes:
+        return self.NAME + b' ' + str(self.value).encode() + b'\n'
+
+    @classmethod
+    def parse(cls, args: bytes):
+        if not args:
+            raise ValueError
+        return cls(cls.TYPE(args.decode('ascii')))
+
+class ParameterCommand(ValueCommand):
+    ''' modem parameter, acknowledged by VX!OK, value is sent in upper case '''
+
+    __slots__ = ()
+
+    def encode(self) -> bytes:
+        return self.NAME + b' ' + str(self.value).upper().encode() + b'\n'
+
+class VariableCommand(Command):
+    ''' <name> <size> <payload>\n, payload is bytes-like '''
+
+    __slots__ = ('payload',)
+
+    def __init__(self, payload):
+        self.payload = payload
+
+    def encode(self, binary: bool = False) -> bytes:
+        return b''.join(bytes(x) for x in self.buffers(binary))
+
+    def buffers(self, binary: bool = False) -> tuple:
+        ''' payload is not copied, binary selects binary frame instead of text command '''
+        if binary:
+            return (commandProcessor.binaryHeader(self.NAME, self.payload), self.payload)
+        return (self.NAME + ' {:d} '.format(memoryview(self.payload).nbytes).encode(), self.payload, b'\n')
+
+    @classmethod
+    def parse(cls, args: bytes):
+        size, payload = args.split(b' ', 1)
+        if int(size) != len(payload):
+            raise ValueError
+        return cls.fromPayload(payload)
+
+    @classmethod
+    def fromPayload(cls, payload):
+        ''' command from payload (bytes or memoryview of CommandFrame) '''
+        return cls(payload)
+
+@register
+class OkCommand(Command):
+    __slots__ = ()
+    NAME = b'VX!OK'
+
+@register
+class StartCommand(Command):
+    __slots__ = ()
+    NAME = b'VX!START'
+
+@register
+class StopCommand(Command):
+    __slots__ = ()
+    NAME = b'VX!STOP'
+
+@register
+class IdCommand(ParameterCommand):
+    __slots__ = ()
+    NAME = b'VX!ID'
+    KEY = 'id'
+    TYPE = int
+
+@register
+class NameCommand(ParameterCommand):
+    __slots__ = ()
+    NAME = b'VX!NAME'
+    KEY = 'name'
+
+@register
+class ModeCommand(ParameterCommand):
+    __slots__ = ()
+    NAME = b'VX!MODE'
+    KEY = 'mode'
+
+@register
+class RobCommand(ParameterCommand):
+    __slots__ = ()
+    NAME = b'VX!ROB'
+    KEY = 'rob'
+
+@register
+class MdlCommand(ParameterCommand):
+    __slots__ = ()
+    NAME = b'VX!MDL'
+    KEY = 'mdl'
+
+@register
+class RateCommand(ParameterCommand):
+    __slots__ = ()
+    NAME = b'VX!RATE'
+    KEY = 'rate'
+
+@register
+class BlockSizeCommand(ParameterCommand):
+    __slots__ = ()
+    NAME = b'VX!BLOCKSIZE'
+    KEY = 'blockSize'
+    TYPE = int
+
+@register
+class TransSizeCommand(ParameterCommand):
+    __slots__ = ()
+    NAME = b'VX!TRANSSIZE'
+    KEY = 'transSize'
+    TYPE = int
+
+@register
+class PowerLevelCommand(ParameterCommand):
+    __slots__ = ()
+    NAME = b'VX!POWERLEVEL'
+    KEY = 'powerLevel'
+    TYPE = int
+
+@register
+class MultiSetCommand(Command):
+    ''' several parameters acknowledged by one VX!OK: VX!MSET ID=5 RATE=1/2\n,
+        parameter with empty value or value with space is sent by own command (see fits) '''
+    __slots__ = ('parameters',)
+    NAME = b'VX!MSET'
+
+    def __init__(self, parameters: list):
+        self.parameters = parameters # of ParameterCommand
+
+    def encode(self) -> bytes:
+        items = [x.encode()[len(b'VX!'):-1].replace(b' ', b'=', 1) for x in self.parameters]
+        if not all(self._fitsItem(x) for x in items):
+            raise ValueError('Parameter value is empty or has space.')
+        return b' '.join((self.NAME, *items)) + b'\n'
+
+    @classmethod
+    def fits(cls, parameter: ParameterCommand) -> bool:
+        ''' value of parameter can be carried by VX!MSET '''
+        return cls._fitsItem(parameter.encode()[len(b'VX!'):-1].replace(b' ', b'=', 1))
+
+    @staticmethod
+    def _fitsItem(item: bytes) -> bool:
+        name, separator, value = item.partition(b'=')
+        return bool(separator and value) and b' ' not in value
+
+    @classmethod
+    def parse(cls, args: bytes):
+        parameters = []
+        for item in args.split(b' '):
+            name, separator, value = item.partition(b'=')
+            command = COMMAND.get(b'VX!' + name)
+            if not separator or command is None or not issubclass(command, ParameterCommand):
+                raise ValueError
+            parameters.append(command.parse(value))
+        return cls(parameters)
+
+@register
+class UverRequest(Command):
+    __slots__ = ()
+    NAME = b'VX?UVER'
+
+@register
+class UverCommand(ValueCommand):
+    __slots__ = ()
+    NAME = b'VX!UVER'
+
+@register
+class LverRequest(Command):
+    __slots__ = ()
+    NAME = b'VX?LVER'
+
+@register
+class LverCommand(ValueCommand):
+    __slots__ = ()
+    NAME = b'VX!LVER'
+
+@register
+class CapsRequest(ValueCommand):
+    ''' value is max binary frame payload supported by requesting side '''
+    __slots__ = ()
+    NAME = b'VX?CAPS'
+    TYPE = int
+
+@register
+class CapsCommand(ValueCommand):
+    ''' value is agreed max binary frame payload, 0 keeps text commands '''
+    __slots__ = ()
+    NAME = b'VX!CAPS'
+    TYPE = int
+
+@register
+class InfoRequest(Command):
+    __slots__ = ()
+    NAME = b'VX?INFO'
+
+@register
+class InfoCommand(Command):
+    __slots__ = ('progress', 'datarate', 'ber', 'bler')
+    NAME = b'VX!INFO'
+
+    def __init__(self, progress: int, datarate: float, ber: float, bler: float):
+        self.progress = progress
+        self.datarate = datarate
+        self.ber = ber
+        self.bler = bler
+
+    def encode(self) -> bytes:
+        return 'VX!INFO {:d} {:.1f} {:.2e} {:.2e}\n'.format(self.progress, self.datarate,
+                                                            self.ber, self.bler).encode()
+
+    @classmethod
+    def parse(cls, args: bytes):
+        progress, datarate, ber, bler = args.split(b' ')
+        return cls(int(progress), float(datarate), float(ber), float(bler))
+
+@register
+class StatRequest(Command):
+    __slots__ = ()
+    NAME = b'VX?STAT'
+
+@register
+class StatCommand(VariableCommand):
+    __slots__ = ()
+    NAME = b'VX!STAT'
+
+@register
+class ImblRequest(Command):
+    __slots__ = ()
+    NAME = b'VX?IMBL'
+
+@register
+class ImblCommand(VariableCommand):
+    __slots__ = ()
+    NAME = b'VX!IMBL'
+
+@register
+class ImbdRequest(ValueCommand):
+    ''' delta of received image blocks after base sequence: VX?IMBD <base>\n '''
+    __slots__ = ()
+    NAME = b'VX?IMBD'
+    TYPE = int
+
+@register
+class ImbdCommand(VariableCommand):
+    ''' delta of received image blocks encoded by blockBitmap.encodeDelta '''
+    __slots__ = ()
+    NAME = b'VX!IMBD'
+
+@register
+class DataCommand(VariableCommand):
+    __slots__ = ()
+    NAME = b'VX!DATA'
+
+@register
+class ChunkCommand(VariableCommand):
+    ''' image chunk at byte offset, acknowledged by VX!ACK <offset>:
+        VX!CHNK <size> <offset> <payload>\n, size counts offset field too '''
+    __slots__ = ('offset',)
+    NAME = b'VX!CHNK'
+
+    def __init__(self, payload, offset: int):
+        self.payload = payload
+        self.offset = offset
+
+    def buffers(self, binary: bool = False) -> tuple:
+        offset = b'%d ' % self.offset
+        if binary:
+            return (commandProcessor.binaryHeader(self.NAME, offset, self.payload), offset, self.payload)
+        size = len(offset) + memoryview(self.payload).nbytes
+        return (self.NAME + b' %d ' % size + offset, self.payload, b'\n')
+
+    @classmethod
+    def fromPayload(cls, payload):
+        idx = bytes(payload[:20]).find(b' ')
+        if idx == -1:
+            raise ValueError
+        return cls(payload[idx + 1:], int(bytes(payload[:idx])))
+
+@register
+class AckCommand(ValueCommand):
+    ''' acknowledgement of VX!CHNK at offset '''
+    __slots__ = ()
+    NAME = b'VX!ACK'
+    TYPE = int
+
+@register
+class ManifestCommand(VariableCommand):
+    ''' encoded transferManifest.TransferManifest of image to upload, answered by VX!HAVE '''
+    __slots__ = ()
+    NAME = b'VX!MANI'
+
+@register
+class HaveCommand(VariableCommand):
+    ''' bitmap of manifest chunks held by other side '''
+    __slots__ = ()
+    NAME = b'VX!HAVE'
+
+@register
+class SubscribeCommand(Command):
+    ''' other side pushes telemetry commands of topics every period in seconds until connection is closed,
+        acknowledged by VX!OK, period 0 ends subscription: VX!SUBSCRIBE INFO,STAT,IMBL 2\n '''
+    __slots__ = ('topics', 'period')
+    NAME = b'VX!SUBSCRIBE'
+    TOPIC = {'INFO': InfoCommand, 'STAT': StatCommand, 'IMBL': ImblCommand, 'IMBD': ImbdCommand}
+
+    def __init__(self, topics: list, period: float):
+        self.topics = list(topics)
+        self.period = period
+
+    def encode(self) -> bytes:
+        return self.NAME + ' {} {:g}\n'.format(','.join(self.topics), self.period).encode()
+
+    @classmethod
+    def parse(cls, args: bytes):
+        topics, period = args.split(b' ')
+        topics = topics.decode().split(',')
+        period = float(period)
+        if any(x not in cls.TOPIC for x in topics) or not period >= 0:
+            raise ValueError
+        return cls(topics, period)
+
+# test
+if __name__ == '__main__':
+
+    import time
+
+    COMMAND_TEST = [IdCommand(5), NameCommand('A'), RateCommand('1/2'), PowerLevelCommand(83),
+                    OkCommand(), StartCommand(), UverRequest(), UverCommand('0.41 emu'),
+                    InfoCommand(3, 1345.2, 2.35e-3, 1.34e-2), StatCommand(b'Pack N| 1 2\n 3'),
+                    DataCommand(b'\n\x00 12 '), CapsRequest(2 ** 20), ChunkCommand(b' 7\n', 8192), AckCommand(8192),
+                    ManifestCommand(b'\x00\n 1'), HaveCommand(b'\xff'),
+                    MultiSetCommand([IdCommand(5), RateCommand('1/2'), NameCommand('A')]),
+                    SubscribeCommand(['INFO', 'STAT', 'IMBL'], 2.0), SubscribeCommand(['INFO'], 0.5),
+                    ImbdRequest(12), ImbdCommand(b'\x00\n\x01')]
+    for command in COMMAND_TEST:
+        assert parse(command.encode()) == command, command
+    frame = commandProcessor.CommandProcessor().processFrame(StatCommand(b'12 \n3').encode(binary = True))[0]
+    assert parseFrame(frame) == StatCommand(frame.payload)
+    frame = commandProcessor.CommandProcessor().processFrame(ChunkCommand(b'a b', 12).encode(binary = True))[0]
+    assert parseFrame(frame) == ChunkCommand(b'a b', 12)
+    assert parse(b'VX!UNKNOWN 1\n') is None
+    assert parse(b'VX!ID X\n') is None
+    assert parse(b'VX!MSET ID=5 UVER=1\n') is None and parse(b'VX!MSET\n') is None
+    assert parse(b'VX!MSET ID=5 NAME=\n') is None and parse(b'VX!MSET ID=5 NAME=MY BOAT\n') is None
+    assert MultiSetCommand.fits(NameCommand('A')) and MultiSetCommand.fits(RateCommand('1/2'))
+    assert not MultiSetCommand.fits(NameCommand('MY BOAT')) and not MultiSetCommand.fits(NameCommand(''))
+    for parameters in ([IdCommand(5), NameCommand('MY BOAT')], [NameCommand(''), IdCommand(5)]):
+        try:
+            MultiSetCommand(parameters).encode()
+            assert False
+        except ValueError:
+            pass
+    assert parse(b'VX!SUBSCRIBE INFO,LVER 2\n') is None and parse(b'VX!SUBSCRIBE INFO -1\n') is None
+    assert PARAMETER['blockSize'] is BlockSizeCommand
+
+    COMMAND_COUNT = 100000
+    data = [x.encode() for x in COMMAND_TEST[:9]] * (COMMAND_COUNT // 9)
+    start = time.perf_counter()
+    for x in data:
+        parse(x)
+    duration = time.perf_counter() - start
+    print('parse: {:.2f} us/command'.format(duration / len(data) * 1e6))
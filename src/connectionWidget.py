@@ -21,12 +21,14 @@ DESCRIPTION:
             commandSend
         slots:
             receiveCommand
+            changeConnectionStatus
+            showLinkState
+            showError
 """
 from PyQt5 import QtWidgets as qtw
 from PyQt5 import QtGui as qtg
 from PyQt5 import QtCore as qtc
 
-import time
 import utility
 
 import sys
@@ -45,6 +47,10 @@ class ConnectionWidget(qtw.QGroupBox):
     CONNECTION_BUTTON_ON_ICON_PATH = ':\\images\\connectionButtonOn.png'
     CONNECTION_BUTTON_OFF_ICON_PATH = ':\\images\\connectionButtonOff.png'
     STATUS_LABEL = 'Status: '
+    LINK_STATE_LABEL = {'connecting': 'reconnecting ...',
+                        'up': 'connected',
+                        'degraded': 'connected, write queue is full',
+                        'backoff': 'link lost, waiting for reconnection ...'}
     
     def __init__(self, parent = None):
         super().__init__(parent)
@@ -54,6 +60,7 @@ class ConnectionWidget(qtw.QGroupBox):
         self.connectionStatus = False
         self.emulationPath = qtc.QDir.currentPath()
         self.comPortList = utility.getComPortList()    
+        self.connectingWindow = None # shown until connector answers
     
     @property
     def connectionStatus(self):
@@ -177,7 +184,7 @@ class ConnectionWidget(qtw.QGroupBox):
         
     @qtc.pyqtSlot(bool)
     def _clickConnectionButton(self, state):      
-        _ConnectingWindow.show(self)        
+        self.connectingWindow = _ConnectingWindow.show(self)        
         if self.connectionStatus: # request for disconnection
             request = {'action': 'Disconnection'}
         else: # request for connection
@@ -191,14 +198,26 @@ class ConnectionWidget(qtw.QGroupBox):
     @qtc.pyqtSlot(bool)
     def changeConnectionStatus(self, conStatus):
         self.connectionStatus = conStatus
+        self._closeConnectingWindow()
+        
+    @qtc.pyqtSlot(str)
+    def showLinkState(self, state):
+        if self.connectionStatus and state in self.LINK_STATE_LABEL:
+            self.statusLabel.setText(self.STATUS_LABEL + self.LINK_STATE_LABEL[state])
         
     @qtc.pyqtSlot(str)
     def showError(self, text):
+        self._closeConnectingWindow()
         qtw.QMessageBox.warning(
             self,
             'Connection Error',
             text)
         
+    def _closeConnectingWindow(self):
+        if self.connectingWindow is not None:
+            self.connectingWindow.accept()
+            self.connectingWindow = None
+        
     def _openEmulationFile(self):
         fileName, _ = qtw.QFileDialog.getOpenFileName(
             self,
@@ -214,7 +233,7 @@ class ConnectionWidget(qtw.QGroupBox):
             
 class _ConnectingWindow(qtw.QDialog):
     
-    WAITING_TIME = 2 # in sec
+    WAITING_TIME = 2 # in sec, max showing time if answer of connector is late
 
     def __init__(self, parent = None):
         if parent is not None:
@@ -227,12 +246,12 @@ class _ConnectingWindow(qtw.QDialog):
         
     @staticmethod
     def show(parent = None):
+        ''' show window without blocking event loop, it is accepted after WAITING_TIME '''
         win = _ConnectingWindow(parent)
         win.setWindowFlags(qtc.Qt.FramelessWindowHint | qtc.Qt.Dialog)
         win.open()
-        qtw.QApplication.processEvents()
-        time.sleep(_ConnectingWindow.WAITING_TIME)
-        win.accept()
+        qtc.QTimer.singleShot(int(_ConnectingWindow.WAITING_TIME * 1000), win.accept)
+        return win
         
 # simple test
 if __name__ == '__main__':
@@ -16,30 +16,48 @@ DESCRIPTION:
             loadImage
             startImage
             clearImage
+            showInfo
+            showLog
+        signals:
+            infoRequested - polling every TIMER_INTERVAL during transfer
+            infoSubscribed - pushed info is wanted (True) or not (False), polling ticks are 
+                             ignored by connector while other side pushes info
+    
+    Received image blocks are shown by persistent preview, blank until block is received. 
+    Block to byte and row range map is made by loadImage, so info update copies only new blocks 
+    and PreviewWidget repaints only their rows.
+    
+    Preview update time vs image size, one new block per update:
+        python informationWidget.py benchmark
+    Preview test over bitmap and delta updates:
+        python informationWidget.py test
 """
 from PyQt5 import QtWidgets as qtw
 from PyQt5 import QtGui as qtg
 from PyQt5 import QtCore as qtc
 
-import matplotlib.pyplot as plt
-import matplotlib.image as mpimg
-from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
-
 import numpy as np
 import random
 
+import blockBitmap
+import previewWidget
+
 class InformationWidget(qtw.QGroupBox):
     
     infoRequested = qtc.pyqtSignal()
+    infoSubscribed = qtc.pyqtSignal(bool)
     
     WIDGET_TITLE = 'Information'
     TIMER_INTERVAL = 2.0
+    LOG_LINE_LIMIT = 1000 # oldest lines are removed from log tab
+    PREVIEW_BLANK = 255 # of bytes of blocks not received yet
     
     def __init__(self, parent = None):
         super().__init__(parent)
         
         self.progressValue = 0
-        self.art = None
+        self.imageSource = None
+        self.preview = None # shown after first block info, bytes of received blocks
         self.bytesSend = 0
         self.num = 1
         
@@ -56,23 +74,25 @@ class InformationWidget(qtw.QGroupBox):
             image = image[:, :, 0:3]
         self.imageSource = (image * np.iinfo(np.uint8).max).astype(np.uint8)
         
-        numBlock = np.ceil(self.imageSource.size * 8 / 288).astype(int)
-        imageCopy = self.imageSource.flatten()
-        imageCopy = np.unpackbits(imageCopy)
-        imageCopy.resize((numBlock, 288))
-        self.imageCopy = imageCopy.T
-            
-        self.ax = self.fig.add_axes([0, 0, 1, 1])
-        self.ax.axis('off')
-        self.art = self.ax.imshow(self.imageSource, interpolation = None)
-        self.canvas.draw()
+        # block to byte offset and rows of image
+        self.blockCount = blockBitmap.blockCount(self.imageSource.size)
+        rowSize = self.imageSource[0].size
+        self.blockOffset = np.minimum(np.arange(self.blockCount + 1) * (blockBitmap.BLOCK_BITS // 8), 
+                                      self.imageSource.size)
+        self.blockRowStart = self.blockOffset[:-1] // rowSize
+        self.blockRowEnd = -(-self.blockOffset[1:] // rowSize)
+        self.held = np.zeros(self.blockCount, dtype = bool)
+        self.preview = None
+        self.previewWidget.setImage(self.imageSource)
     
     @qtc.pyqtSlot()
     def startImage(self):
+        self.infoSubscribed.emit(True)
         self.timer.start()
     
     @qtc.pyqtSlot()
     def clearImage(self):      
+        self.infoSubscribed.emit(False)
         self.timer.stop()
         
         self.bytesSend = 0
@@ -91,14 +111,14 @@ class InformationWidget(qtw.QGroupBox):
         self.log = qtw.QTextEdit()
         self.log.setReadOnly(True)
         self.log.setCurrentFont(monospaceFont) 
+        self.log.document().setMaximumBlockCount(self.LOG_LINE_LIMIT)
         self.tab = qtw.QTabWidget()
         self.tab.addTab(self.stat, 'Statistics')
         self.tab.addTab(self.log, 'Log')
         self.tab.setMinimumWidth(750)
         self.tab.setSizePolicy(qtw.QSizePolicy.Preferred, qtw.QSizePolicy.Maximum)
 
-        self.fig = plt.figure()
-        self.canvas = FigureCanvas(self.fig)
+        self.previewWidget = previewWidget.PreviewWidget()
         self.progress = qtw.QProgressBar()
         self.progress.setRange(0, 100)
         self.progress.setValue(self.progressValue)
@@ -107,6 +127,7 @@ class InformationWidget(qtw.QGroupBox):
         self.dataRate = qtw.QLabel('Bitrate: 0 bit/s')
         self.dataBer = qtw.QLabel('BER: 0.0')
         self.dataBler = qtw.QLabel('BLER: 0.0')
+        self.dataWire = qtw.QLabel('Interface: 0 / 0 bit/s') # measured by interface, out / in
         self.dataWidget = qtw.QWidget()        
         self.dataWidget.setSizePolicy(qtw.QSizePolicy.Preferred, qtw.QSizePolicy.Maximum)
         self.dataWidget.setLayout(qtw.QGridLayout())
@@ -115,13 +136,18 @@ class InformationWidget(qtw.QGroupBox):
         self.dataWidget.layout().addWidget(self.dataRate, 1, 0)
         self.dataWidget.layout().addWidget(self.dataBer, 0, 1)
         self.dataWidget.layout().addWidget(self.dataBler, 1, 1)
+        self.dataWidget.layout().addWidget(self.dataWire, 2, 0)
         
         self.setLayout(qtw.QVBoxLayout())
         self.layout().addWidget(self.tab)
-        self.layout().addWidget(self.canvas)
+        self.layout().addWidget(self.previewWidget)
         self.layout().addWidget(self.progress)
         self.layout().addWidget(self.dataWidget)
         
+    @qtc.pyqtSlot(str)
+    def showLog(self, lines):
+        self.log.append(lines)
+        
     @qtc.pyqtSlot(dict)
     def showInfo(self, info):
         for key, value in info.items():
@@ -133,25 +159,49 @@ class InformationWidget(qtw.QGroupBox):
                 self.dataBer.setText('BER: {0:.2e}'.format(value))
             elif key == 'bler':
                 self.dataBler.setText('BLER: {0:.2e}'.format(value))
+            elif key == 'wirerate':
+                self.dataWire.setText('Interface: {0:.0f} / {1:.0f} bit/s'.format(*value))
             elif key == 'stat':        
                 self.stat.insertPlainText(value)
                 self.statCursor.movePosition(qtg.QTextCursor.End)
                 self.stat.setTextCursor(self.statCursor)
-            elif key == 'imbl':         
-                idx = np.unpackbits(value).astype(np.bool)  
-                idx = idx[:self.imageCopy.shape[1]]   
-                print(f'size = {idx.size}, {idx}')
-                
-                imageSink = np.full_like(self.imageCopy, np.iinfo(np.uint8).max)
-                imageSink[:, idx] = self.imageCopy[:, idx]              
-                imageSink = imageSink.T.flatten()
-                imageSink = np.packbits(imageSink)
-                imageSink.resize(self.imageSource.shape)         
-                
-                self.art.set_data(imageSink)
-                self.canvas.draw()
+            elif key == 'imbl': # whole bitmap
+                if self.imageSource is not None:
+                    held = np.unpackbits(value, count = self.blockCount).astype(bool)
+                    reset = bool(np.any(self.held & ~held)) # preview is blanked, so all held blocks are shown
+                    self._showBlocks(blockBitmap.findRanges(held if reset else held & ~self.held), reset)
+            elif key == 'imblDelta': # (reset, ranges of new blocks)
+                if self.imageSource is not None:
+                    self._showBlocks(value[1], value[0])
             else:
                 raise NameError        
+                
+    def _showBlocks(self, ranges: np.ndarray, reset: bool):
+        ''' copy new blocks to preview and repaint their rows, preview is blanked on reset '''
+        full = reset or self.preview is None
+        if self.preview is None:
+            self.preview = np.full_like(self.imageSource, self.PREVIEW_BLANK)
+            self.previewWidget.setImage(self.preview) # patched in place
+        elif reset:
+            self.preview[...] = self.PREVIEW_BLANK
+        if reset:
+            self.held[:] = False
+        source = self.imageSource.reshape(-1)
+        preview = self.preview.reshape(-1)
+        rowStart, rowEnd = self.imageSource.shape[0], 0
+        for first, count in ranges.tolist():
+            end = min(first + count, self.blockCount)
+            if end <= first:
+                continue
+            offset, offsetEnd = self.blockOffset[first], self.blockOffset[end]
+            preview[offset:offsetEnd] = source[offset:offsetEnd]
+            self.held[first:end] = True
+            rowStart = min(rowStart, self.blockRowStart[first])
+            rowEnd = max(rowEnd, self.blockRowEnd[end - 1])
+        if full:
+            self.previewWidget.update()
+        elif rowEnd > rowStart:
+            self.previewWidget.updateRows(int(rowStart), int(rowEnd))
         
     '''
     def _stepImage(self):
@@ -189,7 +239,88 @@ class InformationWidget(qtw.QGroupBox):
         self.num += 1
     '''
 
+def testPreview():
+    ''' preview holds exactly blocks of updates by whole bitmaps and deltas, also over reset '''
+    app = qtw.QApplication.instance() or qtw.QApplication([])
+    widget = InformationWidget()
+    widget.loadImage(np.random.default_rng(1).random((37, 53, 3)))
+    count = widget.blockCount
+    
+    def check(held):
+        expected = np.full(widget.imageSource.size, widget.PREVIEW_BLANK, dtype = np.uint8)
+        for first, end in zip(widget.blockOffset[:-1][held], widget.blockOffset[1:][held]):
+            expected[first:end] = widget.imageSource.reshape(-1)[first:end]
+        assert np.array_equal(widget.preview.reshape(-1), expected) and np.array_equal(widget.held, held)
+        assert widget.previewWidget.buffer is widget.preview
+        
+    held = np.zeros(count, dtype = bool)
+    held[[0, 1, 5, count - 1]] = True
+    widget.showInfo({'imblDelta': (True, blockBitmap.findRanges(held))})
+    check(held)
+    held[10:20] = True
+    widget.showInfo({'imblDelta': (False, blockBitmap.findRanges(held & ~widget.held))})
+    check(held)
+    held[30] = True
+    widget.showInfo({'imbl': np.packbits(held)})
+    check(held)
+    # reset by bitmap without block 0, blocks 5 and 30 are held before and after it
+    held[[0, 1, 12]] = False
+    held[40] = True
+    widget.showInfo({'imbl': np.packbits(held)})
+    check(held)
+    widget.loadImage(np.random.default_rng(2).random((20, 20, 3)))
+    assert widget.preview is None and not np.any(widget.held)
+    print('preview test passed')
+    
+def benchmarkPreview(updateCount = 20):
+    ''' time of info update with one new block and its repaint: full rebuild of preview vs patch '''
+    import time
+    
+    app = qtw.QApplication([])
+    widget = InformationWidget()
+    widget.resize(800, 900)
+    widget.show()
+    rng = np.random.default_rng(1)
+    for size in (100, 400, 1600):
+        widget.loadImage(rng.random((size, size, 3)))
+        app.processEvents()
+        order = rng.permutation(widget.blockCount)
+        
+        # full rebuild of preview and repaint per update
+        bits = np.unpackbits(widget.imageSource.reshape(-1))
+        bits.resize((widget.blockCount, blockBitmap.BLOCK_BITS))
+        imageCopy = bits.T
+        held = np.zeros(widget.blockCount, dtype = bool)
+        start = time.perf_counter()
+        for block in order[:updateCount]:
+            held[block] = True
+            value = np.packbits(held)
+            idx = np.unpackbits(value).astype(bool)[:imageCopy.shape[1]]
+            imageSink = np.full_like(imageCopy, np.iinfo(np.uint8).max)
+            imageSink[:, idx] = imageCopy[:, idx]
+            imageSink = np.packbits(imageSink.T.flatten())
+            imageSink.resize(widget.imageSource.shape)
+            widget.previewWidget.setImage(imageSink)
+            app.processEvents()
+        fullTime = (time.perf_counter() - start) / updateCount
+        
+        widget.showInfo({'imblDelta': (True, blockBitmap.findRanges(np.zeros(0, dtype = bool)))})
+        start = time.perf_counter()
+        for block in order[:updateCount]:
+            ranges = np.array([(block, 1)], dtype = blockBitmap.RANGE)
+            widget.showInfo({'imblDelta': (False, ranges)})
+            app.processEvents()
+        patchTime = (time.perf_counter() - start) / updateCount
+        print('{:>4d} x {:<4d}: {:>6d} blocks, full rebuild {:7.2f} ms, preview patch {:5.2f} ms'.\
+              format(size, size, widget.blockCount, fullTime * 1e3, patchTime * 1e3))
+
 # simple test
 if __name__ == '__main__':
-    import utility    
-    utility.runManualTest(InformationWidget)
\ No newline at end of file
+    import sys
+    if sys.argv[1:] == ['benchmark']:
+        benchmarkPreview()
+    elif sys.argv[1:] == ['test']:
+        testPreview()
+    else:
+        import utility    
+        utility.runManualTest(InformationWidget)
\ No newline at end of file
@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+"""
+HISTORY:
+    Created on Sun Oct 18 11:42:10 2026
+
+Project: Vortex GUI
+
+Author: DIVE-LINK (www.dive-link.net), dive-link@mail.ru
+        Shustov Aleksey (SemperAnte), semte@semte.ru
+
+TODO:
+
+DESCRIPTION:
+    AsyncTcpServer and AsyncTcpClient, asyncio flavour of interfaceTcp.
+    Received bytes are fed to CommandProcessor directly from data_received,
+    so readers get whole commands instead of raw packets.
+
+    AsyncTcpServer available public methods:
+        - setAddress
+        - setCommandHandler
+        - open (coroutine)
+        - isOpened
+        - hasConnection
+        - write
+        - readCommand (coroutine)
+        - close
+
+    AsyncTcpClient available public methods:
+        - setAddress
+        - setCommandHandler
+        - open (coroutine)
+        - isOpened
+        - write
+        - readCommand (coroutine)
+        - close
+"""
+import abc
+import asyncio
+
+import commandProcessor
+from interfaceTcp import TcpAbc, TcpRole, TcpLogger, TcpLogLevel
+
+class AsyncTcpProtocol(asyncio.Protocol):
+
+    def __init__(self, owner):
+        self.owner = owner
+        self.transport = None
+        self.commandProcessor = commandProcessor.CommandProcessor()
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.owner._attach(self)
+
+    def data_received(self, data):
+        for command in self.commandProcessor.process(data):
+            self.owner._commandReceived(command)
+
+    def connection_lost(self, exc):
+        self.owner._detach(self)
+
+class AsyncTcpAbc(abc.ABC):
+
+    DEFAULT_IP = TcpAbc.DEFAULT_IP
+    DEFAULT_PORT = TcpAbc.DEFAULT_PORT
+
+    ERROR_ALREADY_OPEN = TcpAbc.ERROR_ALREADY_OPEN
+    ERROR_WRITE_CLOSE = TcpAbc.ERROR_WRITE_CLOSE
+    ERROR_READ_CLOSE = TcpAbc.ERROR_READ_CLOSE
+
+    @abc.abstractmethod
+    def __init__(self, role: TcpRole):
+        self.role = role
+        self.logger = TcpLogger(self)
+
+        self.ip = self.DEFAULT_IP
+        self.port = self.DEFAULT_PORT
+
+        self.protocol = None
+        self.commandHandler = None
+        self.commandQueue = asyncio.Queue()
+
+    def setAddress(self, ip: str, port: int):
+        ''' use for setting ip address and port berfore opening '''
+        if not self.isOpened():
+            self.ip = ip
+            self.port = port
+        else:
+            self._raiseError(self.ERROR_ALREADY_OPEN)
+
+    def setCommandHandler(self, handler):
+        ''' handler(command: bytes) is called from data_received for every found command,
+            otherwise commands are queued for readCommand '''
+        self.commandHandler = handler
+
+    @abc.abstractmethod
+    async def open(self):
+        if self.isOpened():
+            self._raiseError(self.ERROR_ALREADY_OPEN)
+        while not self.commandQueue.empty():
+            self.commandQueue.get_nowait()
+
+    @abc.abstractmethod
+    def isOpened(self):
+        pass
+
+    def hasConnection(self):
+        return self.protocol is not None
+
+    def write(self, *data: bytearray):
+        if self.isOpened():
+            if self.hasConnection():
+                self.protocol.transport.writelines(data)
+        else:
+            self._raiseError(self.ERROR_WRITE_CLOSE)
+
+    async def readCommand(self, timeout: float = 0) -> bytes:
+        ''' wait for next command, return b'' on timeout '''
+        if self.isOpened():
+            try:
+                if timeout > 0:
+                    return await asyncio.wait_for(self.commandQueue.get(), timeout)
+                else:
+                    return self.commandQueue.get_nowait()
+            except (asyncio.TimeoutError, asyncio.QueueEmpty):
+                return b''
+        else:
+            self._raiseError(self.ERROR_READ_CLOSE)
+
+    def close(self):
+        if self.hasConnection():
+            self.protocol.transport.close()
+            self.protocol = None
+
+    def _attach(self, protocol: AsyncTcpProtocol):
+        self.protocol = protocol
+
+    def _detach(self, protocol: AsyncTcpProtocol):
+        if self.protocol is protocol:
+            self.logger.log('other side closed connection.', TcpLogLevel.INFO)
+            self.protocol = None
+
+    def _commandReceived(self, command: bytes):
+        if self.commandHandler is not None:
+            self.commandHandler(command)
+        else:
+            self.commandQueue.put_nowait(command)
+
+    def _raiseError(self, err: Exception):
+        self.logger.log(str(err), TcpLogLevel.ERROR)
+        raise err
+
+class AsyncTcpServer(AsyncTcpAbc):
+
+    def __init__(self):
+        super().__init__(TcpRole.SERVER)
+        self.server = None
+
+    async def open(self):
+        await super().open()
+        loop = asyncio.get_running_loop()
+        self.server = await loop.create_server(lambda: AsyncTcpProtocol(self),
+                                               self.ip, self.port, reuse_address = True)
+        self.logger.log('opened.', TcpLogLevel.INFO)
+
+    def isOpened(self):
+        return self.server is not None
+
+    def close(self):
+        super().close()
+        if self.isOpened():
+            self.server.close()
+            self.server = None
+            self.logger.log('closed.', TcpLogLevel.INFO)
+
+    def _attach(self, protocol: AsyncTcpProtocol):
+        if self.hasConnection(): # max connection limit to one
+            protocol.transport.close()
+        else:
+            self.logger.log('accepted connection from {}.'.\
+                            format(protocol.transport.get_extra_info('peername')), TcpLogLevel.INFO)
+            super()._attach(protocol)
+
+class AsyncTcpClient(AsyncTcpAbc):
+
+    def __init__(self):
+        super().__init__(TcpRole.CLIENT)
+
+    async def open(self):
+        await super().open()
+        loop = asyncio.get_running_loop()
+        await loop.create_connection(lambda: AsyncTcpProtocol(self), self.ip, self.port)
+        self.logger.log('opened.', TcpLogLevel.INFO)
+
+    def isOpened(self):
+        return self.hasConnection()
+
+    def close(self):
+        if self.isOpened():
+            super().close()
+            self.logger.log('closed.', TcpLogLevel.INFO)
+
+if __name__ == '__main__':
+
+    async def main():
+        server = AsyncTcpServer()
+        server.setAddress('localhost', 10205)
+        server.setCommandHandler(lambda command: server.write(command))
+        await server.open()
+
+        client = AsyncTcpClient()
+        client.setAddress('localhost', 10205)
+        await client.open()
+        client.write(b'VX!RATE 1/2\nVX!DATA 5 12345\n')
+        print(await client.readCommand(1.0))
+        print(await client.readCommand(1.0))
+
+        client.close()
+        server.close()
+
+    asyncio.run(main())
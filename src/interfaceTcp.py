@@ -6,50 +6,172 @@ Created on Sat Feb 27 12:16:32 2020
 
 TcpServer and TcpClient socket classes running in separated thread.
 
+Two I/O engines are available (see TcpEngine):
+    - THREAD: every connection runs own read and write service threads
+    - SELECTOR: all connections are multiplexed by one shared TcpSelectorLoop thread,
+                which is woken immediately on write and close through a self-pipe
+
+Received data is stored either in queue of received packets (default) or, 
+after setReadMode(ringBuffer = True), in RingBuffer filled by recv_into without 
+allocating object per packet. In ring buffer mode peek/consume give zero-copy access.
+
+Buffered reader methods readUntil, readExactly and readCommand (whole commands found 
+by CommandProcessor) reassemble responses split into several packets, they wait 
+up to timeout for all data and leave partial data buffered on timeout. 
+Don't mix readCommand with other read methods, it keeps partial command inside CommandProcessor.
+readFrame returns command as CommandFrame (payload memoryview into CommandProcessor buffer),
+so VX!DATA payloads can reach numpy arrays with one copy at most.
+
+TcpMultiServer serves several clients at once on selector engine: every write is fanned out 
+to all clients through per-client write queues, received commands of all clients are queued 
+whole (or passed to command handler), so read methods never see commands of two clients mixed.
+
+Write queue can be bounded by setWriteWatermark: when high watermark of pending bytes is reached, 
+write blocks (writeAsync awaits, tryWrite refuses) until queue drains down to low watermark.
+TcpMultiServer applies watermarks to the slowest client, its write doesn't block in loop thread.
+
+Connection state (see TcpState) is reported to callback set by setStateCallback.
+After setReconnect(True) TcpClient reconnects on link drop with jittered exponential backoff,
+it stays opened meanwhile and keeps data written during reconnection for new link.
+
+Logging (TcpLogger) only records messages into ring buffer on I/O threads, one TcpLogDrain thread 
+formats them and passes batches to sinks: stdout by default, TcpLogFile or any callable(lines).
+At DEBUG level every sent and received VX command is traced.
+
+Sockets are set to TCP_NODELAY (NO_DELAY), so pipelined commands and their replies are not delayed.
+
+stats() returns snapshot of per-connection counters (see STATS_COUNTER), queue depths 
+and throughput estimated over last THROUGHPUT_WINDOW seconds.
+
+Command readers keep bounded memory on corrupted stream: CommandProcessor drops commands above
+limits of setCommandLimit and resynchronises on next VX! or VX? prefix, drops are counted in stats().
+Payload of variable length command can be streamed by setPayloadSink to callback or writable buffer
+as it arrives, command readers then return the command with empty payload.
+
 TcpServer available public methods:
     - setAddress
+    - setReadMode
+    - setCommandLimit
+    - setPayloadSink
+    - setWriteWatermark
+    - setWatermarkCallback
+    - setStateCallback
     - setEcho
     - open
     - isOpened
     - hasConnection
     - write
+    - tryWrite
+    - writeAsync (coroutine)
+    - bytesPending
+    - stats
     - read
+    - readUntil
+    - readExactly
+    - readCommand
+    - readFrame
+    - peek
+    - consume
     - close
     
 TcpClient available public methods:
     - setAddress
+    - setReadMode
+    - setCommandLimit
+    - setPayloadSink
+    - setWriteWatermark
+    - setWatermarkCallback
+    - setStateCallback
+    - setReconnect
     - open
     - isOpened
     - write
+    - tryWrite
+    - writeAsync (coroutine)
+    - bytesPending
+    - stats
     - read
+    - readUntil
+    - readExactly
+    - readCommand
+    - readFrame
+    - peek
+    - consume
     - close
+    
+TcpMultiServer available public methods (in addition to TcpServer ones):
+    - setCommandHandler
+    - clientCount
+    - writeTo
 """
 import abc
+import asyncio
+import atexit
+import collections
 import enum
+import errno
+import heapq
+import os
 import queue
+import random
+import selectors
 import threading
 import time
 import socket
+import sys
 import weakref
 
+import commandProcessor
+
 class TcpRole(enum.Enum):    
     SERVER = 0
     CLIENT = 1
+    
+class TcpEngine(enum.Enum):
+    THREAD = 0      # two blocking service threads per connection
+    SELECTOR = 1    # one shared non-blocking event loop for all connections
+    
+class TcpState(enum.Enum):
+    CLOSED = 0      # not opened
+    CONNECTING = 1  # client connects to server, server waits for client
+    UP = 2          # connected
+    DEGRADED = 3    # connected, but write queue is above high watermark
+    BACKOFF = 4     # link is lost, client waits before next reconnect attempt
 
 class TcpAbc(abc.ABC):
     
     DEFAULT_IP = 'localhost'
     DEFAULT_PORT = 10204
-    PACKET_SIZE = 2 ** 10   # how much bytes connection send or receive for one network operation
+    PACKET_SIZE = 2 ** 10   # default of how much bytes connection receive for one network operation
+    RING_BUFFER_SIZE = 2 ** 16  # initial size of ring buffer, it grows when full
+    RING_READ_SIZE = 2 ** 14    # default of how much bytes connection receive to ring buffer at once
+    SEND_BUFFER_LIMIT = 64  # max number of buffers gathered by one sendmsg call
     TIMEOUT_LIMIT = 1.0     # in seconds, timeout for all blocking operations
+    DEFAULT_ENGINE = TcpEngine.THREAD
+    WRITE_HIGH_WATERMARK = None # in bytes, None for unbounded write queue
+    RECONNECT_DELAY_MIN = 0.05  # in seconds, first reconnect attempt is immediate, next ones double delay
+    RECONNECT_DELAY_MAX = 5.0
+    THROUGHPUT_WINDOW = 5.0     # in seconds, for rate estimation of stats()
+    NO_DELAY = True # TCP_NODELAY, so replies to pipelined commands are not held back by Nagle algorithm
+    
+    STATS_COUNTER = ('bytesIn', 'bytesOut',       # bytes received and sent by socket
+                     'messagesIn', 'messagesOut', # commands read and write calls
+                     'recvCalls', 'sendCalls', 'partialSends',
+                     'timeouts',                  # of buffered readers and write
+                     'reconnects',
+                     'blockedTime',               # in seconds, spent by write waiting for drain
+                     *commandProcessor.CommandProcessor.DROP_COUNTER) # of corrupted received stream
     
     ERROR_ALREADY_OPEN = IOError('connection is already opened.')
     ERROR_WRITE_CLOSE = IOError('attempt to write to closed connection.')
     ERROR_READ_CLOSE = IOError('attempt to write to closed connection.')
+    ERROR_NO_RING_BUFFER = IOError('ring buffer read mode is not enabled.')
+    ERROR_WRITE_TIMEOUT = IOError('timeout of waiting for write queue to drain.')
 
     @abc.abstractmethod
-    def __init__(self, role: TcpRole):
+    def __init__(self, role: TcpRole, engine: TcpEngine = None):
         self.role = role
+        self.engine = engine if engine is not None else self.DEFAULT_ENGINE
         self.logger = TcpLogger(self)
         
         self.ip = self.DEFAULT_IP
@@ -57,6 +179,15 @@ class TcpAbc(abc.ABC):
         
         self.bufRead = queue.Queue()
         self.bufWrite = queue.Queue()
+        self.readSize = self.PACKET_SIZE
+        self.ringMode = False
+        self.ring = None
+        self.readPending = bytearray() # data taken from bufRead but not read yet by buffered reader
+        self.commandLimit = None # None for CommandProcessor defaults
+        self.payloadLimit = None
+        self.payloadSink = {} # prefix: sink for streamed payloads
+        self.commandProcessor = None # created on opening
+        self.commandFound = collections.deque()
         
         self.threadWrite = None
         self.threadRead = None
@@ -65,6 +196,27 @@ class TcpAbc(abc.ABC):
         self.lockWrite = threading.Lock()
         self.lockRead = threading.Lock()
         
+        self.loop = None # TcpSelectorLoop for selector engine
+        self.sendPending = [] # memoryviews of partially sent data for selector engine
+        
+        self.writeHigh = self.WRITE_HIGH_WATERMARK
+        self.writeLow = None
+        self.writePending = 0 # queued but not sent bytes
+        self.writeThrottled = False # high watermark was reached and low one is not yet
+        self.writeCond = threading.Condition()
+        self.watermarkCallback = None
+        self.drainWaiter = [] # (event loop, future) of writeAsync calls
+        
+        self.counter = collections.Counter(dict.fromkeys(self.STATS_COUNTER, 0))
+        self.rateSample = collections.deque() # (time, bytesIn, bytesOut) of stats() calls
+        
+        self.state = TcpState.CLOSED
+        self.stateCallback = None
+        self.reconnect = False
+        self.reconnectAttempt = 0
+        self.readReset = False # link was reestablished, reader must drop partial command of lost link
+        self.lockState = threading.Lock() # replacing of sockets by thread engine on link drop
+        
         self.sock = None
         
     def setAddress(self, ip: str, port: int):
@@ -74,6 +226,82 @@ class TcpAbc(abc.ABC):
             self.port = port
         else:
             raise self._raiseError(self.ERROR_ALREADY_OPEN)
+            
+    def setReadMode(self, ringBuffer: bool, readSize: int = None):
+        ''' use before opening, ringBuffer selects receiving with recv_into to RingBuffer 
+            instead of queue of packets, readSize is max bytes for one receive operation '''
+        if not self.isOpened():
+            self.ringMode = ringBuffer
+            if readSize is None:
+                readSize = self.RING_READ_SIZE if ringBuffer else self.PACKET_SIZE
+            self.readSize = readSize
+        else:
+            raise self._raiseError(self.ERROR_ALREADY_OPEN)
+    
+    def setWriteWatermark(self, high: int, low: int = None):
+        ''' bound write queue to high pending bytes, writers wait until queue drains 
+            down to low (high / 4 by default), None high makes queue unbounded '''
+        with self.writeCond:
+            self.writeHigh = high
+            self.writeLow = low if low is not None or high is None else high // 4
+        self._writeDone(0)
+            
+    def setCommandLimit(self, commandSize: int = None, payloadSize: int = None):
+        ''' use before opening, max bytes of fixed length command (or variable length header) and 
+            of variable length payload kept by command readers, None for CommandProcessor defaults '''
+        if not self.isOpened():
+            self.commandLimit = commandSize
+            self.payloadLimit = payloadSize
+        else:
+            raise self._raiseError(self.ERROR_ALREADY_OPEN)
+    
+    def setPayloadSink(self, prefix: bytes, sink):
+        ''' use before opening, payload of variable length command with prefix (e.g. b'VX!DATA') is 
+            streamed to sink as it arrives: callable(chunk: memoryview) called from reading thread,
+            or writable buffer (wrapped to commandProcessor.PayloadBuffer). None removes sink. Return sink. '''
+        if not self.isOpened():
+            if prefix not in commandProcessor.CommandProcessor.COMMAND_VARIABLE_PREFIX:
+                raise ValueError('{!r} is not variable length command.'.format(prefix))
+            if sink is None:
+                self.payloadSink.pop(prefix, None)
+            else:
+                if not callable(sink):
+                    sink = commandProcessor.PayloadBuffer(sink)
+                self.payloadSink[prefix] = sink
+            return sink
+        else:
+            raise self._raiseError(self.ERROR_ALREADY_OPEN)
+    
+    def setWatermarkCallback(self, callback):
+        ''' callback(throttled: bool, pending: int) is called from writing or I/O thread 
+            when pending bytes cross high or low watermark '''
+        self.watermarkCallback = callback
+        
+    def bytesPending(self) -> int:
+        ''' bytes queued for writing but not sent yet '''
+        return self.writePending
+    
+    def stats(self) -> dict:
+        ''' snapshot of counters, queue depths, state and rateIn/rateOut in bytes/s '''
+        stats = dict(self.counter)
+        now = time.monotonic()
+        self.rateSample.append((now, stats['bytesIn'], stats['bytesOut']))
+        while len(self.rateSample) > 2 and self.rateSample[1][0] <= now - self.THROUGHPUT_WINDOW:
+            self.rateSample.popleft()
+        start, bytesIn, bytesOut = self.rateSample[0]
+        duration = now - start
+        stats['rateIn'] = (stats['bytesIn'] - bytesIn) / duration if duration > 0 else 0.0
+        stats['rateOut'] = (stats['bytesOut'] - bytesOut) / duration if duration > 0 else 0.0
+        stats['writeQueue'] = self.bufWrite.qsize()
+        stats['writePending'] = self.bytesPending()
+        stats['readQueue'] = self.bufRead.qsize()
+        stats['readBuffered'] = len(self.ring) if self.ring is not None else len(self.readPending)
+        stats['state'] = self.state.name.lower()
+        return stats
+    
+    def setStateCallback(self, callback):
+        ''' callback(state: TcpState) is called from I/O or calling thread on every state change '''
+        self.stateCallback = callback
     
     @abc.abstractmethod
     def open(self):
@@ -82,29 +310,90 @@ class TcpAbc(abc.ABC):
                 self.bufRead.get_nowait()
             while not self.bufWrite.empty():
                 self.bufWrite.get_nowait()
+            self.ring = RingBuffer(max(self.RING_BUFFER_SIZE, 4 * self.readSize)) if self.ringMode else None
+            self.readPending = bytearray()
+            self.commandFound.clear()
                 
             self.threadFinish = False
-            self.threadWrite = threading.Thread(target = self._serviceWrite)
-            self.threadRead = threading.Thread(target = self._serviceRead)
+            if self.engine == TcpEngine.THREAD:
+                self.threadWrite = threading.Thread(target = self._serviceWrite)
+                self.threadRead = threading.Thread(target = self._serviceRead)
+            self.sendPending = []
+            self._resetWritePending()
+            self.counter = collections.Counter(dict.fromkeys(self.STATS_COUNTER, 0))
+            self.rateSample = collections.deque([(time.monotonic(), 0, 0)])
+            self.commandProcessor = self._newCommandProcessor()
             
             self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)            
             self.sock.settimeout(self.TIMEOUT_LIMIT)
+            self._setNoDelay(self.sock)
             self.logger.log('opened.', TcpLogLevel.INFO)
+            self.reconnectAttempt = 0
+            self._setState(TcpState.CONNECTING)
         else:
             raise self._raiseError(self.ERROR_ALREADY_OPEN)
         
     def isOpened(self):
         return self.sock is not None
     
-    def write(self, data: bytearray):
+    def write(self, *data: bytearray, timeout: float = None):
+        ''' queue one or more bytes-like buffers (e.g. command header and numpy payload) for sending.
+            Buffers are not copied or concatenated, so they must not be changed until sent.
+            Above high watermark wait for drain up to timeout (forever for None). '''
         if self.isOpened():    
-            for packet in self._splitToPacket(data):
-                self.bufWrite.put_nowait(packet)
+            buffers = self._toBuffers(data)
+            if buffers:
+                with self.writeCond:
+                    if self.writeThrottled:
+                        start = time.monotonic()
+                        drained = self.writeCond.wait_for(lambda: not self.writeThrottled or not self.isOpened(), 
+                                                          timeout)
+                        self.counter['blockedTime'] += time.monotonic() - start
+                        if not drained:
+                            self.counter['timeouts'] += 1
+                            self._raiseError(self.ERROR_WRITE_TIMEOUT)
+                if not self.isOpened():
+                    self._raiseError(self.ERROR_WRITE_CLOSE)
+                self._queueWrite(buffers)
+        else:
+            self._raiseError(self.ERROR_WRITE_CLOSE)
+            
+    def tryWrite(self, *data: bytearray) -> bool:
+        ''' queue data only if write queue is below high watermark, return False otherwise '''
+        if self.isOpened():
+            if self.writeThrottled:
+                return False
+            buffers = self._toBuffers(data)
+            if buffers:
+                self._queueWrite(buffers)
+            return True
         else:
             self._raiseError(self.ERROR_WRITE_CLOSE)
             
+    async def writeAsync(self, *data: bytearray):
+        ''' write waiting for drain of write queue without blocking asyncio event loop '''
+        while self.writeThrottled and self.isOpened():
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            with self.writeCond:
+                if not self.writeThrottled:
+                    break
+                self.drainWaiter.append((loop, future))
+            start = time.monotonic()
+            await future
+            self.counter['blockedTime'] += time.monotonic() - start
+        self.write(*data, timeout = 0)
+            
     def read(self, timeout: float = 0) -> bytearray:
         if self.isOpened():
+            if self.ring is not None:
+                data = bytes(self.peek(timeout))
+                self.ring.consume(len(data))
+                return data
+            if self.readPending:
+                data = bytes(self.readPending)
+                self.readPending.clear()
+                return data
             try:
                 if timeout > 0:
                     data = self.bufRead.get(True, timeout)
@@ -117,24 +406,290 @@ class TcpAbc(abc.ABC):
         else:
             self._raiseError(self.ERROR_READ_CLOSE)
             
+    def readUntil(self, separator: bytes = b'\n', timeout: float = 0) -> bytes:
+        ''' read bytes up to and including separator, b'' on timeout '''
+        if not self.isOpened():
+            self._raiseError(self.ERROR_READ_CLOSE)
+        deadline = time.monotonic() + timeout
+        start = 0
+        while True:
+            idx = self._bufferedFind(separator, start)
+            if idx != -1:
+                return self._bufferedTake(idx + len(separator))
+            size = self._bufferedSize()
+            start = max(0, size - len(separator) + 1)
+            if not self._bufferedWait(size, deadline):
+                return self._readTimeout(timeout)
+            
+    def readExactly(self, numByte: int, timeout: float = 0) -> bytes:
+        ''' read exactly numByte bytes, b'' on timeout '''
+        if not self.isOpened():
+            self._raiseError(self.ERROR_READ_CLOSE)
+        deadline = time.monotonic() + timeout
+        while True:
+            size = self._bufferedSize()
+            if size >= numByte:
+                return self._bufferedTake(numByte)
+            if not self._bufferedWait(size, deadline):
+                return self._readTimeout(timeout)
+            
+    def readCommand(self, timeout: float = 0) -> bytes:
+        ''' read next whole command found by CommandProcessor, b'' on timeout '''
+        command = self._nextCommand(timeout, False)
+        return bytes(command) if isinstance(command, commandProcessor.CommandFrame) else command
+    
+    def readFrame(self, timeout: float = 0) -> commandProcessor.CommandFrame:
+        ''' read next command as CommandFrame pointing into receive buffer without copying, None on timeout.
+            Frame is valid until next readFrame or readCommand call. '''
+        command = self._nextCommand(timeout, True)
+        if not command:
+            return None
+        elif isinstance(command, commandProcessor.CommandFrame):
+            return command
+        else: # queued by readCommand, parsed and streamed already, so reparsed without payload sinks and counters
+            return commandProcessor.CommandProcessor(self.commandLimit, self.payloadLimit).processFrame(command)[0]
+    
+    def _nextCommand(self, timeout: float, frame: bool):
+        if not self.isOpened():
+            self._raiseError(self.ERROR_READ_CLOSE)
+        deadline = time.monotonic() + timeout
+        if self.readReset:
+            self.readReset = False
+            self.commandProcessor = self._newCommandProcessor()
+        process = self.commandProcessor.processFrame if frame else self.commandProcessor.process
+        while not self.commandFound:
+            size = self._bufferedSize()
+            if size:
+                if self.ring is not None:
+                    self.commandFound.extend(process(self.ring.peek(size)))
+                    self.ring.consume(size)
+                else:
+                    self.commandFound.extend(process(self.readPending))
+                    self.readPending.clear()
+            elif not self._bufferedWait(0, deadline):
+                return self._readTimeout(timeout)
+        command = self.commandFound.popleft()
+        self.counter['messagesIn'] += 1
+        if self.logger.isEnabledFor(TcpLogLevel.DEBUG):
+            self.logger.log('received {!r:.80}', TcpLogLevel.DEBUG, bytes(command[:80]))
+        return command
+        
+    def peek(self, timeout: float = 0) -> memoryview:
+        ''' zero-copy view of all received bytes in ring buffer mode, empty on timeout.
+            View stays valid until consume() is called. '''
+        if self.ring is None:
+            self._raiseError(self.ERROR_NO_RING_BUFFER)
+        if self.isOpened():
+            self.ring.wait(timeout)
+            return self.ring.peek()
+        else:
+            self._raiseError(self.ERROR_READ_CLOSE)
+            
+    def consume(self, numByte: int):
+        ''' remove numByte processed bytes from ring buffer '''
+        if self.ring is None:
+            self._raiseError(self.ERROR_NO_RING_BUFFER)
+        self.ring.consume(numByte)
+            
     def close(self):
-        self.threadFinish = True
-        with self.lockRead, self.lockWrite:        
-            if self.isOpened():            
-                self.sock.close()
-                self.sock = None
-                self.logger.log('closed.', TcpLogLevel.INFO)            
-        if self.threadWrite is not None:
-            self.threadWrite.join()
-        if self.threadRead is not None:
-            self.threadRead.join()    
-            
-    def _splitToPacket(self, data: bytearray) -> list:
-        if len(data) <= self.PACKET_SIZE:
-            return [data]
+        if self.engine == TcpEngine.SELECTOR:
+            if self.loop is not None:
+                self.loop.call(self._loopClose, wait = True)
         else:
-            return [data[self.PACKET_SIZE*i: self.PACKET_SIZE*(i+1)] \
-                        for i in range(len(data) // self.PACKET_SIZE + bool(len(data) % self.PACKET_SIZE))]
+            self.threadFinish = True
+            with self.lockRead, self.lockWrite:        
+                if self.isOpened():            
+                    if self.role == TcpRole.SERVER and self.hasConnection():
+                        self.client.close()
+                        self.client = None
+                    self.sock.close()
+                    self.sock = None
+                    self.logger.log('closed.', TcpLogLevel.INFO)            
+            if self.threadWrite is not None:
+                self.threadWrite.join()
+            if self.threadRead is not None:
+                self.threadRead.join()    
+        self._resetWritePending()
+        self._setState(TcpState.CLOSED)
+            
+    def _startService(self):
+        if self.engine == TcpEngine.SELECTOR:
+            self.loop = TcpSelectorLoop.instance()
+            self.loop.call(self._loopOpen, wait = True)
+        else:
+            self.threadWrite.start()
+            self.threadRead.start()
+            
+    # buffered reader helpers, data is stored in ring buffer or in readPending for queue mode
+    def _bufferedSize(self) -> int:
+        return len(self.ring) if self.ring is not None else len(self.readPending)
+    
+    def _bufferedFind(self, sub: bytes, start: int) -> int:
+        if self.ring is not None:
+            return self.ring.find(sub, start)
+        else:
+            return self.readPending.find(sub, start)
+        
+    def _bufferedTake(self, numByte: int) -> bytes:
+        if self.ring is not None:
+            data = bytes(self.ring.peek(numByte))
+            self.ring.consume(numByte)
+        else:
+            data = bytes(self.readPending[:numByte])
+            del self.readPending[:numByte]
+        return data
+    
+    def _bufferedWait(self, size: int, deadline: float) -> bool:
+        ''' wait until more than size bytes are buffered, return False on timeout '''
+        remaining = deadline - time.monotonic()
+        if self.ring is not None:
+            return self.ring.wait(remaining, size)
+        try:
+            if remaining > 0:
+                self.readPending += self.bufRead.get(True, remaining)
+            else:
+                self.readPending += self.bufRead.get_nowait()
+            while not self.bufRead.empty():
+                self.readPending += self.bufRead.get_nowait()
+        except queue.Empty:
+            pass
+        return len(self.readPending) > size
+        
+    def _readTimeout(self, timeout: float) -> bytes:
+        if timeout > 0: # polling is not counted
+            self.counter['timeouts'] += 1
+        return b''
+        
+    def _newCommandProcessor(self) -> commandProcessor.CommandProcessor:
+        ''' drops are counted in stats counters '''
+        processor = commandProcessor.CommandProcessor(self.commandLimit, self.payloadLimit, self.counter)
+        for prefix, sink in self.payloadSink.items():
+            processor.setPayloadSink(prefix, sink)
+        return processor
+    
+    def _receive(self, sock: socket.socket) -> int:
+        ''' receive to ring buffer or queue of packets, return number of received bytes '''
+        if self.ring is not None:
+            view = self.ring.writeView(self.readSize)
+            numByte = sock.recv_into(view)
+            view.release()
+            self.ring.commit(numByte)
+        else:
+            data = sock.recv(self.readSize)
+            numByte = len(data)
+            if numByte:
+                self.bufRead.put_nowait(data)
+        self.counter['recvCalls'] += 1
+        self.counter['bytesIn'] += numByte
+        return numByte
+        
+    def _queueWrite(self, buffers: tuple):
+        size = sum(x.nbytes for x in buffers)
+        self.counter['messagesOut'] += 1
+        if buffers and self.logger.isEnabledFor(TcpLogLevel.DEBUG):
+            self.logger.log('queued {:d} bytes {!r:.80}', TcpLogLevel.DEBUG, size, bytes(buffers[0][:80]))
+        with self.writeCond:
+            self.writePending += size
+            crossed = self.writeHigh is not None and not self.writeThrottled and self.writePending >= self.writeHigh
+            if crossed:
+                self.writeThrottled = True
+        if crossed:
+            if self.state == TcpState.UP:
+                self._setState(TcpState.DEGRADED)
+            if self.watermarkCallback is not None:
+                self.watermarkCallback(True, self.writePending)
+        self.bufWrite.put_nowait(buffers)
+        if self.engine == TcpEngine.SELECTOR:
+            self.loop.call(self._loopArmWrite)
+            
+    def _writeDone(self, numByte: int):
+        ''' numByte queued bytes were sent or dropped '''
+        with self.writeCond:
+            self.writePending -= numByte
+            crossed = self.writeThrottled and (self.writeHigh is None or self.writePending <= self.writeLow)
+            if crossed:
+                self.writeThrottled = False
+                self.writeCond.notify_all()
+                drainWaiter, self.drainWaiter = self.drainWaiter, []
+        if crossed:
+            for loop, future in drainWaiter:
+                loop.call_soon_threadsafe(lambda future = future: future.done() or future.set_result(None))
+            if self.state == TcpState.DEGRADED:
+                self._setState(TcpState.UP)
+            if self.watermarkCallback is not None:
+                self.watermarkCallback(False, self.writePending)
+                
+    def _setState(self, state: TcpState):
+        if state != self.state:
+            self.state = state
+            self.logger.log('state {}.', TcpLogLevel.DEBUG, state.name.lower())
+            if self.stateCallback is not None:
+                self.stateCallback(state)
+                
+    def _isLinkUp(self) -> bool:
+        return self.state in (TcpState.UP, TcpState.DEGRADED)
+    
+    def _newSocket(self) -> socket.socket:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        if self.engine == TcpEngine.SELECTOR:
+            sock.setblocking(False)
+        else:
+            sock.settimeout(self.TIMEOUT_LIMIT)
+        self._setNoDelay(sock)
+        return sock
+    
+    def _setNoDelay(self, sock: socket.socket):
+        if self.NO_DELAY:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    
+    def _backoffDelay(self) -> float:
+        ''' jittered exponential delay before next reconnect attempt '''
+        self.reconnectAttempt += 1
+        if self.reconnectAttempt == 1:
+            return 0
+        delay = min(self.RECONNECT_DELAY_MAX, self.RECONNECT_DELAY_MIN * 2 ** (self.reconnectAttempt - 2))
+        return delay * random.uniform(0.5, 1.0)
+    
+    def _linkUp(self):
+        self.counter['reconnects'] += 1
+        self.reconnectAttempt = 0
+        self.readReset = True
+        self._setState(TcpState.DEGRADED if self.writeThrottled else TcpState.UP)
+        
+    def _resetWritePending(self):
+        with self.writeCond:
+            numByte = self.writePending
+        self._writeDone(numByte)
+        
+    @staticmethod
+    def _toBuffers(data: tuple) -> tuple:
+        return tuple(view for view in (memoryview(x).cast('B') for x in data) if view.nbytes)
+    
+    def _sendTo(self, sock: socket.socket, buffers: list) -> int:
+        ''' scatter/gather send of buffers, return number of sent bytes '''
+        if hasattr(sock, 'sendmsg'):
+            buffers = buffers[:self.SEND_BUFFER_LIMIT]
+            numByte = sock.sendmsg(buffers)
+        else: # no sendmsg on Windows
+            buffers = buffers[:1]
+            numByte = sock.send(buffers[0])
+        self.counter['sendCalls'] += 1
+        self.counter['bytesOut'] += numByte
+        if numByte < sum(x.nbytes for x in buffers):
+            self.counter['partialSends'] += 1
+        return numByte
+        
+    @staticmethod
+    def _advanceBuffers(buffers: list, numByte: int) -> list:
+        ''' drop numByte sent bytes from head of buffers without copying '''
+        idx = 0
+        while idx < len(buffers) and numByte >= buffers[idx].nbytes:
+            numByte -= buffers[idx].nbytes
+            idx += 1
+        del buffers[:idx]
+        if numByte:
+            buffers[0] = buffers[0][numByte:]
+        return buffers
             
     def _serviceWrite(self):
         while True:            
@@ -148,22 +703,29 @@ class TcpAbc(abc.ABC):
                         except queue.Empty:
                             pass
                         else:
-                            numByte = 0
-                            while numByte < len(data):
-                                data = data[numByte:]
+                            buffers = list(data)
+                            # hold data while link is being reestablished
+                            while self.role == TcpRole.CLIENT and not self._isLinkUp() \
+                                  and self.isOpened() and not self.threadFinish:
+                                time.sleep(self.RECONNECT_DELAY_MIN / 10)
+                            sock = self._peerSock() if self.isOpened() else None
+                            if sock is None: # closed while holding, e.g. reconnect is off
+                                self.logger.log('dropped {:d} bytes, connection is closed.', TcpLogLevel.INFO,
+                                                sum(x.nbytes for x in buffers))
+                                self._writeDone(sum(x.nbytes for x in buffers))
+                                continue
+                            while buffers and not self.threadFinish:
                                 try:
-                                    numByte = self._send(data)
+                                    numByte = self._send(buffers)
                                 except socket.timeout:
                                     pass        
-                                except (ConnectionResetError, OSError):
-                                    with self.lockRead:
-                                        self.logger.log('other side disconnected during writing.', TcpLogLevel.INFO)
-                                        if self.role == TcpRole.SERVER:
-                                            self.client.close()
-                                            self.client = None
-                                        else:
-                                            self.sock.close()
-                                            self.sock = None
+                                except (ConnectionResetError, AttributeError, OSError): # AttributeError: closed meanwhile
+                                    self._threadDisconnect(sock, 'other side disconnected during writing.')
+                                    self._writeDone(sum(x.nbytes for x in buffers))
+                                    break
+                                else:
+                                    buffers = self._advanceBuffers(buffers, numByte)
+                                    self._writeDone(numByte)
         
     def _serviceRead(self):
         while True:
@@ -178,34 +740,183 @@ class TcpAbc(abc.ABC):
                             except socket.timeout:
                                 pass
                             else:
-                                self.logger.log('accepted connection from {}.'.format(adr), TcpLogLevel.INFO)
+                                self.logger.log('accepted connection from {}.', TcpLogLevel.INFO, adr)
                                 self.client.settimeout(self.TIMEOUT_LIMIT)                            
+                                self._setNoDelay(self.client)
+                                self._setState(TcpState.UP)
+                        elif self.state == TcpState.BACKOFF:
+                            self._threadReconnect()
                         else:
+                            sock = self._peerSock()
                             try:
-                                data = self._recv(self.PACKET_SIZE)
+                                numByte = self._receive(sock)
                             except socket.timeout:
                                 pass
                             except (ConnectionResetError, OSError):
-                                with self.lockWrite:
-                                    self.logger.log('other side disconnected during reading.', TcpLogLevel.INFO)
-                                    if self.role == TcpRole.SERVER:
-                                        self.client.close()
-                                        self.client = None
-                                    else:
-                                        self.sock.close()
-                                        self.sock = None
+                                self._threadDisconnect(sock, 'other side disconnected during reading.')
                             else:
-                                if data:
-                                    self.bufRead.put_nowait(data)                                
-                                else:
-                                    with self.lockWrite:
-                                        self.logger.log('other side closed connection.', TcpLogLevel.INFO)
-                                        if self.role == TcpRole.SERVER:
-                                            self.client.close()
-                                            self.client = None                                                                                                                  
-                                        else:
-                                            self.sock.close()
-                                            self.sock = None
+                                if not numByte:
+                                    self._threadDisconnect(sock, 'other side closed connection.')
+                                    
+    def _threadDisconnect(self, sock: socket.socket, mes: str):
+        ''' drop lost link, sock is peer socket used by calling thread '''
+        with self.lockState:
+            if sock is None or sock is not self._peerSock():
+                return # already dropped by other thread or closed
+            self.logger.log(mes, TcpLogLevel.INFO)
+            sock.close()
+            if self.role == TcpRole.SERVER:
+                self.client = None
+                self._setState(TcpState.CONNECTING)
+            elif self.reconnect:
+                self.sock = self._newSocket()
+                self._setState(TcpState.BACKOFF)
+            else:
+                self.sock = None
+                self._setState(TcpState.CLOSED)
+                
+    def _threadReconnect(self):
+        delay = time.monotonic() + self._backoffDelay()
+        while time.monotonic() < delay:
+            if self.threadFinish:
+                return
+            time.sleep(min(self.RECONNECT_DELAY_MIN, delay - time.monotonic()))
+        self._setState(TcpState.CONNECTING)
+        if self.sock.connect_ex((self.ip, self.port)) == 0:
+            self.logger.log('reconnected.', TcpLogLevel.INFO)
+            self._linkUp()
+        else:
+            with self.lockState:
+                if self.isOpened():
+                    self.sock.close()
+                    self.sock = self._newSocket()
+                    self._setState(TcpState.BACKOFF)
+            
+    # selector engine, all _loop* methods are called only from TcpSelectorLoop thread
+    def _peerSock(self):
+        return self.client if self.role == TcpRole.SERVER else self.sock
+    
+    def _loopOpen(self):
+        self.sock.setblocking(False)
+        if self.role == TcpRole.SERVER:
+            self.loop.selector.register(self.sock, selectors.EVENT_READ, self._loopAccept)
+        elif self.state == TcpState.BACKOFF:
+            self.loop.callLater(self._backoffDelay(), self._loopReconnect)
+        else:
+            self.loop.selector.register(self.sock, selectors.EVENT_READ, self._loopEvent)
+            self._loopArmWrite()
+        
+    def _loopClose(self):
+        if self.isOpened():
+            if self.role == TcpRole.SERVER and self.hasConnection():
+                self.loop.unregister(self.client)
+                self.client.close()
+                self.client = None
+            self.loop.unregister(self.sock)
+            self.sock.close()
+            self.sock = None
+            self.logger.log('closed.', TcpLogLevel.INFO)
+        
+    def _loopAccept(self, sock, mask):
+        try:
+            self.client, adr = self.sock.accept()
+        except (BlockingIOError, InterruptedError):
+            return
+        self.logger.log('accepted connection from {}.', TcpLogLevel.INFO, adr)
+        self.client.setblocking(False)
+        self._setNoDelay(self.client)
+        # single client at a time, stop accepting until it disconnects
+        self.loop.unregister(self.sock)
+        self.loop.selector.register(self.client, selectors.EVENT_READ, self._loopEvent)
+        self._setState(TcpState.UP)
+        self._loopArmWrite()
+        
+    def _loopArmWrite(self):
+        peer = self._peerSock() if self.isOpened() and self._isLinkUp() else None
+        if peer is not None and (self.sendPending or not self.bufWrite.empty()):
+            self.loop.selector.modify(peer, selectors.EVENT_READ | selectors.EVENT_WRITE, self._loopEvent)
+            
+    def _loopDisconnect(self, mes: str):
+        self.logger.log(mes, TcpLogLevel.INFO)
+        self._writeDone(sum(x.nbytes for x in self.sendPending))
+        self.sendPending = []
+        peer = self._peerSock()
+        self.loop.unregister(peer)
+        peer.close()
+        if self.role == TcpRole.SERVER:
+            self.client = None
+            self.loop.selector.register(self.sock, selectors.EVENT_READ, self._loopAccept)
+            self._setState(TcpState.CONNECTING)
+        elif self.reconnect:
+            self.sock = self._newSocket()
+            self._setState(TcpState.BACKOFF)
+            self.loop.callLater(self._backoffDelay(), self._loopReconnect)
+        else:
+            self.sock = None
+            self._setState(TcpState.CLOSED)
+            
+    def _loopReconnect(self):
+        if self.state != TcpState.BACKOFF or not self.isOpened():
+            return # closed during backoff
+        self._setState(TcpState.CONNECTING)
+        err = self.sock.connect_ex((self.ip, self.port))
+        if err in (0, errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EALREADY):
+            self.loop.selector.register(self.sock, selectors.EVENT_WRITE, self._loopConnect)
+        else:
+            self._loopReconnectFailed()
+            
+    def _loopConnect(self, sock, mask):
+        if sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR):
+            self.loop.unregister(sock)
+            self._loopReconnectFailed()
+        else:
+            self.logger.log('reconnected.', TcpLogLevel.INFO)
+            self.loop.selector.modify(sock, selectors.EVENT_READ, self._loopEvent)
+            self._linkUp()
+            self._loopArmWrite()
+            
+    def _loopReconnectFailed(self):
+        self.sock.close()
+        self.sock = self._newSocket()
+        self._setState(TcpState.BACKOFF)
+        self.loop.callLater(self._backoffDelay(), self._loopReconnect)
+            
+    def _loopEvent(self, sock, mask):
+        if mask & selectors.EVENT_READ:
+            try:
+                numByte = self._receive(sock)
+            except (BlockingIOError, InterruptedError):
+                pass
+            except (ConnectionResetError, OSError):
+                self._loopDisconnect('other side disconnected during reading.')
+                return
+            else:
+                if not numByte:
+                    self._loopDisconnect('other side closed connection.')
+                    return
+        if mask & selectors.EVENT_WRITE:
+            while True:
+                if not self.sendPending:
+                    # gather all queued writes for one sendmsg call
+                    while len(self.sendPending) < self.SEND_BUFFER_LIMIT:
+                        try:
+                            self.sendPending.extend(self.bufWrite.get_nowait())
+                        except queue.Empty:
+                            break
+                    if not self.sendPending:
+                        self.loop.selector.modify(sock, selectors.EVENT_READ, self._loopEvent)
+                        break
+                try:
+                    numByte = self._sendTo(sock, self.sendPending)
+                except (BlockingIOError, InterruptedError):
+                    break
+                except (ConnectionResetError, OSError):
+                    self._loopDisconnect('other side disconnected during writing.')
+                    break
+                self._advanceBuffers(self.sendPending, numByte)
+                self._writeDone(numByte)
+                if self.sendPending: # partial send, wait for socket to become writable
+                    break
             
     def _raiseError(self, err: Exception):
         self.logger.log(str(err), TcpLogLevel.ERROR)
@@ -216,8 +927,8 @@ class TcpAbc(abc.ABC):
 
 class TcpServer(TcpAbc):
     
-    def __init__(self):
-        super().__init__(TcpRole.SERVER)
+    def __init__(self, engine: TcpEngine = None):
+        super().__init__(TcpRole.SERVER, engine)
         self.echo = False
         self.client = None
         
@@ -227,38 +938,432 @@ class TcpServer(TcpAbc):
         self.sock.bind((self.ip, self.port))
         self.sock.listen(1) # max connection limit to one
         
-        self.threadWrite.start()
-        self.threadRead.start()
+        self._startService()
         
     def hasConnection(self):
         return self.client is not None  
     
-    def _send(self, data: bytearray) -> int:
+    def _send(self, buffers: list) -> int:
         if self.hasConnection():
-            return self.client.send(data)
+            return self._sendTo(self.client, buffers)
         else:
-            return len(data)
-    
-    def _recv(self, size: int) -> bytearray:
-        return self.client.recv(size)
+            return sum(x.nbytes for x in buffers)
+
         
 class TcpClient(TcpAbc):
     
-    def __init__(self):
-        super().__init__(TcpRole.CLIENT)        
+    def __init__(self, engine: TcpEngine = None):
+        super().__init__(TcpRole.CLIENT, engine)        
+        
+    def setReconnect(self, enabled: bool):
+        ''' reconnect automatically when link is lost or can't be established on opening '''
+        self.reconnect = enabled
         
     def open(self):        
         super().open()
-        self.sock.connect_ex((self.ip, self.port))
+        if self.sock.connect_ex((self.ip, self.port)) == 0:
+            self._setState(TcpState.UP)
+        elif self.reconnect:
+            self.sock.close()
+            self.sock = self._newSocket()
+            self._setState(TcpState.BACKOFF)
+        
+        self._startService()
+        
+    def _send(self, buffers: list) -> int:
+        return self._sendTo(self.sock, buffers)
+    
+class TcpPeer():
+    ''' client accepted by TcpMultiServer '''
+    
+    def __init__(self, sock: socket.socket, adr: tuple, processor: commandProcessor.CommandProcessor):
+        self.sock = sock
+        self.adr = adr
+        self.sendPending = [] # memoryviews of queued data
+        self.bytesPending = 0
+        self.commandProcessor = processor
+    
+class TcpMultiServer(TcpAbc):
+    ''' Server with fan-out of written data to several clients, runs on selector engine only.
+        Client with more than CLIENT_PENDING_LIMIT unsent bytes is disconnected, 
+        so slow clients can't stall other ones or grow memory without bound. '''
+    
+    MAX_CLIENT = 64
+    CLIENT_PENDING_LIMIT = 2 ** 22
+    
+    def __init__(self):
+        super().__init__(TcpRole.SERVER, TcpEngine.SELECTOR)
+        self.peers = {} # socket: TcpPeer, changed only by loop thread
+        self.commandHandler = None
+        self.writeWaiting = 0 # write calls waiting for drain of the slowest client
+        
+    def setCommandHandler(self, handler):
+        ''' handler(peer: TcpPeer, command: bytes) is called from loop thread for every received command, 
+            otherwise commands are queued for read methods '''
+        self.commandHandler = handler
+        
+    def open(self):
+        self.ringMode = False # whole commands are queued
+        super().open()
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind((self.ip, self.port))
+        self.sock.listen(self.MAX_CLIENT)
+        
+        self._startService()
+        
+    def hasConnection(self):
+        return bool(self.peers)
+    
+    def clientCount(self) -> int:
+        return len(self.peers)
+    
+    def bytesPending(self) -> int:
+        ''' unsent bytes of the slowest client '''
+        return max((peer.bytesPending for peer in list(self.peers.values())), default = 0)
+    
+    def write(self, *data: bytearray, timeout: float = None):
+        ''' queue data for all connected clients, buffers are shared by clients without copying.
+            Above high watermark of the slowest client wait for its drain down to low watermark up to timeout 
+            (forever for None), write from loop thread (e.g. by command handler) doesn't wait. '''
+        if self.isOpened():
+            buffers = self._toBuffers(data)
+            if buffers:
+                if self._isThrottled() and threading.current_thread() is not self.loop.thread:
+                    with self.writeCond:
+                        self.writeWaiting += 1
+                        start = time.monotonic()
+                        drained = self.writeCond.wait_for(lambda: not self.isOpened() or self.writeHigh is None or
+                                                          self.bytesPending() <= self.writeLow, timeout)
+                        self.counter['blockedTime'] += time.monotonic() - start
+                        self.writeWaiting -= 1
+                    if not drained:
+                        self.counter['timeouts'] += 1
+                        self._raiseError(self.ERROR_WRITE_TIMEOUT)
+                    if not self.isOpened():
+                        self._raiseError(self.ERROR_WRITE_CLOSE)
+                self.counter['messagesOut'] += 1
+                self.loop.call(lambda: self._loopFanOut(buffers))
+        else:
+            self._raiseError(self.ERROR_WRITE_CLOSE)
+            
+    def tryWrite(self, *data: bytearray) -> bool:
+        ''' queue data for all clients only if the slowest one is below high watermark, return False otherwise '''
+        if self.isOpened():
+            if self._isThrottled():
+                return False
+            self.write(*data)
+            return True
+        else:
+            self._raiseError(self.ERROR_WRITE_CLOSE)
+            
+    async def writeAsync(self, *data: bytearray):
+        ''' write after the slowest client drains down to low watermark without blocking asyncio event loop '''
+        while self._isThrottled() and self.isOpened():
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            with self.writeCond:
+                if not self._isThrottled():
+                    break
+                self.drainWaiter.append((loop, future))
+            self.loop.call(self._loopNotifyDrain) # slowest client may drain before waiter is added
+            start = time.monotonic()
+            await future
+            self.counter['blockedTime'] += time.monotonic() - start
+        self.write(*data)
+            
+    def writeTo(self, peer: TcpPeer, *data: bytearray):
+        ''' queue data for one client, e.g. response from command handler '''
+        if self.isOpened():
+            buffers = self._toBuffers(data)
+            if buffers:
+                self.counter['messagesOut'] += 1
+                self.loop.call(lambda: self._loopQueue(peer, buffers))
+        else:
+            self._raiseError(self.ERROR_WRITE_CLOSE)
+            
+    def _isThrottled(self) -> bool:
+        return self.writeHigh is not None and self.bytesPending() >= self.writeHigh
+    
+    def _loopNotifyDrain(self):
+        ''' wake write and writeAsync waiters when the slowest client drains down to low watermark or is dropped '''
+        if not self.drainWaiter and not self.writeWaiting:
+            return
+        with self.writeCond:
+            if self.isOpened() and self.writeHigh is not None and self.bytesPending() > self.writeLow:
+                return
+            self.writeCond.notify_all()
+            drainWaiter, self.drainWaiter = self.drainWaiter, []
+        for loop, future in drainWaiter:
+            loop.call_soon_threadsafe(lambda future = future: future.done() or future.set_result(None))
+    
+    def _loopClose(self):
+        if self.isOpened():
+            for peer in list(self.peers.values()):
+                self._loopDropPeer(peer)
+            self.loop.unregister(self.sock)
+            self.sock.close()
+            self.sock = None
+            self.logger.log('closed.', TcpLogLevel.INFO)
+    
+    def _loopAccept(self, sock, mask):
+        try:
+            client, adr = self.sock.accept()
+        except (BlockingIOError, InterruptedError):
+            return
+        if len(self.peers) >= self.MAX_CLIENT:
+            self.logger.log('rejected connection from {}, client limit reached.', TcpLogLevel.INFO, adr)
+            client.close()
+        else:
+            self.logger.log('accepted connection from {}.', TcpLogLevel.INFO, adr)
+            client.setblocking(False)
+            self._setNoDelay(client)
+            self.peers[client] = TcpPeer(client, adr, self._newCommandProcessor())
+            self.loop.selector.register(client, selectors.EVENT_READ, self._loopPeerEvent)
+            self._setState(TcpState.UP)
+            
+    def _loopDropPeer(self, peer: TcpPeer, mes: str = None):
+        if mes is not None:
+            self.logger.log('client {} {}', TcpLogLevel.INFO, peer.adr, mes)
+        self.loop.unregister(peer.sock)
+        peer.sock.close()
+        self.peers.pop(peer.sock, None)
+        peer.sendPending = []
+        peer.bytesPending = 0
+        if not self.peers and self.isOpened():
+            self._setState(TcpState.CONNECTING)
+        self._loopNotifyDrain()
+            
+    def _loopFanOut(self, buffers: tuple):
+        for peer in list(self.peers.values()):
+            self._loopQueue(peer, buffers)
+            
+    def _loopQueue(self, peer: TcpPeer, buffers: tuple):
+        if peer.sock not in self.peers:
+            return
+        idle = not peer.sendPending
+        peer.sendPending.extend(buffers)
+        peer.bytesPending += sum(x.nbytes for x in buffers)
+        if peer.bytesPending > self.CLIENT_PENDING_LIMIT:
+            self._loopDropPeer(peer, 'is too slow, disconnected.')
+        elif idle: # try to send at once, wait for writable socket only if it is full
+            self._loopPeerSend(peer)
+            if peer.sendPending and peer.sock in self.peers:
+                self.loop.selector.modify(peer.sock, selectors.EVENT_READ | selectors.EVENT_WRITE, 
+                                          self._loopPeerEvent)
+                
+    def _loopPeerSend(self, peer: TcpPeer):
+        while peer.sendPending:
+            try:
+                numByte = self._sendTo(peer.sock, peer.sendPending)
+            except (BlockingIOError, InterruptedError):
+                break
+            except (ConnectionResetError, OSError):
+                self._loopDropPeer(peer, 'disconnected during writing.')
+                break
+            peer.bytesPending -= numByte
+            self._advanceBuffers(peer.sendPending, numByte)
+        self._loopNotifyDrain()
+            
+    def _loopPeerEvent(self, sock, mask):
+        peer = self.peers.get(sock)
+        if peer is None: # dropped by previous event
+            return
+        if mask & selectors.EVENT_READ:
+            try:
+                data = sock.recv(self.readSize)
+            except (BlockingIOError, InterruptedError):
+                pass
+            except (ConnectionResetError, OSError):
+                self._loopDropPeer(peer, 'disconnected during reading.')
+                return
+            else:
+                self.counter['recvCalls'] += 1
+                self.counter['bytesIn'] += len(data)
+                if not data:
+                    self._loopDropPeer(peer, 'closed connection.')
+                    return
+                for command in peer.commandProcessor.process(data):
+                    if self.logger.isEnabledFor(TcpLogLevel.DEBUG):
+                        self.logger.log('client {} sent {!r:.80}', TcpLogLevel.DEBUG, peer.adr, command)
+                    if self.commandHandler is not None:
+                        self.counter['messagesIn'] += 1 # otherwise counted by readCommand
+                        self.commandHandler(peer, command)
+                    else:
+                        self.bufRead.put_nowait(command)
+        if mask & selectors.EVENT_WRITE:
+            self._loopPeerSend(peer)
+            if not peer.sendPending and sock in self.peers:
+                self.loop.selector.modify(sock, selectors.EVENT_READ, self._loopPeerEvent)
         
-        self.threadWrite.start()
-        self.threadRead.start()
+class RingBuffer():
+    ''' Growable byte ring buffer with one producer (receiving thread) and one consumer.
+        Producer receives directly into writeView() and calls commit(), 
+        consumer gets stored bytes with peek() and releases them with consume(). 
+        Views from peek() are valid until consume(), only data crossing the end of buffer is copied. '''
+    
+    def __init__(self, size: int):
+        self.buf = bytearray(size)
+        self.head = 0  # index of first stored byte
+        self.count = 0 # number of stored bytes
+        self.cond = threading.Condition()
         
-    def _send(self, data: bytearray) -> int:
-        return self.sock.send(data)
+    def __len__(self):
+        return self.count
     
-    def _recv(self, size: int) -> bytearray:
-        return self.sock.recv(size)
+    def writeView(self, size: int) -> memoryview:
+        ''' contiguous free space up to size bytes, buffer grows when less than size bytes are free '''
+        with self.cond:
+            if self.count == 0:
+                self.head = 0 # only producer moves empty buffer to start, its view must stay in place
+            if len(self.buf) - self.count < size:
+                self._grow(size)
+            tail = (self.head + self.count) % len(self.buf)
+            end = len(self.buf) if tail >= self.head else self.head
+            return memoryview(self.buf)[tail:min(end, tail + size)]
+        
+    def commit(self, numByte: int):
+        ''' mark numByte bytes written to writeView as stored '''
+        if numByte:
+            with self.cond:
+                self.count += numByte
+                self.cond.notify_all()
+                
+    def wait(self, timeout: float, size: int = 0) -> bool:
+        ''' wait until more than size bytes are stored, return False on timeout '''
+        with self.cond:
+            if timeout > 0:
+                self.cond.wait_for(lambda: self.count > size, timeout)
+            return self.count > size
+        
+    def find(self, sub: bytes, start: int = 0) -> int:
+        ''' index of sub in stored bytes counting from first one, -1 if not found '''
+        with self.cond:
+            if self.head + self.count <= len(self.buf):
+                idx = self.buf.find(sub, self.head + start, self.head + self.count)
+                return idx - self.head if idx != -1 else -1
+            else: # stored data crosses end of buffer
+                return bytes(self.peek()).find(sub, start)
+            
+    def peek(self, size: int = None) -> memoryview:
+        ''' first size stored bytes (all by default) '''
+        with self.cond:
+            size = self.count if size is None else min(size, self.count)
+            firstSize = min(size, len(self.buf) - self.head)
+            if firstSize == size:
+                return memoryview(self.buf)[self.head:self.head + size]
+            data = bytearray(size) # stored data crosses end of buffer
+            data[:firstSize] = self.buf[self.head:]
+            data[firstSize:] = self.buf[:size - firstSize]
+            return memoryview(data)
+        
+    def consume(self, numByte: int):
+        with self.cond:
+            numByte = min(numByte, self.count)
+            self.count -= numByte
+            self.head = (self.head + numByte) % len(self.buf)
+            
+    def _grow(self, size: int):
+        newSize = 2 * len(self.buf)
+        while newSize - self.count < size:
+            newSize *= 2
+        # new object instead of resize, old views of consumer stay valid
+        buf = bytearray(newSize)
+        firstSize = min(self.count, len(self.buf) - self.head)
+        buf[:firstSize] = self.buf[self.head:self.head + firstSize]
+        buf[firstSize:self.count] = self.buf[:self.count - firstSize]
+        self.buf = buf
+        self.head = 0
+        
+class TcpSelectorLoop():
+    ''' Shared event loop multiplexing any number of selector engine connections on one thread.
+        Other threads interact with the loop only through call(), 
+        which wakes select() immediately by writing to a self-pipe. '''
+    
+    _instance = None
+    _instanceLock = threading.Lock()
+    
+    @classmethod
+    def instance(cls):
+        with cls._instanceLock:
+            if cls._instance is None or not cls._instance.thread.is_alive():
+                cls._instance = cls()
+            return cls._instance
+    
+    def __init__(self):
+        self.selector = selectors.DefaultSelector()
+        self.wakeRecv, self.wakeSend = socket.socketpair()
+        self.wakeRecv.setblocking(False)
+        self.wakeSend.setblocking(False)
+        self.selector.register(self.wakeRecv, selectors.EVENT_READ, None)
+        
+        self.calls = collections.deque()
+        self.timers = [] # heap of (deadline, order, func), accessed only by loop thread
+        self.timerOrder = 0
+        self.thread = threading.Thread(target = self._service, name = 'TcpSelectorLoop', daemon = True)
+        self.thread.start()
+        
+    def call(self, func, wait: bool = False):
+        ''' run func in loop thread, optionally wait for its completion '''
+        if threading.current_thread() is self.thread or not self.thread.is_alive():
+            func()
+        elif wait:
+            done = threading.Event()
+            def funcDone():
+                try:
+                    func()
+                finally:
+                    done.set()
+            self.calls.append(funcDone)
+            self.wake()
+            done.wait()
+        else:
+            self.calls.append(func)
+            self.wake()
+            
+    def callLater(self, delay: float, func):
+        ''' run func in loop thread after delay in seconds '''
+        def addTimer():
+            self.timerOrder += 1
+            heapq.heappush(self.timers, (time.monotonic() + delay, self.timerOrder, func))
+        self.call(addTimer)
+        
+    def wake(self):
+        try:
+            self.wakeSend.send(b'\0')
+        except (BlockingIOError, InterruptedError):
+            pass # self-pipe is full, so loop is already awake
+            
+    def unregister(self, sock):
+        try:
+            self.selector.unregister(sock)
+        except (KeyError, ValueError):
+            pass
+            
+    def _service(self):
+        while True:
+            timeout = None
+            if self.timers:
+                timeout = max(0, self.timers[0][0] - time.monotonic())
+            for key, mask in self.selector.select(timeout):
+                if key.data is None:
+                    try:
+                        while self.wakeRecv.recv(4096):
+                            pass
+                    except (BlockingIOError, InterruptedError):
+                        pass
+                else:
+                    try:
+                        key.data(key.fileobj, mask)
+                    except Exception as err:
+                        print('TcpSelectorLoop: error: {!r}\n'.format(err), end = '')
+            while self.timers and self.timers[0][0] <= time.monotonic():
+                self.calls.append(heapq.heappop(self.timers)[2])
+            while self.calls:
+                func = self.calls.popleft()
+                try:
+                    func()
+                except Exception as err:
+                    print('TcpSelectorLoop: error: {!r}\n'.format(err), end = '')
         
 class TcpLogLevel(enum.IntEnum):    
     
@@ -268,18 +1373,140 @@ class TcpLogLevel(enum.IntEnum):
     NOTSET = 0
     
 class TcpLogger():
+    ''' log(mes, level, *args) checks level first and only records (time, level, name, mes, args)
+        into ring buffer of TcpLogDrain, mes.format(*args) is done later by drain thread '''
     
     LOGGING_ENABLE = True
-    MINIMUM_LOG_LEVEL = TcpLogLevel.DEBUG
+    MINIMUM_LOG_LEVEL = TcpLogLevel.INFO
     
     def __init__(self, caller):
         self.caller = weakref.proxy(caller)
+        self.address = None
+        self.name = None
+        self.drain = TcpLogDrain.instance()
         
-    def log(self, mes: str, level: TcpLogLevel = TcpLogLevel.NOTSET):
+    def isEnabledFor(self, level: TcpLogLevel) -> bool:
+        return self.LOGGING_ENABLE and level >= self.MINIMUM_LOG_LEVEL
+        
+    def log(self, mes: str, level: TcpLogLevel = TcpLogLevel.NOTSET, *args):
         if self.LOGGING_ENABLE and level >= self.MINIMUM_LOG_LEVEL:
-            name = self.caller.role.name.capitalize() + str((self.caller.ip, self.caller.port))
-            mesType = level.name.lower()
-            print(name + ': ' + mesType + ': ' +  mes + '\n', end = '')
+            address = (self.caller.ip, self.caller.port)
+            if address != self.address: # name is rebuilt only when address is changed
+                self.address = address
+                self.name = self.caller.role.name.capitalize() + str(address)
+            self.drain.record(level, self.name, mes, args)
+            
+class TcpLogDrain():
+    ''' Single background thread formatting log records and passing them to sinks in batches.
+        Sink is callable(lines: list of str), called from drain thread. '''
+    
+    RECORD_LIMIT = 2 ** 14 # oldest records are dropped when drain can't keep up
+    DRAIN_INTERVAL = 0.1 # in seconds
+    
+    _instance = None
+    _instanceLock = threading.Lock()
+    
+    @classmethod
+    def instance(cls) -> 'TcpLogDrain':
+        with cls._instanceLock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
+    
+    def __init__(self):
+        # deque append/popleft are atomic, so I/O threads never wait for lock or drain
+        self.records = collections.deque(maxlen = self.RECORD_LIMIT)
+        self.dropCount = 0
+        self.sinks = [self.writeStdout]
+        self.lockSink = threading.Lock()
+        self.event = threading.Event()
+        self.thread = threading.Thread(target = self._service, name = 'TcpLogDrain', daemon = True)
+        self.thread.start()
+        atexit.register(self.flush)
+        
+    def record(self, level: TcpLogLevel, name: str, mes: str, args: tuple):
+        if len(self.records) == self.RECORD_LIMIT:
+            self.dropCount += 1
+        self.records.append((time.time(), level, name, mes, args))
+        if level >= TcpLogLevel.ERROR:
+            self.event.set()
+        
+    def addSink(self, sink):
+        with self.lockSink:
+            self.sinks.append(sink)
+        return sink
+    
+    def removeSink(self, sink):
+        with self.lockSink:
+            if sink in self.sinks:
+                self.sinks.remove(sink)
+                
+    def flush(self):
+        ''' pass all recorded messages to sinks from calling thread '''
+        lines = []
+        if self.dropCount:
+            lines.append('TcpLogDrain: {} records dropped.'.format(self.dropCount))
+            self.dropCount = 0
+        while True:
+            try:
+                created, level, name, mes, args = self.records.popleft()
+            except IndexError:
+                break
+            if args:
+                try:
+                    mes = mes.format(*args)
+                except (IndexError, KeyError, ValueError) as err:
+                    mes = '{!r} {!r} ({!r})'.format(mes, args, err)
+            lines.append('{}.{:03d} {}: {}: {}'.format(time.strftime('%H:%M:%S', time.localtime(created)),
+                                                       int(created * 1000) % 1000, 
+                                                       name, level.name.lower(), mes))
+        if lines:
+            with self.lockSink:
+                for sink in self.sinks:
+                    try:
+                        sink(lines)
+                    except Exception as err:
+                        print('TcpLogDrain: sink error: {!r}\n'.format(err), end = '')
+                        
+    @staticmethod
+    def writeStdout(lines: list):
+        sys.stdout.write('\n'.join(lines) + '\n')
+        
+    def _service(self):
+        while True:
+            self.event.wait(self.DRAIN_INTERVAL)
+            self.event.clear()
+            self.flush()
+                            
+class TcpLogFile():
+    ''' log sink writing to file, rotated to path.1 ... path.<backupCount> when sizeLimit is reached '''
+    
+    SIZE_LIMIT = 2 ** 20 # in bytes
+    BACKUP_COUNT = 3
+    
+    def __init__(self, path: str, sizeLimit: int = None, backupCount: int = None):
+        self.path = path
+        self.sizeLimit = self.SIZE_LIMIT if sizeLimit is None else sizeLimit
+        self.backupCount = self.BACKUP_COUNT if backupCount is None else backupCount
+        self.file = open(self.path, 'a', encoding = 'utf-8')
+        
+    def __call__(self, lines: list):
+        self.file.write('\n'.join(lines) + '\n')
+        self.file.flush()
+        if self.file.tell() >= self.sizeLimit:
+            self._rotate()
+            
+    def close(self):
+        self.file.close()
+            
+    def _rotate(self):
+        self.file.close()
+        for idx in range(self.backupCount - 1, 0, -1):
+            if os.path.exists('{}.{}'.format(self.path, idx)):
+                os.replace('{}.{}'.format(self.path, idx), '{}.{}'.format(self.path, idx + 1))
+        if self.backupCount > 0:
+            os.replace(self.path, self.path + '.1')
+        self.file = open(self.path, 'w', encoding = 'utf-8')
         
 if __name__ == '__main__':
     tcpServer = TcpServer()
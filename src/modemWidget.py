@@ -13,6 +13,10 @@ TODO:
 
 DESCRIPTION:
     Modem Widget
+        signals:
+            parameterChanged - dict of edited parameters, emitted DEBOUNCE_INTERVAL after last edit
+        slots:
+            requestAllParameter - emit all parameters at once
 """
 from PyQt5 import QtWidgets as qtw
 from PyQt5 import QtGui as qtg
@@ -36,10 +40,17 @@ class ModemWidget(qtw.QGroupBox):
     MIN_POWER_LEVEL = 0
     MAX_POWER_LEVEL = 100
     DEFAULT_POWER_LEVEL = 100
+    DEBOUNCE_INTERVAL = 300 # in ms
     
     def __init__(self, parent = None):
         super().__init__(parent)
         
+        self.pending = {} # edited parameters waiting for debounce timer
+        self.debounceTimer = qtc.QTimer(self)
+        self.debounceTimer.setSingleShot(True)
+        self.debounceTimer.setInterval(self.DEBOUNCE_INTERVAL)
+        self.debounceTimer.timeout.connect(self._emitPending)
+        
         self._setupUi()
         
     def _setupUi(self):  
@@ -87,19 +98,32 @@ class ModemWidget(qtw.QGroupBox):
         
         # signal-slot connections
         self.mode.currentTextChanged.connect(self._enableModeChoice)
-        self.id.valueChanged.connect(lambda x: self.parameterChanged.emit({'id': x}))
-        self.name.textChanged.connect(lambda x: self.parameterChanged.emit({'name': x}))
-        self.mode.currentTextChanged.connect(lambda x: self.parameterChanged.emit({'mode': x}))
-        self.rob.currentTextChanged.connect(lambda x: self.parameterChanged.emit({'rob': x}))
-        self.mdl.currentTextChanged.connect(lambda x: self.parameterChanged.emit({'mdl': x}))        
-        self.rate.currentTextChanged.connect(lambda x: self.parameterChanged.emit({'rate': x}))
-        self.blockSize.valueChanged.connect(lambda x: self.parameterChanged.emit({'blockSize': x}))
-        self.transSize.valueChanged.connect(lambda x: self.parameterChanged.emit({'transSize': x}))        
-        self.powerLevel.valueChanged.connect(lambda x: self.parameterChanged.emit({'powerLevel': x}))
+        self.id.valueChanged.connect(lambda x: self._editParameter('id', x))
+        self.name.textChanged.connect(lambda x: self._editParameter('name', x))
+        self.mode.currentTextChanged.connect(lambda x: self._editParameter('mode', x))
+        self.rob.currentTextChanged.connect(lambda x: self._editParameter('rob', x))
+        self.mdl.currentTextChanged.connect(lambda x: self._editParameter('mdl', x))        
+        self.rate.currentTextChanged.connect(lambda x: self._editParameter('rate', x))
+        self.blockSize.valueChanged.connect(lambda x: self._editParameter('blockSize', x))
+        self.transSize.valueChanged.connect(lambda x: self._editParameter('transSize', x))        
+        self.powerLevel.valueChanged.connect(lambda x: self._editParameter('powerLevel', x))
+        
+    def _editParameter(self, key: str, value):
+        ''' latest value is kept, timer is restarted by every edit '''
+        self.pending[key] = value
+        self.debounceTimer.start()
+        
+    @qtc.pyqtSlot()
+    def _emitPending(self):
+        if self.pending:
+            pending, self.pending = self.pending, {}
+            self.parameterChanged.emit(pending)
         
     @qtc.pyqtSlot()
     def requestAllParameter(self):
         print('requestAllParameter')
+        self.debounceTimer.stop()
+        self.pending = {}
         self.parameterChanged.emit({'id': self.id.value(),
                                     'name': self.name.text(),
                                     'mode': self.mode.currentText(),
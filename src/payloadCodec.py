@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+"""
+HISTORY:
+    Created on Sun Oct 18 19:03:27 2026
+
+Project: Vortex GUI
+
+Author: DIVE-LINK (www.dive-link.net), dive-link@mail.ru
+        Shustov Aleksey (SemperAnte), semte@semte.ru
+
+TODO:
+
+DESCRIPTION:
+    Compression stage of transferred data between TransferWidget._processImage and startTransfer.
+    Image data is <type 2> <columns uint16> <rows uint16> <rgb bytes of rows>, compressed data is
+        <type COMPRESSED_TYPE> <compression> <level> <filter> <raw size uint32> <compressed raw data>
+    Filter is applied to image bytes before compression (header is kept), like PNG filters:
+        SUB - difference with the same channel of previous pixel
+        UP - difference with the same byte of previous row
+    Data is sent uncompressed when compression doesn't make it smaller.
+    New compression or filter is one enum member and pair of functions in COMPRESSOR or FILTER.
+
+    Benchmark over corpus of synthetic images and given image files:
+        python payloadCodec.py [image.png ...]
+"""
+import enum
+import lzma
+import struct
+import zlib
+
+import numpy as np
+
+IMAGE_TYPE = 2
+COMPRESSED_TYPE = 4
+IMAGE_HEADER_SIZE = 5 # type, columns, rows
+HEADER = struct.Struct('<BBBBI') # type, compression, level, filter, raw size
+
+class Compression(enum.Enum):
+    NONE = 0
+    ZLIB = 1
+    LZMA = 2
+
+class Filter(enum.Enum):
+    NONE = 0
+    SUB = 1
+    UP = 2
+
+LEVEL = {Compression.NONE: (0, 0),
+         Compression.ZLIB: (1, 9),
+         Compression.LZMA: (0, 9)} # min and max level
+
+COMPRESSOR = {Compression.NONE: (lambda data, level: data, lambda data: data),
+              Compression.ZLIB: (lambda data, level: zlib.compress(data, level), zlib.decompress),
+              Compression.LZMA: (lambda data, level: lzma.compress(data, preset = level), lzma.decompress)}
+
+def _imageShape(data: np.ndarray) -> tuple:
+    ''' rows and row size in bytes of image data, None for other data '''
+    if data.size <= IMAGE_HEADER_SIZE or data[0] != IMAGE_TYPE:
+        return None
+    columns, rows = data[1:IMAGE_HEADER_SIZE].view('<u2')
+    pixelCount = int(rows) * int(columns)
+    if pixelCount == 0 or (data.size - IMAGE_HEADER_SIZE) % pixelCount:
+        return None
+    return int(rows), (data.size - IMAGE_HEADER_SIZE) // int(rows)
+
+def _channels(data: np.ndarray) -> int:
+    rows, rowSize = _imageShape(data)
+    return rowSize // int(data[1:3].view('<u2')[0])
+
+def _filterSub(data: np.ndarray) -> np.ndarray:
+    pixel = data[IMAGE_HEADER_SIZE:].reshape(-1, _channels(data))
+    res = data.copy()
+    res[IMAGE_HEADER_SIZE:].reshape(pixel.shape)[1:] = pixel[1:] - pixel[:-1]
+    return res
+
+def _unfilterSub(data: np.ndarray) -> np.ndarray:
+    res = data.copy()
+    pixel = res[IMAGE_HEADER_SIZE:].reshape(-1, _channels(data))
+    np.cumsum(pixel, axis = 0, dtype = np.uint8, out = pixel)
+    return res
+
+def _filterUp(data: np.ndarray) -> np.ndarray:
+    row = data[IMAGE_HEADER_SIZE:].reshape(_imageShape(data))
+    res = data.copy()
+    res[IMAGE_HEADER_SIZE:].reshape(row.shape)[1:] = row[1:] - row[:-1]
+    return res
+
+def _unfilterUp(data: np.ndarray) -> np.ndarray:
+    res = data.copy()
+    row = res[IMAGE_HEADER_SIZE:].reshape(_imageShape(data))
+    np.cumsum(row, axis = 0, dtype = np.uint8, out = row)
+    return res
+
+FILTER = {Filter.NONE: (lambda data: data, lambda data: data),
+          Filter.SUB: (_filterSub, _unfilterSub),
+          Filter.UP: (_filterUp, _unfilterUp)}
+
+def encode(data: np.ndarray, compression: Compression, level: int = 6, filt: Filter = Filter.NONE) -> np.ndarray:
+    ''' compressed data or data itself when it is not smaller, filter is skipped for data other than image '''
+    data = np.ascontiguousarray(data, dtype = np.uint8).ravel()
+    if compression == Compression.NONE:
+        return data
+    if _imageShape(data) is None:
+        filt = Filter.NONE
+    low, high = LEVEL[compression]
+    level = min(max(level, low), high)
+    filtered = FILTER[filt][0](data)
+    payload = COMPRESSOR[compression][0](filtered.tobytes(), level)
+    if HEADER.size + len(payload) >= data.size:
+        return data
+    header = HEADER.pack(COMPRESSED_TYPE, compression.value, level, filt.value, data.size)
+    return np.frombuffer(header + payload, dtype = np.uint8)
+
+def decode(payload) -> np.ndarray:
+    ''' raw data of compressed one, other data is returned as is, raise ValueError for broken data '''
+    payload = np.frombuffer(payload, dtype = np.uint8)
+    if payload.size < HEADER.size or payload[0] != COMPRESSED_TYPE:
+        return payload
+    _, compression, _, filt, size = HEADER.unpack_from(payload)
+    try:
+        data = COMPRESSOR[Compression(compression)][1](payload[HEADER.size:].tobytes())
+        data = np.frombuffer(data, dtype = np.uint8)
+        if data.size != size:
+            raise ValueError('Wrong size of decompressed data.')
+        return FILTER[Filter(filt)][1](data)
+    except (zlib.error, lzma.LZMAError, TypeError) as err:
+        raise ValueError(str(err))
+
+def airtime(numByte: int, rate: float) -> float:
+    ''' in seconds, rate in bit/s '''
+    return numByte * 8 / rate if rate > 0 else float('inf')
+
+def imageData(image: np.ndarray) -> np.ndarray:
+    ''' image data of rows x columns x channels uint8 image, as made by TransferWidget '''
+    rows, columns = image.shape[:2]
+    return np.concatenate((np.atleast_1d(np.uint8(IMAGE_TYPE)),
+                           np.array([columns, rows], dtype = '<u2').view(np.uint8), np.ravel(image)))
+
+def _sampleImages(size: int = 256) -> dict:
+    ''' synthetic corpus: smooth photo-like, gradient, flat areas with text-like edges and noise '''
+    rng = np.random.default_rng(1)
+    y, x = np.mgrid[0:size, 0:size] / size
+    photo = np.stack([np.sin(6 * x + 2 * y), np.cos(5 * y - 3 * x), np.sin(4 * x * y + 1)], axis = 2)
+    photo = (photo + 1) * 100 + rng.normal(0, 4, photo.shape)
+    gradient = np.stack([x, y, (x + y) / 2], axis = 2) * 255
+    drawing = np.full((size, size, 3), 240.0)
+    for _ in range(40):
+        r, c = rng.integers(0, size - 32, 2)
+        drawing[r:r + rng.integers(2, 32), c:c + rng.integers(2, 32)] = rng.integers(0, 256, 3)
+    noise = rng.integers(0, 256, (size, size, 3))
+    return {name: np.clip(image, 0, 255).astype(np.uint8)
+            for name, image in (('photo', photo), ('gradient', gradient), ('drawing', drawing), ('noise', noise))}
+
+# benchmark
+if __name__ == '__main__':
+
+    import sys
+    import time
+
+    LINK_RATE = 1000 # bit/s
+
+    corpus = _sampleImages()
+    corpus['narrow'] = corpus['photo'][:, :100] # rows differ from columns
+    for fileName in sys.argv[1:]:
+        import matplotlib.image as mpimg
+        image = mpimg.imread(fileName)[:, :, :3]
+        corpus[fileName] = (image * 255).astype(np.uint8) if image.dtype != np.uint8 else image
+
+    for name, image in corpus.items():
+        data = imageData(image)
+        print('--- {} {}x{}, {:d} bytes, airtime {:.0f} s at {:d} bit/s ---'.\
+              format(name, image.shape[0], image.shape[1], data.size, airtime(data.size, LINK_RATE), LINK_RATE))
+        for compression in (Compression.ZLIB, Compression.LZMA):
+            for level in sorted(set(LEVEL[compression] + (6,))):
+                for filt in Filter:
+                    start = time.perf_counter()
+                    payload = encode(data, compression, level, filt)
+                    encodeTime = time.perf_counter() - start
+                    start = time.perf_counter()
+                    assert np.array_equal(decode(payload), data)
+                    decodeTime = time.perf_counter() - start
+                    print('{:<4s} {:d} {:<4s}: ratio {:5.2f}, airtime {:6.0f} s, encode {:7.1f} ms, decode {:6.1f} ms'.\
+                          format(compression.name.lower(), level, filt.name.lower(), data.size / payload.size,
+                                 airtime(payload.size, LINK_RATE), encodeTime * 1e3, decodeTime * 1e3))
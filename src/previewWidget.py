@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+"""
+HISTORY:
+    Created on Sun Oct 18 22:41:08 2026
+
+Project: Vortex GUI
+
+Author: DIVE-LINK (www.dive-link.net), dive-link@mail.ru
+        Shustov Aleksey (SemperAnte), semte@semte.ru
+
+TODO:
+
+DESCRIPTION:
+    PreviewWidget
+        slots:
+            setImage - rows x columns x 3 uint8 buffer, wrapped by QImage without copying
+            updateRows - buffer rows changed in place, only their rectangle is repainted
+    Image is scaled to widget keeping aspect ratio, every paint draws only exposed part of it.
+    Buffer is kept referenced by widget, it must stay C-contiguous while shown.
+
+    Startup and frame time vs matplotlib canvas:
+        python previewWidget.py
+"""
+from PyQt5 import QtWidgets as qtw
+from PyQt5 import QtGui as qtg
+from PyQt5 import QtCore as qtc
+
+import numpy as np
+
+class PreviewWidget(qtw.QWidget):
+
+    SIZE_HINT = (640, 480)
+
+    def __init__(self, parent = None):
+        super().__init__(parent)
+        self.buffer = None
+        self.image = None
+        self.setSizePolicy(qtw.QSizePolicy.Expanding, qtw.QSizePolicy.Expanding)
+        self.setAttribute(qtc.Qt.WA_OpaquePaintEvent) # background is painted by paintEvent
+
+    def sizeHint(self):
+        return qtc.QSize(*self.SIZE_HINT)
+
+    @qtc.pyqtSlot(np.ndarray)
+    def setImage(self, buffer):
+        if buffer.dtype != np.uint8 or buffer.ndim != 3 or buffer.shape[2] != 3 or not buffer.flags.c_contiguous:
+            raise ValueError('Preview buffer must be C-contiguous rows x columns x 3 uint8 array.')
+        self.buffer = buffer
+        rows, columns = buffer.shape[:2]
+        self.image = qtg.QImage(buffer.data, columns, rows, buffer.strides[0], qtg.QImage.Format_RGB888)
+        self.update()
+
+    @qtc.pyqtSlot(int, int)
+    def updateRows(self, start, end):
+        ''' rows start...end - 1 of buffer are changed '''
+        if self.image is None or end <= start:
+            return
+        target = self._targetRect()
+        scale = target.height() / self.image.height()
+        rect = qtc.QRectF(target.left(), target.top() + start * scale, target.width(), (end - start) * scale)
+        self.update(rect.toAlignedRect().adjusted(-1, -1, 1, 1))
+
+    def _targetRect(self) -> qtc.QRectF:
+        ''' image area of widget, centered with aspect ratio of image '''
+        size = qtc.QSizeF(self.image.size()).scaled(qtc.QSizeF(self.size()), qtc.Qt.KeepAspectRatio)
+        return qtc.QRectF(qtc.QPointF((self.width() - size.width()) / 2, (self.height() - size.height()) / 2), size)
+
+    def paintEvent(self, event):
+        painter = qtg.QPainter(self)
+        exposed = qtc.QRectF(event.rect())
+        painter.fillRect(exposed, self.palette().window())
+        if self.image is None:
+            return
+        target = self._targetRect()
+        area = exposed.intersected(target)
+        if area.isEmpty():
+            return
+        scale = self.image.width() / target.width()
+        source = qtc.QRectF((area.left() - target.left()) * scale, (area.top() - target.top()) * scale,
+                            area.width() * scale, area.height() * scale)
+        painter.setRenderHint(qtg.QPainter.SmoothPixmapTransform)
+        painter.drawImage(area, self.image, source)
+
+def benchmarkPreview(updateCount = 20):
+    ''' process start up to shown widget and frame time of full and row repaints, PreviewWidget vs matplotlib '''
+    import subprocess
+    import sys
+    import time
+
+    STARTUP = {'preview': 'import previewWidget; widget = previewWidget.PreviewWidget()',
+               'matplotlib': 'import matplotlib.pyplot as plt; '
+                             'from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas; '
+                             'widget = FigureCanvas(plt.figure())'}
+    for name, code in STARTUP.items():
+        script = ('import time; start = time.perf_counter(); from PyQt5 import QtWidgets as qtw; '
+                  'app = qtw.QApplication([]); {}; widget.show(); app.processEvents(); '
+                  'print(time.perf_counter() - start)').format(code)
+        duration = min(float(subprocess.run([sys.executable, '-c', script], capture_output = True,
+                                            text = True, check = True).stdout.split()[-1]) for _ in range(3))
+        print('{:<10s}: start up {:7.1f} ms'.format(name, duration * 1e3))
+
+    import matplotlib.pyplot as plt
+    from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
+    from matplotlib.transforms import Bbox
+    import matplotlib.image as mpimg
+
+    app = qtw.QApplication.instance() or qtw.QApplication([])
+    rng = np.random.default_rng(1)
+    for size in (400, 1600):
+        buffer = rng.integers(0, 256, (size, size, 3), dtype = np.uint8)
+
+        widget = PreviewWidget()
+        widget.resize(800, 600)
+        widget.show()
+        widget.setImage(buffer)
+        app.processEvents()
+        start = time.perf_counter()
+        for _ in range(updateCount):
+            widget.repaint()
+        previewFull = (time.perf_counter() - start) / updateCount
+        start = time.perf_counter()
+        for row in range(updateCount):
+            widget.updateRows(row, row + 1)
+            app.processEvents()
+        previewRows = (time.perf_counter() - start) / updateCount
+        widget.close()
+
+        fig = plt.figure()
+        canvas = FigureCanvas(fig)
+        canvas.resize(800, 600)
+        canvas.show()
+        ax = fig.add_axes([0, 0, 1, 1])
+        ax.axis('off')
+        art = ax.imshow(buffer, interpolation = None)
+        ax.set_autoscale_on(False)
+        patchArt = mpimg.AxesImage(ax, interpolation = art.get_interpolation())
+        canvas.draw()
+        app.processEvents()
+        start = time.perf_counter()
+        for _ in range(updateCount):
+            art.set_data(buffer)
+            canvas.draw()
+            app.processEvents()
+        canvasFull = (time.perf_counter() - start) / updateCount
+        start = time.perf_counter()
+        for row in range(updateCount):
+            extent = (-0.5, size - 0.5, row + 0.5, row - 0.5)
+            patchArt.set_data(buffer[row:row + 1])
+            patchArt.set_extent(extent)
+            ax.draw_artist(patchArt)
+            canvas.blit(Bbox(ax.transData.transform([(extent[0], extent[2]), (extent[1], extent[3])])))
+            app.processEvents()
+        canvasRows = (time.perf_counter() - start) / updateCount
+        canvas.close()
+        plt.close(fig)
+
+        print('{:>4d} x {:<4d}: full frame preview {:6.2f} ms, matplotlib {:7.2f} ms; '
+              'one row preview {:5.2f} ms, matplotlib {:5.2f} ms'.\
+              format(size, size, previewFull * 1e3, canvasFull * 1e3, previewRows * 1e3, canvasRows * 1e3))
+
+# benchmark
+if __name__ == '__main__':
+    benchmarkPreview()
@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+"""
+HISTORY:
+    Created on Sun Oct 18 10:05:41 2026
+
+Project: Vortex GUI
+
+Author: DIVE-LINK (www.dive-link.net), dive-link@mail.ru
+        Shustov Aleksey (SemperAnte), semte@semte.ru
+
+TODO:
+
+DESCRIPTION:
+    Benchmarks for interfaceTcp, run from src folder:
+        python tcpBenchmark.py [name ...]
+    available names:
+        latency - request/response round trip and close time for every TcpEngine
+        write - throughput and allocated memory of concatenated and scatter/gather writes
+        read - throughput and allocated memory of queue of packets and ring buffer receiving
+        fanout - delivery time of TcpMultiServer broadcast to all subscribers, with and without slow one
+"""
+import socket
+import statistics
+import sys
+import threading
+import time
+import tracemalloc
+
+import numpy as np
+
+import interfaceTcp
+
+BENCHMARK_IP = 'localhost'
+BENCHMARK_PORT = 10250
+
+def _openPair(engine, port, ringBuffer = False, readSize = None):
+    server = interfaceTcp.TcpServer(engine)
+    server.setAddress(BENCHMARK_IP, port)
+    server.setReadMode(ringBuffer, readSize)
+    server.open()
+    client = interfaceTcp.TcpClient(engine)
+    client.setAddress(BENCHMARK_IP, port)
+    client.open()
+    # wait until server accepts connection
+    while not server.hasConnection():
+        time.sleep(0.001)
+    return server, client
+
+def _echo(server, stop):
+    while not stop.is_set():
+        data = server.read(0.1)
+        if data:
+            server.write(data)
+
+def _percentile(values, part):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * part))]
+
+def benchmarkLatency(exchangeCount = 2000, messageSize = 64):
+    ''' Round trip of client request echoed by server and time of closing both sides. '''
+    message = b'x' * messageSize
+    for idx, engine in enumerate(interfaceTcp.TcpEngine):
+        server, client = _openPair(engine, BENCHMARK_PORT + idx)
+        stop = threading.Event()
+        echoThread = threading.Thread(target = _echo, args = (server, stop))
+        echoThread.start()
+
+        roundTrip = []
+        for _ in range(exchangeCount):
+            start = time.perf_counter()
+            client.write(message)
+            received = 0
+            while received < messageSize:
+                received += len(client.read(interfaceTcp.TcpAbc.TIMEOUT_LIMIT))
+            roundTrip.append(time.perf_counter() - start)
+
+        stop.set()
+        echoThread.join()
+        start = time.perf_counter()
+        client.close()
+        server.close()
+        closeTime = time.perf_counter() - start
+
+        print('{:<8s}: round trip median {:8.1f} us, p99 {:8.1f} us, max {:8.1f} us; close {:8.1f} ms'.\
+              format(engine.name.lower(),
+                     statistics.median(roundTrip) * 1e6,
+                     _percentile(roundTrip, 0.99) * 1e6,
+                     max(roundTrip) * 1e6,
+                     closeTime * 1e3))
+
+def _drain(server, total, done):
+    received = 0
+    while received < total:
+        if server.ring is not None:
+            numByte = len(server.peek(interfaceTcp.TcpAbc.TIMEOUT_LIMIT))
+            server.consume(numByte)
+        else:
+            numByte = len(server.read(interfaceTcp.TcpAbc.TIMEOUT_LIMIT))
+        received += numByte
+    done.set()
+
+def _transfer(server, client, payload, count, scatter = True):
+    done = threading.Event()
+    header = 'VX!DATA {:d} '.format(payload.size).encode()
+    total = count * (len(header) + payload.size + 1)
+    drainThread = threading.Thread(target = _drain, args = (server, total, done))
+    drainThread.start()
+    for _ in range(count):
+        if scatter:
+            client.write(header, payload, b'\n')
+        else:
+            client.write(header + payload.tobytes() + b'\n')
+    done.wait()
+    drainThread.join()
+    return total
+
+def benchmarkWrite(totalSize = 2 ** 25, traceSize = 2 ** 22):
+    ''' VX!DATA writes of numpy payload: header + payload concatenation vs scatter/gather buffers.
+        Allocated memory is peak of tracemalloc while traceSize bytes are transferred. '''
+    for idx, engine in enumerate(interfaceTcp.TcpEngine):
+        server, client = _openPair(engine, BENCHMARK_PORT + idx)
+        for payloadSize in (2 ** 13, 2 ** 20):
+            payload = np.random.randint(0, 256, payloadSize, dtype = np.uint8)
+            for scatter in (False, True):
+                count = max(1, totalSize // payloadSize)
+                start = time.perf_counter()
+                total = _transfer(server, client, payload, count, scatter)
+                rate = total / (time.perf_counter() - start)
+
+                count = max(1, traceSize // payloadSize)
+                tracemalloc.start()
+                total = _transfer(server, client, payload, count, scatter)
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+
+                print('{:<8s}: {:>4d} KiB {:<11s}: {:8.1f} MB/s, peak alloc {:8.1f} KiB/MB'.\
+                      format(engine.name.lower(), payloadSize // 1024,
+                             'scatter' if scatter else 'concatenate',
+                             rate / 1e6, peak / 1024 / (total / 1e6)))
+        client.close()
+        server.close()
+
+def benchmarkRead(totalSize = 2 ** 26, traceSize = 2 ** 22):
+    ''' Receiving of 1 MiB VX!DATA writes: queue of packets (one bytes object per receive) 
+        vs ring buffer filled with recv_into and drained by peek/consume. '''
+    payload = np.random.randint(0, 256, 2 ** 20, dtype = np.uint8)
+    for idx, engine in enumerate(interfaceTcp.TcpEngine):
+        for ringBuffer, readSize in ((False, 2 ** 10), (False, 2 ** 14), (True, 2 ** 14), (True, 2 ** 16)):
+            server, client = _openPair(engine, BENCHMARK_PORT + idx, ringBuffer, readSize)
+            start = time.perf_counter()
+            total = _transfer(server, client, payload, totalSize // payload.size)
+            rate = total / (time.perf_counter() - start)
+
+            tracemalloc.start()
+            total = _transfer(server, client, payload, traceSize // payload.size)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            client.close()
+            server.close()
+
+            print('{:<8s}: {:<5s} read {:>2d} KiB: {:8.1f} MB/s, peak alloc {:8.1f} KiB/MB'.\
+                  format(engine.name.lower(), 'ring' if ringBuffer else 'queue', readSize // 1024,
+                         rate / 1e6, peak / 1024 / (total / 1e6)))
+
+def benchmarkFanOut(broadcastCount = 200, messageSize = 256):
+    ''' Time from TcpMultiServer.write until every subscriber has received the message.
+        Slow subscriber never reads, its socket buffer fills and its queue grows until disconnection. '''
+    message = b't' * messageSize
+    for subscriberCount in (1, 8, 32, 63):
+        for slow in (False, True):
+            server = interfaceTcp.TcpMultiServer()
+            server.setAddress(BENCHMARK_IP, BENCHMARK_PORT)
+            server.open()
+            subscriber = []
+            for _ in range(subscriberCount):
+                client = interfaceTcp.TcpClient(interfaceTcp.TcpEngine.SELECTOR)
+                client.setAddress(BENCHMARK_IP, BENCHMARK_PORT)
+                client.setReadMode(ringBuffer = True)
+                client.open()
+                subscriber.append(client)
+            if slow:
+                slowClient = socket.create_connection((BENCHMARK_IP, BENCHMARK_PORT))
+                slowClient.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+            while server.clientCount() < subscriberCount + slow:
+                time.sleep(0.001)
+                
+            fanOut = []
+            for _ in range(broadcastCount):
+                start = time.perf_counter()
+                server.write(message)
+                for client in subscriber:
+                    client.readExactly(messageSize, interfaceTcp.TcpAbc.TIMEOUT_LIMIT)
+                fanOut.append(time.perf_counter() - start)
+            
+            for client in subscriber:
+                client.close()
+            if slow:
+                slowClient.close()
+            server.close()
+            print('{:>3d} subscribers{:<10s}: fan-out median {:8.1f} us, p99 {:8.1f} us'.\
+                  format(subscriberCount, ' + slow' if slow else '',
+                         statistics.median(fanOut) * 1e6, _percentile(fanOut, 0.99) * 1e6))
+
+BENCHMARK = {'latency': benchmarkLatency,
+             'write': benchmarkWrite,
+             'read': benchmarkRead,
+             'fanout': benchmarkFanOut}
+
+if __name__ == '__main__':
+    interfaceTcp.TcpLogger.LOGGING_ENABLE = False
+    for name in sys.argv[1:] or BENCHMARK.keys():
+        print('--- {} ---'.format(name))
+        BENCHMARK[name]()
@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+"""
+HISTORY:
+    Created on Sun Oct 18 18:12:40 2026
+
+Project: Vortex GUI
+
+Author: DIVE-LINK (www.dive-link.net), dive-link@mail.ru
+        Shustov Aleksey (SemperAnte), semte@semte.ru
+
+TODO:
+
+DESCRIPTION:
+    TransferManifest of uploaded image: its size is split into chunks of CHUNK_SIZE bytes,
+    every chunk has CRC-32 hash. Manifest is identified by id (hash of size and chunk hashes),
+    so other side keeps chunks received for the same image over link drops and restarts.
+
+    Manifest is sent by VX!MANI <size> <manifest>, other side answers by VX!HAVE <size> <bitmap>
+    of chunks it holds with matching hash, then only missing chunks are sent.
+    It is stored next to source file (FILE_SUFFIX) and rebuilt when source file is changed.
+
+    Hashing speed:
+        python transferManifest.py
+"""
+import json
+import os
+import struct
+import zlib
+
+import numpy as np
+
+class TransferManifest():
+
+    CHUNK_SIZE = 8192 # in bytes, equals UpperLayerConnector.CHUNK_SIZE_MIN, so chunks stay aligned
+    FILE_SUFFIX = '.manifest'
+    HEADER = struct.Struct('<QI') # image size, chunk size
+
+    def __init__(self, size: int, hashes: np.ndarray, chunkSize: int = CHUNK_SIZE):
+        self.size = size
+        self.chunkSize = chunkSize
+        self.hashes = np.asarray(hashes, dtype = '<u4')
+        self.id = zlib.crc32(self.hashes.tobytes(), zlib.crc32(self.HEADER.pack(size, chunkSize)))
+
+    @classmethod
+    def fromImage(cls, image: np.ndarray, chunkSize: int = CHUNK_SIZE):
+        view = memoryview(np.ascontiguousarray(image)).cast('B')
+        hashes = [zlib.crc32(view[x:x + chunkSize]) for x in range(0, len(view), chunkSize)]
+        return cls(len(view), hashes, chunkSize)
+
+    def __len__(self):
+        return self.hashes.size
+
+    def chunk(self, idx: int) -> tuple:
+        ''' offset and size of chunk '''
+        offset = idx * self.chunkSize
+        return offset, min(self.chunkSize, self.size - offset)
+
+    def verify(self, image, idx: int) -> bool:
+        ''' True if chunk of image (bytes-like of at least manifest size) matches its hash '''
+        offset, size = self.chunk(idx)
+        return zlib.crc32(memoryview(image).cast('B')[offset:offset + size]) == self.hashes[idx]
+
+    def missing(self, held: np.ndarray) -> list:
+        ''' (offset, end) byte ranges of chunks not held, held is bool array of chunks '''
+        ranges = []
+        for idx in np.flatnonzero(~held):
+            offset, size = self.chunk(int(idx))
+            if ranges and ranges[-1][1] == offset:
+                ranges[-1] = (ranges[-1][0], offset + size)
+            else:
+                ranges.append((offset, offset + size))
+        return ranges
+
+    def encode(self) -> bytes:
+        return self.HEADER.pack(self.size, self.chunkSize) + self.hashes.tobytes()
+
+    @classmethod
+    def decode(cls, payload):
+        ''' raise ValueError for broken manifest '''
+        payload = bytes(payload)
+        if len(payload) < cls.HEADER.size:
+            raise ValueError('Too short manifest.')
+        size, chunkSize = cls.HEADER.unpack_from(payload)
+        hashes = np.frombuffer(payload, dtype = '<u4', offset = cls.HEADER.size)
+        if chunkSize == 0 or hashes.size != -(-size // chunkSize):
+            raise ValueError('Wrong number of chunk hashes.')
+        return cls(size, hashes, chunkSize)
+
+    @staticmethod
+    def encodeHeld(held: np.ndarray) -> bytes:
+        ''' bitmap of VX!HAVE '''
+        return np.packbits(held, bitorder = 'little').tobytes()
+
+    def decodeHeld(self, bitmap) -> np.ndarray:
+        ''' bool array of chunks from VX!HAVE bitmap, raise ValueError for wrong size '''
+        held = np.unpackbits(np.frombuffer(bitmap, dtype = np.uint8), bitorder = 'little')
+        if held.size < len(self):
+            raise ValueError('Too short bitmap.')
+        return held[:len(self)].astype(bool)
+
+    def save(self, sourcePath: str):
+        ''' store manifest next to source file '''
+        record = {'size': self.size,
+                  'chunkSize': self.chunkSize,
+                  'sourceTime': os.stat(sourcePath).st_mtime_ns,
+                  'hashes': self.hashes.tolist()}
+        with open(sourcePath + self.FILE_SUFFIX, 'w') as file:
+            json.dump(record, file)
+
+    @classmethod
+    def load(cls, sourcePath: str):
+        ''' stored manifest of source file, None if it is missing, broken or source file is changed '''
+        try:
+            with open(sourcePath + cls.FILE_SUFFIX) as file:
+                record = json.load(file)
+            if record['sourceTime'] != os.stat(sourcePath).st_mtime_ns:
+                return None
+            manifest = cls(record['size'], record['hashes'], record['chunkSize'])
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+        if len(manifest) != -(-manifest.size // manifest.chunkSize):
+            return None
+        return manifest
+
+# test
+if __name__ == '__main__':
+
+    import tempfile
+    import time
+
+    image = np.random.randint(0, 256, 10 ** 6 + 123, dtype = np.uint8)
+    manifest = TransferManifest.fromImage(image)
+    assert len(manifest) == 123 and manifest.chunk(122) == (122 * 8192, 10 ** 6 + 123 - 122 * 8192)
+    decoded = TransferManifest.decode(manifest.encode())
+    assert decoded.id == manifest.id and np.array_equal(decoded.hashes, manifest.hashes)
+    held = np.ones(len(manifest), dtype = bool)
+    held[[0, 1, 5, 122]] = False
+    assert manifest.missing(held) == [(0, 2 * 8192), (5 * 8192, 6 * 8192), (122 * 8192, image.size)]
+    assert np.array_equal(manifest.decodeHeld(manifest.encodeHeld(held)), held)
+    assert manifest.verify(image, 7)
+    image[7 * 8192] ^= 1
+    assert not manifest.verify(image, 7)
+    with tempfile.TemporaryDirectory() as folder:
+        sourcePath = os.path.join(folder, 'image.png')
+        open(sourcePath, 'wb').close()
+        assert TransferManifest.load(sourcePath) is None
+        manifest.save(sourcePath)
+        assert TransferManifest.load(sourcePath).id == manifest.id
+        os.utime(sourcePath, ns = (0, 0))
+        assert TransferManifest.load(sourcePath) is None
+
+    image = np.random.randint(0, 256, 2 ** 26, dtype = np.uint8)
+    start = time.perf_counter()
+    manifest = TransferManifest.fromImage(image)
+    duration = time.perf_counter() - start
+    print('manifest of {:d} MiB: {:.1f} ms, {:.0f} MB/s, {:d} chunks'.\
+          format(image.size // 2 ** 20, duration * 1e3, image.size / duration / 1e6, len(manifest)))
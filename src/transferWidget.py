@@ -15,29 +15,48 @@ DESCRIPTION:
     TransferWidget
         signals:
             imageLoaded
+            sourceLoaded
             transferStarted
             transferStopped
+        slots:
+            showWriteBuffer
+            updateLinkRate
+            
+    Image data is compressed by payloadCodec in background thread after loading and after every
+    change of compression options, payload size, ratio and airtime at link rate are shown before sending.
+    Compression is off by default, it is chosen by user for modem decoding compressed data.
 """
 from PyQt5 import QtWidgets as qtw
 from PyQt5 import QtGui as qtg
 from PyQt5 import QtCore as qtc
 
-import matplotlib.image as mpimg
 import numpy as np
+import threading
+
+import payloadCodec
 
 class TransferWidget(qtw.QGroupBox):
     
     imageLoaded = qtc.pyqtSignal(np.ndarray)
+    sourceLoaded = qtc.pyqtSignal(str) # path of loaded image file
     transferStarted = qtc.pyqtSignal(np.ndarray)
     transferStopped = qtc.pyqtSignal()
+    payloadEncoded = qtc.pyqtSignal(int, np.ndarray) # from encoding thread: job number, payload
     
     WIDGET_TITLE = 'Modem options'
+    LINK_RATE = 1000.0 # bit/s, for airtime until modem reports its datarate
+    DEFAULT_COMPRESSION = payloadCodec.Compression.NONE # compressed data is decoded only by modems knowing it
+    DEFAULT_LEVEL = 9
+    DEFAULT_FILTER = payloadCodec.Filter.UP
     
     def __init__(self, parent = None):
         super().__init__(parent)
         
         self.imageSize = 0
         self.imageSource = []
+        self.payload = None # compressed imageSource
+        self.encodeJob = 0 # payload of older jobs is dropped
+        self.linkRate = self.LINK_RATE
         
         self._setupUi()
     
@@ -68,13 +87,38 @@ class TransferWidget(qtw.QGroupBox):
         self.stopButton = qtw.QPushButton('Stop')
         self.loadButton = qtw.QPushButton('Load')
         self.fileLabel = qtw.QLabel('No file')         
+        self.bufferLabel = qtw.QLabel('Buffered: 0 bytes')
+        
+        # compression options
+        self.compression = qtw.QComboBox()
+        self.compression.addItems([x.name.lower() for x in payloadCodec.Compression])
+        self.compression.setCurrentText(self.DEFAULT_COMPRESSION.name.lower())
+        self.level = qtw.QSpinBox()
+        self.filter = qtw.QComboBox()
+        self.filter.addItems([x.name.lower() for x in payloadCodec.Filter])
+        self.filter.setCurrentText(self.DEFAULT_FILTER.name.lower())
+        self.compressionWidget = qtw.QWidget()
+        self.compressionWidget.setLayout(qtw.QHBoxLayout())
+        self.compressionWidget.layout().setContentsMargins(0, 0, 0, 0)
+        self.compressionWidget.layout().addWidget(qtw.QLabel('Compression:'))
+        self.compressionWidget.layout().addWidget(self.compression)
+        self.compressionWidget.layout().addWidget(qtw.QLabel('Level:'))
+        self.compressionWidget.layout().addWidget(self.level)
+        self.compressionWidget.layout().addWidget(qtw.QLabel('Filter:'))
+        self.compressionWidget.layout().addWidget(self.filter)
+        self.payloadLabel = qtw.QLabel('Payload: 0 bytes')
+        self._changeCompression()
+        self.level.setValue(self.DEFAULT_LEVEL)
         
         self.setLayout(qtw.QGridLayout())
         self.layout().addWidget(self.typeWidget, 0, 0, 1, 2)
         self.layout().addWidget(self.loadButton, 1, 0)
         self.layout().addWidget(self.fileLabel, 1, 1)
-        self.layout().addWidget(self.startButton, 2, 0)
-        self.layout().addWidget(self.stopButton, 2, 1)      
+        self.layout().addWidget(self.compressionWidget, 2, 0, 1, 2)
+        self.layout().addWidget(self.payloadLabel, 3, 0, 1, 2)
+        self.layout().addWidget(self.startButton, 4, 0)
+        self.layout().addWidget(self.stopButton, 4, 1)      
+        self.layout().addWidget(self.bufferLabel, 5, 0, 1, 2)
         
         self.startButton.setEnabled(False)
         self.stopButton.setEnabled(False)
@@ -83,6 +127,11 @@ class TransferWidget(qtw.QGroupBox):
         self.loadButton.clicked.connect(self._openFile)
         self.startButton.clicked.connect(self._startTransfer)
         self.stopButton.clicked.connect(self._stopTransfer)
+        self.compression.currentIndexChanged.connect(self._changeCompression)
+        self.compression.currentIndexChanged.connect(self._encodePayload)
+        self.level.valueChanged.connect(self._encodePayload)
+        self.filter.currentIndexChanged.connect(self._encodePayload)
+        self.payloadEncoded.connect(self._showPayload)
       
     @qtc.pyqtSlot()
     def _openFile(self):
@@ -96,16 +145,19 @@ class TransferWidget(qtw.QGroupBox):
             qtw.QFileDialog.DontResolveSymlinks
         )
         if fileName:
+            import matplotlib.image as mpimg # only for loading, kept out of start up
             image = mpimg.imread(fileName) 
             if self._processImage(image):                 
                 self.fileLabel.setText(f'Size: {self.imageSize} bytes')
-                self.startButton.setEnabled(True)
                 self.stopButton.setEnabled(False)
+                self._encodePayload()
                 self.imageLoaded.emit(image)
+                self.sourceLoaded.emit(fileName)
             else:
                 self.fileLabel.setText('No file')
                 self.startButton.setEnabled(False)
                 self.stopButton.setEnabled(False)   
+                self.payload = None
         else:
             self.fileLabel.setText('No file')
             self.startButton.setEnabled(False)
@@ -143,6 +195,56 @@ class TransferWidget(qtw.QGroupBox):
         self.imageSource = np.concatenate((dataType, imageHeight, imageWidth, np.ravel(image))) 
         return True
             
+    @qtc.pyqtSlot()
+    def _changeCompression(self):
+        low, high = payloadCodec.LEVEL[payloadCodec.Compression[self.compression.currentText().upper()]]
+        self.level.setRange(low, high)
+        if low != high and not self.level.isEnabled(): # level was clamped by compression without levels
+            self.level.setValue(self.DEFAULT_LEVEL)
+        self.level.setEnabled(low != high)
+        
+    @qtc.pyqtSlot()
+    def _encodePayload(self):
+        ''' compress image data in background thread, start is enabled when payload is ready '''
+        if not len(self.imageSource):
+            return
+        self.encodeJob += 1
+        self.payload = None
+        self.startButton.setEnabled(False)
+        self.payloadLabel.setText('Payload: compressing ...')
+        args = (self.encodeJob, self.imageSource,
+                payloadCodec.Compression[self.compression.currentText().upper()],
+                self.level.value(),
+                payloadCodec.Filter[self.filter.currentText().upper()])
+        threading.Thread(target = self._encodeThread, args = args, daemon = True).start()
+        
+    def _encodeThread(self, job, data, compression, level, filt):
+        self.payloadEncoded.emit(job, payloadCodec.encode(data, compression, level, filt))
+        
+    @qtc.pyqtSlot(int, np.ndarray)
+    def _showPayload(self, job, payload):
+        if job != self.encodeJob: # options were changed meanwhile
+            return
+        self.payload = payload
+        self._showAirtime()
+        if not self.stopButton.isEnabled(): # no transfer is running
+            self.startButton.setEnabled(True)
+            
+    def _showAirtime(self):
+        if self.payload is None:
+            return
+        seconds = int(payloadCodec.airtime(self.payload.size, self.linkRate))
+        self.payloadLabel.setText(f'Payload: {self.payload.size} bytes, '
+                                  f'ratio {len(self.imageSource) / self.payload.size:.2f}, '
+                                  f'airtime {seconds // 60} min {seconds % 60} s at {self.linkRate:.0f} bit/s')
+        
+    @qtc.pyqtSlot(dict)
+    def updateLinkRate(self, info):
+        ''' airtime is estimated by datarate reported by modem '''
+        if info.get('datarate', 0) > 0:
+            self.linkRate = info['datarate']
+            self._showAirtime()
+        
     @qtc.pyqtSlot(str)
     def showError(self, text):
         qtw.QMessageBox.warning(
@@ -150,19 +252,28 @@ class TransferWidget(qtw.QGroupBox):
             'Transfer Error',
             text)    
     
+    @qtc.pyqtSlot(bool, int)
+    def showWriteBuffer(self, throttled, pending):
+        text = f'Buffered: {pending} bytes'
+        if throttled:
+            text += ' (waiting for link)'
+        self.bufferLabel.setText(text)
+    
     @qtc.pyqtSlot()
     def _startTransfer(self):
         self.typeWidget.setEnabled(False)
+        self.compressionWidget.setEnabled(False)
         self.startButton.setEnabled(False)
         self.stopButton.setEnabled(True)
         self.loadButton.setEnabled(False)
         
-        self.transferStarted.emit(self.imageSource)
+        self.transferStarted.emit(self.payload)
     
     @qtc.pyqtSlot()
     def _stopTransfer(self):
         self.typeWidget.setEnabled(True)
-        self.startButton.setEnabled(True)
+        self.compressionWidget.setEnabled(True)
+        self.startButton.setEnabled(self.payload is not None)
         self.stopButton.setEnabled(False)
         self.loadButton.setEnabled(True)
 
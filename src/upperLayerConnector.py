@@ -14,14 +14,86 @@ DESCRIPTION:
     
     VX?UVER
     VX?LVER
+    
+    Link is reestablished automatically after drop, versions and parameters are requested again
+    when it is up. Link state is shown by linkStateChanged: connecting, up, degraded, backoff, closed.
+    Info contains 'wirerate': (out, in) bit/s measured by interface, next to modem reported datarate.
+    
+    VX?CAPS follows versions: when other side answers it, image is uploaded by sliding window 
+    of VX!CHNK chunks (binary frames if agreed frame size is above zero), otherwise by stop-and-wait 
+    VX!DATA text commands of PACKET_SIZE. Modem without VX?CAPS support is waited for CAPS_TIMEOUT.
+    
+    Sliding window keeps up to WINDOW_SIZE chunks in flight, every chunk is acknowledged by 
+    VX!ACK <offset> and retransmitted after ACK_TIMEOUT. Chunk size starts at CHUNK_SIZE_MIN, 
+    doubles on every acknowledgement up to agreed frame size and halves on retransmission.
+    Upload progress and throughput are reported by transferProgressed.
+    
+    Windowed upload is resumable: VX!MANI sends TransferManifest (chunk hashes) of image, stored next to
+    source file set by setSourcePath, other side answers VX!HAVE bitmap of chunks it already holds,
+    only missing ones are sent. After link drop upload waits up to LINK_WAIT for reconnection and resumes.
+    
+    After startWorker() connector lives in own QThread: its slots are called by queued signals
+    and never block GUI thread. cancel() is called directly from any thread, it ends running request
+    within CANCEL_POLL and requests queued before it at their start (reported by requestCancelled).
+    cancel() queues its end after them, so later queued requests are still served.
+    Request without response is reported by requestTimedOut.
+    
+    Parameters confirmed by other side are mirrored, changeParameter sends only values differing
+    from mirror, all of them in one round trip: VX!MSET command if other side answers VX?CAPS,
+    otherwise pipelined burst of VX!<PARAM> commands followed by reading of their VX!OK. Value with space
+    is sent by own command in the same burst, empty value is not sent and is reported by errorShown.
+    Mirror is cleared when connection is (re)established, so requestAllParameter sets everything.
+    
+    Info is pushed by other side while subscribeInfo(True): VX!SUBSCRIBE INFO,STAT,IMBD <TELEMETRY_PERIOD>
+    is sent if other side answers VX?CAPS and is repeated after reconnection. Pushed commands are routed
+    to infoShown by every reading of responses, and by DISPATCH_INTERVAL timer while no request is running.
+    requestInfo polls info by VX?INFO, VX?STAT and VX?IMBD (VX?IMBL) round trips when other side doesn't push it.
+    
+    Bitmap of received image blocks is kept as blockBitmap.BlockBitmap and updated by VX!IMBD deltas
+    of blocks received after its sequence, if other side answers VX?CAPS, otherwise VX!IMBL sends whole one.
+    Delta not following the bitmap makes connector request VX?IMBD <sequence> again.
+    Info shows it as 'imblDelta': (reset, blockBitmap.RANGE array of newly received blocks), reset is True
+    when bitmap is started again, and whole VX!IMBL bitmap as 'imbl'.
+    
+    Stall benchmark, GUI thread event loop during transfer by worker and its cancel, max stall is asserted
+    below StallWatchdog.STALL_LIMIT:
+        python upperLayerConnector.py
 """
 from PyQt5 import QtCore as qtc
 
+import commandProcessor
+import commandRegistry
 import interfaceTcp
+import interfaceAsync
 import upperLayerEmulator
-import re
+import asyncio
+import blockBitmap
+import collections
+import functools
+import threading
+import time
+import transferManifest
 import numpy as np
 
+class _Cancelled(Exception):
+    pass
+
+def _cancellable(slot):
+    ''' slot of UpperLayerConnector ended by cancel(), slot queued before cancel() is ended at start '''
+    @functools.wraps(slot)
+    def wrapper(self, *args):
+        try:
+            if self.cancelEvent.is_set():
+                raise _Cancelled
+            return slot(self, *args)
+        except _Cancelled:
+            self.requestCancelled.emit(slot.__name__)
+        except IOError: # connection is closed by cancelling side
+            if not self.cancelEvent.is_set():
+                raise
+            self.requestCancelled.emit(slot.__name__)
+    return wrapper
+
 class UpperLayerConnector(qtc.QObject):
     
     layerVersionUpdated = qtc.pyqtSignal(str, str)
@@ -29,16 +101,89 @@ class UpperLayerConnector(qtc.QObject):
     connectionStatusChanged = qtc.pyqtSignal(bool)
     parameterAllRequested = qtc.pyqtSignal()
     infoShown = qtc.pyqtSignal(dict)
+    writeBufferChanged = qtc.pyqtSignal(bool, int)
+    linkStateChanged = qtc.pyqtSignal(str)
+    linkStateReceived = qtc.pyqtSignal(object) # from interface thread to _changeLinkState
+    logShown = qtc.pyqtSignal(str) # batch of interface log lines from log drain thread
+    transferProgressed = qtc.pyqtSignal(int, int, float) # acknowledged bytes, image bytes, bytes/s
+    requestTimedOut = qtc.pyqtSignal(str) # command without response
+    requestCancelled = qtc.pyqtSignal(str) # slot ended by cancel()
     
     TIMEOUT_LIMIT = 5.0
+    PACKET_SIZE = 8192 # in bytes, for image transfer via interface
+    FRAME_SIZE_MAX = 2 ** 20 # in bytes, max binary frame payload offered in VX?CAPS
+    CAPS_TIMEOUT = 1.0
+    WINDOW_SIZE = 8 # chunks in flight
+    CHUNK_SIZE_MIN = 8192 # in bytes
+    CHUNK_SIZE_MAX = 2 ** 18 # in bytes, for text VX!CHNK, binary ones are limited by agreed frame size
+    ACK_TIMEOUT = 2.0 # in seconds, chunk is retransmitted when not acknowledged
+    RETRANSMIT_LIMIT = 3 # per chunk, then connection is dropped
+    PROGRESS_INTERVAL = 0.1 # in seconds, min interval of transferProgressed
+    CANCEL_POLL = 0.05 # in seconds, waiting for response is checked for cancel this often
+    LINK_WAIT = 30.0 # in seconds, upload waits for reconnection after link drop and resumes
+    TELEMETRY_TOPICS = ('INFO', 'STAT', 'IMBD') # of VX!SUBSCRIBE
+    TELEMETRY_PERIOD = 2.0 # in seconds, as polling by InformationWidget
+    DISPATCH_INTERVAL = 20 # in ms, pushed info is read this often while no request is running
+    WRITE_HIGH_WATERMARK = 2 ** 18 # in bytes, producers wait when more data is pending for interface
     
     def __init__(self, testMode):  
         super().__init__()
         self.testMode = testMode
         self.con = interfaceTcp.TcpClient()
+        self.con.setReadMode(ringBuffer = True)
+        self.con.setWriteWatermark(self.WRITE_HIGH_WATERMARK)
+        self.con.setWatermarkCallback(self.writeBufferChanged.emit)
+        self.con.setReconnect(True)
+        self.con.setStateCallback(self._receiveLinkState)
+        self.linkStateReceived.connect(self._changeLinkState)
+        self.logSink = interfaceTcp.TcpLogDrain.instance().addSink(lambda lines: self.logShown.emit('\n'.join(lines)))
         self.connectionStatus = False
+        self.linkState = interfaceTcp.TcpState.CLOSED
+        self.linkLost = False
+        self.frameSize = 0 # agreed max binary frame payload, 0 for text commands
+        self.windowed = False # other side acknowledges VX!CHNK chunks
+        self.multiSet = False # other side accepts VX!MSET
+        self.imblDelta = False # other side answers VX?IMBD
+        self.imbl = blockBitmap.BlockBitmap() # received image blocks
+        self.parameter = {} # mirror of parameters confirmed by other side, key: value
+        self.sourcePath = None # of image, manifest is stored next to it
+        self.linkDrops = 0
+        self.cancelEvent = threading.Event() # set from cancel() until its queued end
+        self.cancelCount = 0 # cancel() calls not ended yet
+        self.cancelLock = threading.Lock()
+        self.thread = None # worker QThread
+        self.infoWanted = False # set by subscribeInfo
+        self.subscribed = False # other side pushes info
+        self.telemetryPrefix = {commandRegistry.SubscribeCommand.TOPIC[x].NAME for x in self.TELEMETRY_TOPICS}
+        self.dispatchTimer = qtc.QTimer(self) # child, so it is moved to worker thread with connector
+        self.dispatchTimer.setInterval(self.DISPATCH_INTERVAL)
+        self.dispatchTimer.timeout.connect(self._dispatchPending)
+        
+    def startWorker(self):
+        ''' move connector to own QThread, call before connecting signals '''
+        self.thread = qtc.QThread()
+        self.thread.setObjectName('UpperLayerConnector')
+        self.moveToThread(self.thread)
+        self.thread.start()
+        
+    def cancel(self):
+        ''' end running request and requests queued before, thread-safe, so call it directly 
+            instead of queued signal '''
+        with self.cancelLock:
+            self.cancelCount += 1
+            self.cancelEvent.set()
+        qtc.QMetaObject.invokeMethod(self, '_endCancel', qtc.Qt.QueuedConnection)
+        
+    @qtc.pyqtSlot()
+    def _endCancel(self):
+        ''' queued by cancel() after requests it ends '''
+        with self.cancelLock:
+            self.cancelCount -= 1
+            if not self.cancelCount:
+                self.cancelEvent.clear()
         
     @qtc.pyqtSlot(dict)
+    @_cancellable
     def requestConnection(self, request: dict):
         if request['action'] == 'Connection':
             if request['type'] == 'Hardware':
@@ -54,24 +199,14 @@ class UpperLayerConnector(qtc.QObject):
                         port = request['port']
                         
                     self.con.setAddress(ip, port)
+                    self.linkLost = False
                     self.con.open()
                     
-                    # read versions on connection
-                    res = self._requestParameter('VX?UVER', r'VX!UVER (.*)\n')
-                    if res:
-                        upperLayerVersion = res[0]
-                    else:
-                        return
-                    res = self._requestParameter('VX?LVER', r'VX!LVER (.*)\n')
-                    if res:
-                        lowerLayerVersion = res[0]
-                    else:
-                        return
-                      
-                    self.layerVersionUpdated.emit(upperLayerVersion, lowerLayerVersion)                    
-                    self.connectionStatus = True
-                    self.connectionStatusChanged.emit(self.connectionStatus)
-                    self.parameterAllRequested.emit()
+                    if self._requestVersion():
+                        self.parameter.clear()
+                        self.connectionStatus = True
+                        self.connectionStatusChanged.emit(self.connectionStatus)
+                        self.parameterAllRequested.emit()
                 elif request['protocol'] == 'Serial':
                     self.errorShown.emit('Serial connection is not supported yet.')
                 else:
@@ -81,52 +216,55 @@ class UpperLayerConnector(qtc.QObject):
             else:
                 raise ValueError('Wrong connection type.')
         elif request['action'] == 'Disconnection':
+            self._endSubscription()
             self.con.close()
             self.layerVersionUpdated.emit('not connected', 'not connected')
+            self.parameter.clear()
             self.connectionStatus = False
             self.connectionStatusChanged.emit(self.connectionStatus)
         else:
             raise ValueError
     
+    @qtc.pyqtSlot(str)
+    def setSourcePath(self, path: str):
+        ''' source file of next transferred image '''
+        self.sourcePath = path
+    
     @qtc.pyqtSlot(dict)
+    @_cancellable
     def changeParameter(self, parm):
-        for key, value in parm.items():            
-            if self.connectionStatus:
-                if key == 'id':
-                    self._setParameter('VX!ID', value)                    
-                elif key == 'name':
-                    self._setParameter('VX!NAME', value)
-                elif key == 'mode':
-                    self._setParameter('VX!MODE', value)
-                elif key == 'rob':
-                    self._setParameter('VX!ROB', value)
-                elif key == 'mdl':
-                    self._setParameter('VX!MDL', value)
-                elif key == 'rate':
-                    self._setParameter('VX!RATE', value)
-                elif key == 'blockSize':
-                    self._setParameter('VX!BLOCKSIZE', value)
-                elif key == 'transSize':
-                    self._setParameter('VX!TRANSSIZE', value)
-                elif key == 'powerLevel':
-                    self._setParameter('VX!POWERLEVEL', value)
-                else:
-                    raise ValueError
+        ''' values differing from mirror of other side are sent in one round trip '''
+        if not self.connectionStatus:
+            return
+        changed = {}
+        for key, value in parm.items():
+            if key not in commandRegistry.PARAMETER:
+                raise ValueError
+            if not str(value).strip(): # other side doesn't parse command without value
+                self.errorShown.emit('Parameter {} is not set, its value is empty.'.format(key))
+                continue
+            if key not in self.parameter or self.parameter[key] != value:
+                changed[key] = value
+        if changed and self._setParameters(changed):
+            self.parameter.update(changed)
                     
+    @qtc.pyqtSlot(bool)
+    @_cancellable
+    def subscribeInfo(self, enable: bool):
+        ''' info is pushed by other side while enabled, if it supports VX!SUBSCRIBE '''
+        self.infoWanted = enable
+        if self.connectionStatus:
+            self._subscribe()
+    
     @qtc.pyqtSlot()
+    @_cancellable
     def requestInfo(self):
-        res = self._requestParameter('VX?INFO', 
-                                     r'VX!INFO ([\d+-.e]+?) ([\d+-.e]+?) ([\d+-.e]+?) ([\d+-.e]+?)\n')
+        if self.subscribed: # pushed by other side
+            return
+        res = self._requestParameter(commandRegistry.InfoRequest(), commandRegistry.InfoCommand)
         d = None
         if res:
-            progress = int(res[0][0])
-            datarate = float(res[0][1])
-            ber = float(res[0][2])
-            bler = float(res[0][3])
-            d = {'progress': progress,
-                 'datarate': datarate,
-                 'ber': ber,
-                 'bler': bler}
+            d = self._info(res)
         else:
             return
         
@@ -134,89 +272,593 @@ class UpperLayerConnector(qtc.QObject):
         if res:
             d['stat'] = res            
             
-        res = self._requestImbl()
-        if res.size > 1:
-            d['imbl'] = res
+        if self.imblDelta:
+            res = self._requestImbd()
+            if res is not None:
+                d['imblDelta'] = res
+        else:
+            res = self._requestImbl()
+            if res.size > 1:
+                d['imbl'] = res
         
         if d is not None:
             self.infoShown.emit(d)
     
     @qtc.pyqtSlot(np.ndarray)
+    @_cancellable
     def startTransfer(self, image):
-        PACKET_SIZE = 8192 # in bytes, for transfer via interface
-        for packNum in np.arange(np.ceil(image.size / PACKET_SIZE)).astype(int):
-            packNum = int(packNum)
-            packByte = image[packNum * PACKET_SIZE:(packNum + 1) * PACKET_SIZE]
-            packByte = packByte.tobytes()
-            s = 'VX!DATA {:d} '.format(len(packByte)).encode() + packByte + b'\n'
-            self.con.write(s)
-            self._waitOkResponse(b'VX!DATA ...')
-        self._setParameter('VX!START')
+        image = np.ravel(image)
+        progress = _TransferProgress(self.transferProgressed, image.size, self.PROGRESS_INTERVAL)
+        if self.windowed:
+            if not self._uploadResumable(image, progress):
+                return
+        else:
+            for packNum in np.arange(np.ceil(image.size / self.PACKET_SIZE)).astype(int):
+                packNum = int(packNum)
+                packByte = image[packNum * self.PACKET_SIZE:(packNum + 1) * self.PACKET_SIZE]
+                if not self._writeDrained(commandRegistry.DataCommand(packByte)) or \
+                   not self._waitOkResponse(b'VX!DATA ...'):
+                    return
+                progress.update(packByte.size)
+        progress.update(0, True)
+        self._setParameter(commandRegistry.StartCommand())
         
     @qtc.pyqtSlot()
+    @_cancellable
     def stopTtransfer(self):
-        self._setParameter('VX!STOP')
+        self._setParameter(commandRegistry.StopCommand())
+        
+    def _receiveLinkState(self, state):
+        ''' called from interface thread '''
+        if state == interfaceTcp.TcpState.BACKOFF:
+            self.linkLost = True
+            self.linkDrops += 1
+        self.linkStateReceived.emit(state)
+        
+    @qtc.pyqtSlot(object)
+    @_cancellable
+    def _changeLinkState(self, state):
+        state = self.con.state # queued states could be outdated
+        if state == self.linkState:
+            return
+        self.linkState = state
+        self.linkStateChanged.emit(state.name.lower())
+        if state == interfaceTcp.TcpState.UP and self.linkLost and self.connectionStatus:
+            # replay handshake, other side could be restarted with other parameters
+            self.linkLost = False
+            if self._requestVersion():
+                self.parameter.clear()
+                self.parameterAllRequested.emit()
+        
+    def _requestVersion(self) -> bool:
+        res = self._requestParameter(commandRegistry.UverRequest(), commandRegistry.UverCommand)
+        if res:
+            upperLayerVersion = res.value
+        else:
+            return False
+        res = self._requestParameter(commandRegistry.LverRequest(), commandRegistry.LverCommand)
+        if res:
+            lowerLayerVersion = res.value
+        else:
+            return False
+        self.layerVersionUpdated.emit(upperLayerVersion, lowerLayerVersion)
+        self._requestCaps()
+        self._endSubscription() # it ends with connection
+        self._subscribe()
+        return True
+    
+    def _requestCaps(self):
+        ''' negotiate binary frames and windowed upload, missing response keeps text commands '''
+        self.frameSize = 0
+        self.con.write(commandRegistry.CapsRequest(self.FRAME_SIZE_MAX).encode())
+        res = commandRegistry.parse(self._read(self.con.readCommand, self.CAPS_TIMEOUT))
+        self.windowed = isinstance(res, commandRegistry.CapsCommand)
+        self.multiSet = self.windowed
+        self.imblDelta = self.windowed
+        if self.windowed:
+            self.frameSize = max(0, min(res.value, self.FRAME_SIZE_MAX))
+            
+    def _subscribe(self):
+        ''' (un)subscribe pushed info as wanted, missing response keeps polling by requestInfo '''
+        wanted = self.infoWanted and self.windowed # modem without VX?CAPS predates VX!SUBSCRIBE
+        if wanted == self.subscribed:
+            return
+        period = self.TELEMETRY_PERIOD if wanted else 0
+        self.con.write(commandRegistry.SubscribeCommand(self.TELEMETRY_TOPICS, period).encode())
+        res = commandRegistry.parse(self._read(self.con.readCommand, self.CAPS_TIMEOUT))
+        if not isinstance(res, commandRegistry.OkCommand):
+            wanted = False
+        self.subscribed = wanted
+        if wanted:
+            self.dispatchTimer.start()
+        else:
+            self.dispatchTimer.stop()
+            
+    def _endSubscription(self):
+        self.subscribed = False
+        self.dispatchTimer.stop()
+        
+    @qtc.pyqtSlot()
+    def _dispatchPending(self):
+        ''' pushed info received while no request is running, other commands are dropped '''
+        try:
+            while self.con.isOpened():
+                frame = self.con.readFrame(0)
+                if frame is None:
+                    break
+                self._dispatchTelemetry(frame)
+        except IOError: # link is dropped
+            pass
+        
+    def _dispatchTelemetry(self, data) -> bool:
+        ''' route pushed command (bytes or CommandFrame) to infoShown, False for other commands.
+            Bytes are read by readCommand, which returns binary frames in text form too. '''
+        if isinstance(data, commandProcessor.CommandFrame):
+            prefix = data.prefix
+        else:
+            prefix = data.split(b' ', 1)[0].rstrip(b'\n')
+        if prefix not in self.telemetryPrefix:
+            return False
+        if not isinstance(data, commandProcessor.CommandFrame):
+            data = commandProcessor.CommandProcessor().processFrame(data)[0]
+        res = commandRegistry.parseFrame(data)
+        if isinstance(res, commandRegistry.InfoCommand):
+            self.infoShown.emit(self._info(res))
+        elif isinstance(res, commandRegistry.StatCommand):
+            self.infoShown.emit({'stat': str(res.payload, 'utf-8')})
+        elif isinstance(res, commandRegistry.ImblCommand): # copy, frame is valid until next reading
+            imbl = np.frombuffer(res.payload, dtype = np.uint8).copy()
+            if imbl.size > 1:
+                self.infoShown.emit({'imbl': imbl})
+        elif isinstance(res, commandRegistry.ImbdCommand):
+            delta = self._applyImbd(res)
+            if delta is not None:
+                self.infoShown.emit({'imblDelta': delta})
+        return True
+    
+    def _info(self, res: commandRegistry.InfoCommand) -> dict:
+        stats = self.con.stats()
+        return {'progress': res.progress,
+                'datarate': res.datarate,
+                'ber': res.ber,
+                'bler': res.bler,
+                'wirerate': (stats['rateOut'] * 8, stats['rateIn'] * 8)}
+            
+    def _uploadResumable(self, image: np.ndarray, progress: '_TransferProgress') -> bool:
+        ''' send chunks missing at other side until whole image is held, False if connection is dropped '''
+        manifest = self._loadManifest(image)
+        while True:
+            linkDrops = self.linkDrops
+            held = self._requestHeld(manifest)
+            if held is not None:
+                ranges = manifest.missing(held)
+                progress.reset(image.size - sum(end - offset for offset, end in ranges))
+                if self._uploadWindowed(image, progress, ranges, linkDrops):
+                    return True
+            elif self.connectionStatus and self.linkDrops == linkDrops: # other side doesn't keep chunks
+                return self._uploadWindowed(image, progress, [(0, image.size)])
+            if not self.connectionStatus or not self._waitLinkUp():
+                return False
+            
+    def _loadManifest(self, image: np.ndarray) -> transferManifest.TransferManifest:
+        ''' manifest stored next to source file, it is built and stored when missing or outdated '''
+        manifest = None
+        if self.sourcePath:
+            manifest = transferManifest.TransferManifest.load(self.sourcePath)
+        # first chunk holds header of compressed data, so it differs for other compression options
+        if manifest is None or manifest.size != image.size or not manifest.verify(image, 0):
+            manifest = transferManifest.TransferManifest.fromImage(image)
+            if self.sourcePath:
+                try:
+                    manifest.save(self.sourcePath)
+                except OSError: # read-only folder, manifest is built again next time
+                    pass
+        return manifest
+    
+    def _requestHeld(self, manifest: transferManifest.TransferManifest) -> np.ndarray:
+        ''' bool array of manifest chunks held by other side, None if it doesn't answer VX!MANI '''
+        if not self._writeDrained(commandRegistry.ManifestCommand(manifest.encode()), resumable = True):
+            return None
+        while True: # late acknowledgements of chunks sent before link drop are skipped
+            frame = self._read(self.con.readFrame, self.CAPS_TIMEOUT)
+            if frame is None:
+                return None
+            res = commandRegistry.parseFrame(frame)
+            if isinstance(res, commandRegistry.HaveCommand):
+                try:
+                    return manifest.decodeHeld(res.payload)
+                except ValueError:
+                    return None
+            
+    def _waitLinkUp(self) -> bool:
+        ''' wait for reconnection up to LINK_WAIT, connection is dropped after it '''
+        deadline = time.monotonic() + self.LINK_WAIT
+        while self.con.state not in (interfaceTcp.TcpState.UP, interfaceTcp.TcpState.DEGRADED):
+            if time.monotonic() > deadline:
+                self._dropConnection('Can not connect to upper layer.\n\n Link is lost during transfer.')
+                return False
+            if self.cancelEvent.wait(self.CANCEL_POLL):
+                raise _Cancelled()
+        return True
+            
+    def _uploadWindowed(self, image: np.ndarray, progress: '_TransferProgress', ranges: list, 
+                        linkDrops: int = None) -> bool:
+        ''' send (offset, end) byte ranges of image by VX!CHNK chunks, False if connection is dropped
+            or link is dropped after linkDrops '''
+        chunkSizeMax = self.frameSize if self.frameSize else self.CHUNK_SIZE_MAX
+        chunkSize = min(self.CHUNK_SIZE_MIN, chunkSizeMax)
+        inFlight = collections.OrderedDict() # offset: _Chunk, in order of deadlines
+        ranges = collections.deque(ranges)
+        nextOffset, end = ranges.popleft() if ranges else (0, 0)
+        while nextOffset < end or inFlight:
+            if linkDrops is not None and self.linkDrops != linkDrops:
+                return False
+            while nextOffset < end and len(inFlight) < self.WINDOW_SIZE:
+                chunk = _Chunk(nextOffset, min(chunkSize, end - nextOffset))
+                if not self._sendChunk(image, chunk, linkDrops is not None):
+                    return False
+                inFlight[chunk.offset] = chunk
+                nextOffset += chunk.size
+                if nextOffset == end and ranges:
+                    nextOffset, end = ranges.popleft()
+            
+            timeout = max(0.001, next(iter(inFlight.values())).deadline - time.monotonic())
+            res = commandRegistry.parse(self._read(self.con.readCommand, timeout))
+            if isinstance(res, commandRegistry.AckCommand) and res.value in inFlight:
+                progress.update(inFlight.pop(res.value).size)
+                chunkSize = min(2 * chunkSize, chunkSizeMax)
+            
+            now = time.monotonic()
+            for chunk in [x for x in inFlight.values() if x.deadline <= now]:
+                if chunk.retransmit == self.RETRANSMIT_LIMIT:
+                    self.requestTimedOut.emit(commandRegistry.ChunkCommand.NAME.decode())
+                    self._dropConnection('Can not connect to upper layer.\n\n No acknowledgement for VX!CHNK {:d}.'.\
+                                         format(chunk.offset))
+                    return False
+                chunk.retransmit += 1
+                chunkSize = max(chunkSize // 2, self.CHUNK_SIZE_MIN)
+                if not self._sendChunk(image, chunk, linkDrops is not None):
+                    return False
+                inFlight.move_to_end(chunk.offset)
+        return True
+    
+    def _sendChunk(self, image: np.ndarray, chunk: '_Chunk', resumable: bool) -> bool:
+        payload = image[chunk.offset:chunk.offset + chunk.size]
+        if not self._writeDrained(commandRegistry.ChunkCommand(payload, chunk.offset), resumable):
+            return False
+        chunk.deadline = time.monotonic() + self.ACK_TIMEOUT
+        return True
+    
+    def _writeDrained(self, cmd: commandRegistry.Command, resumable: bool = False) -> bool:
+        ''' write command waiting for drain of interface up to TIMEOUT_LIMIT, False if it fails: it is reported
+            by requestTimedOut and connection is dropped, unless it is resumable and link is being reestablished '''
+        try:
+            self.con.write(*cmd.buffers(binary = self.frameSize > 0), timeout = self.TIMEOUT_LIMIT)
+        except IOError: # write timeout or closed connection
+            if self.cancelEvent.is_set():
+                raise _Cancelled()
+            self.requestTimedOut.emit(cmd.NAME.decode())
+            if not self.connectionStatus: # already dropped
+                return False
+            if resumable and self.con.isOpened() and \
+               self.con.state in (interfaceTcp.TcpState.BACKOFF, interfaceTcp.TcpState.CONNECTING):
+                return False
+            self._dropConnection('Can not connect to upper layer.\n\n Command {} is not sent.'.\
+                                 format(cmd.NAME.decode()))
+            return False
+        return True
         
     def _requestStat(self):
-        self.con.write(('VX?STAT\n').encode()) 
-        data = self.con.read(self.TIMEOUT_LIMIT)
-        if data[:7] == b'VX!STAT':                   
-            startIdx = data.index(b' ') + 1
-            endIdx = startIdx + data[startIdx:].index(b' ')
-            byteSize = data[startIdx:endIdx]
-            byteSize = int(byteSize)
-            commandSize = byteSize + endIdx + 1
-            res = data[endIdx + 1:commandSize]
-            return res.decode()
+        self.con.write(commandRegistry.StatRequest().encode()) 
+        res = self._readFrameCommand()
+        if isinstance(res, commandRegistry.StatCommand):                   
+            return str(res.payload, 'utf-8')
         else:
             raise IOError
             
     def _requestImbl(self):
-        self.con.write(('VX?IMBL\n').encode()) 
-        data = self.con.read(self.TIMEOUT_LIMIT)
-        if data[:7] == b'VX!IMBL':             
-            startIdx = data.index(b' ') + 1
-            endIdx = startIdx + data[startIdx:].index(b' ')
-            byteSize = data[startIdx:endIdx]
-            byteSize = int(byteSize)
-            commandSize = byteSize + endIdx + 1
-            res = data[endIdx + 1:commandSize]
-            res = np.frombuffer(res, dtype = np.uint8)
-            return res
+        self.con.write(commandRegistry.ImblRequest().encode()) 
+        res = self._readFrameCommand()
+        if isinstance(res, commandRegistry.ImblCommand): # copy, frame is valid until next reading
+            return np.frombuffer(res.payload, dtype = np.uint8).copy()
         else:
             raise IOError
 
-    def _requestParameter(self, req, pattern):
-        self.con.write((req + '\n').encode())       
-        data = self.con.read(self.TIMEOUT_LIMIT)
-        data = data.decode()
-        res = re.findall(pattern, data)
-        if not res:
-            self.con.close()
-            self.errorShown.emit('Can not connect to upper layer.\n\n No response for command {}.'.format(req))
-            self.connectionStatus = False
-            self.connectionStatusChanged.emit(self.connectionStatus)
+    def _requestImbd(self):
+        self.con.write(commandRegistry.ImbdRequest(self.imbl.seq).encode())
+        res = self._readFrameCommand()
+        if isinstance(res, commandRegistry.ImbdCommand):
+            return self._applyImbd(res)
+        else:
+            raise IOError
+        
+    def _applyImbd(self, res: commandRegistry.ImbdCommand):
+        ''' (reset, copy of ranges) of delta applied to bitmap, None if it is unchanged or delta doesn't
+            follow it, then pushed delta from bitmap sequence is requested '''
+        seq = self.imbl.seq
+        try:
+            ranges = self.imbl.apply(res.payload)
+        except ValueError:
+            return None
+        if ranges is None:
+            if self.subscribed: # answer is routed by _dispatchTelemetry
+                self.con.write(commandRegistry.ImbdRequest(self.imbl.seq).encode())
+            return None
+        if self.imbl.seq == seq:
+            return None
+        return self.imbl.base == 0, ranges.copy()
+
+    def _readFrameCommand(self):
+        frame = self._read(self.con.readFrame, self.TIMEOUT_LIMIT)
+        return commandRegistry.parseFrame(frame) if frame is not None else None
+    
+    def _read(self, read, timeout: float):
+        ''' read method of interface called in CANCEL_POLL slices until timeout, raise _Cancelled on cancel.
+            Pushed info is routed to infoShown while subscribed. '''
+        deadline = time.monotonic() + timeout
+        while True:
+            if self.cancelEvent.is_set():
+                raise _Cancelled()
+            remaining = deadline - time.monotonic()
+            res = read(max(0.0, min(self.CANCEL_POLL, remaining)))
+            if res and self.subscribed and self._dispatchTelemetry(res):
+                continue
+            if res or remaining <= self.CANCEL_POLL:
+                return res
+
+    def _requestParameter(self, req: commandRegistry.Command, responseType: type):
+        ''' return response command of responseType or None '''
+        self.con.write(req.encode())       
+        res = self._readResponse(req.NAME.decode())
+        if not isinstance(res, responseType):
+            self._dropConnection('Can not connect to upper layer.\n\n No response for command {}.'.\
+                                 format(req.NAME.decode()))
+            return None
         return res
             
-    def _setParameter(self, cmd, value = None):
-        if value is None:
-            cmd = cmd + '\n'
-            cmd = cmd.encode()
-        else:
-            value = str(value)
-            cmd = cmd + ' ' + value.upper() + '\n'
-            cmd = cmd.encode()
+    def _setParameter(self, cmd: commandRegistry.Command):
+        cmd = cmd.encode()
         self.con.write(cmd)
         self._waitOkResponse(cmd)
                     
-    def _waitOkResponse(self, cmd):
-        data = self.con.read(self.TIMEOUT_LIMIT)
-        if not data == b'VX!OK\n':               
-            self.con.close()
-            self.errorShown.emit('Can not connect to upper layer.\n\n No ok acknowledgement for command {}.'.\
+    def _setParameters(self, parm: dict) -> bool:
+        ''' set parameters by one VX!MSET or by pipelined burst, False if connection is dropped.
+            Values not fitting VX!MSET (e.g. name with space) are sent by own commands in the same burst. '''
+        cmds = [commandRegistry.PARAMETER[key](value) for key, value in parm.items()]
+        batch = [x for x in cmds if commandRegistry.MultiSetCommand.fits(x)]
+        if self.multiSet and len(batch) > 1:
+            cmds = [commandRegistry.MultiSetCommand(batch)] + \
+                   [x for x in cmds if not commandRegistry.MultiSetCommand.fits(x)]
+        cmds = [x.encode() for x in cmds]
+        self.con.write(*cmds)
+        return all(self._waitOkResponse(x) for x in cmds)
+        
+    def _readResponse(self, name: str):
+        ''' next response command, late acknowledgements of retransmitted chunks are skipped,
+            None on timeout is reported by requestTimedOut '''
+        while True:
+            data = self._read(self.con.readCommand, self.TIMEOUT_LIMIT)
+            if not data:
+                self.requestTimedOut.emit(name)
+                return None
+            res = commandRegistry.parse(data)
+            if not isinstance(res, commandRegistry.AckCommand):
+                return res
+                    
+    def _waitOkResponse(self, cmd) -> bool:
+        res = self._readResponse(bytes(cmd).split(b' ')[0].strip().decode())
+        if not isinstance(res, commandRegistry.OkCommand):               
+            self._dropConnection('Can not connect to upper layer.\n\n No ok acknowledgement for command {}.'.\
                                  format(cmd.decode()))
-            self.connectionStatus = False
-            self.connectionStatusChanged.emit(self.connectionStatus)
+            return False
+        return True
+            
+    def _dropConnection(self, message: str):
+        self._endSubscription()
+        self.con.close()
+        self.errorShown.emit(message)
+        self.connectionStatus = False
+        self.connectionStatusChanged.emit(self.connectionStatus)
     
     def close(self):
-        self.con.close()    
\ No newline at end of file
+        ''' call from thread created connector, worker is stopped after running request is cancelled '''
+        if self.thread is not None:
+            self.cancel()
+            self.thread.quit()
+            self.thread.wait()
+            self.thread = None
+        self.con.close()
+        interfaceTcp.TcpLogDrain.instance().removeSink(self.logSink)
+
+class _Chunk():
+    ''' image chunk in flight of windowed upload '''
+    
+    __slots__ = ('offset', 'size', 'deadline', 'retransmit')
+    
+    def __init__(self, offset: int, size: int):
+        self.offset = offset
+        self.size = size
+        self.deadline = 0.0
+        self.retransmit = 0
+        
+class _TransferProgress():
+    ''' emits transferProgressed signal at most every interval '''
+    
+    def __init__(self, signal, total: int, interval: float):
+        self.signal = signal
+        self.total = total
+        self.interval = interval
+        self.done = 0
+        self.start = time.monotonic()
+        self.last = self.start
+        
+    def reset(self, done: int):
+        ''' bytes already held by other side when upload is resumed '''
+        self.done = done
+        self.update(0, True)
+        
+    def update(self, numByte: int, force: bool = False):
+        self.done += numByte
+        now = time.monotonic()
+        if force or now - self.last >= self.interval:
+            self.last = now
+            rate = self.done / (now - self.start) if now > self.start else 0.0
+            self.signal.emit(self.done, self.total, rate)
+
+class AsyncUpperLayerConnector():
+    ''' asyncio counterpart of UpperLayerConnector for scripted test rigs, runs without Qt.
+        Exchanges on one connection are serialized, any number of connectors can run concurrently. '''
+    
+    TIMEOUT_LIMIT = UpperLayerConnector.TIMEOUT_LIMIT
+    PACKET_SIZE = UpperLayerConnector.PACKET_SIZE
+    
+    def __init__(self):
+        self.con = interfaceAsync.AsyncTcpClient()
+        self.lock = asyncio.Lock()
+        
+    async def connect(self, ip: str, port: int) -> tuple:
+        ''' open connection, return (upperLayerVersion, lowerLayerVersion) '''
+        self.con.setAddress(ip, port)
+        await self.con.open()
+        upperLayerVersion = await self._request(commandRegistry.UverRequest(), commandRegistry.UverCommand)
+        lowerLayerVersion = await self._request(commandRegistry.LverRequest(), commandRegistry.LverCommand)
+        return upperLayerVersion.value, lowerLayerVersion.value
+    
+    async def changeParameter(self, parm: dict):
+        for key, value in parm.items():
+            if key in commandRegistry.PARAMETER:
+                await self._request(commandRegistry.PARAMETER[key](value), commandRegistry.OkCommand)
+            else:
+                raise ValueError
+            
+    async def requestInfo(self) -> dict:
+        res = await self._request(commandRegistry.InfoRequest(), commandRegistry.InfoCommand)
+        d = {'progress': res.progress,
+             'datarate': res.datarate,
+             'ber': res.ber,
+             'bler': res.bler}
+        res = await self._request(commandRegistry.StatRequest(), commandRegistry.StatCommand)
+        d['stat'] = res.payload.decode()
+        res = await self._request(commandRegistry.ImblRequest(), commandRegistry.ImblCommand)
+        res = np.frombuffer(res.payload, dtype = np.uint8)
+        if res.size > 1:
+            d['imbl'] = res
+        return d
+    
+    async def startTransfer(self, image: np.ndarray):
+        for packNum in range(int(np.ceil(image.size / self.PACKET_SIZE))):
+            packByte = image[packNum * self.PACKET_SIZE:(packNum + 1) * self.PACKET_SIZE]
+            await self._request(commandRegistry.DataCommand(packByte), commandRegistry.OkCommand)
+        await self._request(commandRegistry.StartCommand(), commandRegistry.OkCommand)
+        
+    async def stopTransfer(self):
+        await self._request(commandRegistry.StopCommand(), commandRegistry.OkCommand)
+        
+    def close(self):
+        self.con.close()
+        
+    async def _request(self, cmd: commandRegistry.Command, responseType: type):
+        ''' send command and return response command of responseType '''
+        async with self.lock:
+            self.con.write(*cmd.buffers())
+            res = commandRegistry.parse(await self.con.readCommand(self.TIMEOUT_LIMIT))
+        if not isinstance(res, responseType):
+            raise IOError('No response for command {}.'.format(cmd.NAME.decode()))
+        return res
+        
+# stall benchmark
+if __name__ == '__main__':
+    
+    import sys
+    import utility
+    
+    class _Requester(qtc.QObject):
+        connectionRequested = qtc.pyqtSignal(dict)
+        transferStarted = qtc.pyqtSignal(np.ndarray)
+        
+    IMAGE_SIZE = 2 ** 23
+    
+    interfaceTcp.TcpLogger.LOGGING_ENABLE = False
+    app = qtc.QCoreApplication(sys.argv)
+    upperLayerEmulator.UpperLayerEmulator.REPLY_DELAY = 0.02
+    emulator = upperLayerEmulator.UpperLayerEmulator()
+    emulator.open()
+    
+    def testCancelQueued():
+        ''' transfer queued before cancel() isn't started, the one queued after it is served '''
+        connector = UpperLayerConnector(True)
+        connector.requestConnection({'action': 'Connection', 'type': 'Hardware', 'protocol': 'TCPIP'})
+        connector.thread = qtc.QThread() # started after requests are queued, so none of them is running
+        connector.moveToThread(connector.thread)
+        requester = _Requester()
+        requester.transferStarted.connect(connector.startTransfer)
+        cancelled = []
+        finished = []
+        connector.requestCancelled.connect(cancelled.append)
+        connector.transferProgressed.connect(lambda numByte, total, rate: numByte == total and finished.append(total))
+        requester.transferStarted.emit(np.zeros(2 ** 16, dtype = np.uint8))
+        connector.cancel()
+        requester.transferStarted.emit(np.zeros(2 ** 15, dtype = np.uint8))
+        connector.thread.start()
+        deadline = time.monotonic() + 10.0
+        while not finished and time.monotonic() < deadline:
+            app.processEvents()
+            time.sleep(0.01)
+        connector.close()
+        assert cancelled == ['startTransfer'] and finished == [2 ** 15], (cancelled, finished)
+        
+    testCancelQueued()
+    connector = UpperLayerConnector(True)
+    connector.startWorker()
+    requester = _Requester()
+    requester.connectionRequested.connect(connector.requestConnection)
+    requester.transferStarted.connect(connector.startTransfer)
+    watchdog = utility.StallWatchdog()
+    images = [np.random.randint(0, 256, IMAGE_SIZE, dtype = np.uint8) for _ in range(2)]
+    start = 0.0
+    stalls = {} # GUI thread max stall of transfer and of cancelled one
+    
+    def transfer(status):
+        global start
+        if status:
+            start = time.perf_counter()
+            watchdog.start()
+            requester.transferStarted.emit(images.pop(0))
+        
+    def progress(numByte, total, rate):
+        global start
+        if numByte == total and 'transfer' not in stalls:
+            print('transfer {:d} MiB: {:.2f} s, GUI thread max stall {:.1f} ms, stalls above {:.0f} ms {:d}'.\
+                  format(total // 2 ** 20, time.perf_counter() - start, watchdog.maxStall * 1e3,
+                         watchdog.STALL_LIMIT * 1e3, watchdog.stallCount))
+            stalls['transfer'] = watchdog.maxStall
+            # other image, so it isn't held by other side already, is cancelled as soon as its upload is running
+            watchdog.start()
+            requester.transferStarted.emit(images.pop(0))
+        elif numByte < total and 'transfer' in stalls and 'cancel' not in stalls:
+            stalls['cancel'] = 0.0
+            start = time.perf_counter()
+            connector.cancel() # direct call, worker is busy
+        elif numByte == total:
+            print('transfer finished before cancel')
+            stalls['cancel'] = watchdog.maxStall
+            app.quit()
+            
+    def cancelled(name):
+        print('{} cancelled in {:.1f} ms, GUI thread max stall {:.1f} ms'.\
+              format(name, (time.perf_counter() - start) * 1e3, watchdog.maxStall * 1e3))
+        stalls['cancel'] = watchdog.maxStall
+        watchdog.stop()
+        app.quit()
+    
+    connector.connectionStatusChanged.connect(transfer)
+    connector.transferProgressed.connect(progress)
+    connector.requestCancelled.connect(cancelled)
+    connector.errorShown.connect(lambda text: (print(text), app.quit()))
+    requester.connectionRequested.emit({'action': 'Connection', 'type': 'Hardware', 'protocol': 'TCPIP',
+                                        'ip': '', 'port': 0})
+    app.exec()
+    connector.close()
+    emulator.close()
+    for name, stall in stalls.items():
+        assert stall < watchdog.STALL_LIMIT, '{} stalls GUI thread for {:.1f} ms'.format(name, stall * 1e3)
@@ -11,13 +11,37 @@ Author: DIVE-LINK (www.dive-link.net), dive-link@mail.ru
 TODO:
     
 DESCRIPTION:
+    REPLY_DELAY emulates round trip of acoustic link: replies are sent by timer of TcpSelectorLoop,
+    so receiving of next commands is not delayed.
+    
+    Image received by VX!CHNK chunks is kept for VX!MANI manifest of the same image over link drops,
+    so upload is resumed. DROP_LINK_AFTER injects link drop during upload, AsyncUpperLayerEmulator
+    reopens its AsyncTcpServer on event loop then.
+    Received image is decompressed by payloadCodec on VX!START.
+    
+    VX!SUBSCRIBE makes emulator push telemetry (VX!INFO, VX!STAT, VX!IMBL) to subscribed client by timer
+    of TcpSelectorLoop, subscription ends when connection is closed or link is dropped.
+    AsyncUpperLayerEmulator runs delayed replies and pushes by timer of its event loop instead,
+    asyncio transport is written by loop thread only.
+    
+    Acoustic transfer after VX!START is emulated by image blocks received up to progress, lost with BLER.
+    VX?IMBD <base> is answered by blockBitmap delta of blocks received after base, pushed VX!IMBD
+    follows the last one sent to subscriber and is skipped when no block is received since then.
+    
+    Benchmark of image upload by UpperLayerConnector, stop-and-wait vs sliding window:
+        python upperLayerEmulator.py
 """
+import asyncio
+import concurrent.futures
 import numpy as np
-import re
 import threading
 
+import blockBitmap
+import commandRegistry
 import interfaceTcp
-import commandProcessor
+import interfaceAsync
+import payloadCodec
+import transferManifest
 
 class UpperLayerEmulator():
     
@@ -28,15 +52,43 @@ class UpperLayerEmulator():
     LOWER_LAYER_VERSION = '0.39 emu'
     
     TIMEOUT_LIMIT = 1.0
+    FRAME_SIZE_MAX = 2 ** 20 # in bytes, max binary frame payload offered in VX!CAPS
+    REPLY_DELAY = 0.0 # in seconds
+    DROP_LINK_AFTER = 0 # in VX!CHNK chunks, link is dropped once after them when above zero
+    
+    # serve several clients (e.g. monitoring GUIs and logger) at once, responses go to requesting client
+    MULTI_CLIENT = False
             
     def open(self):
-        self.server = interfaceTcp.TcpServer()
-        self.server.setAddress(self.EMULATOR_IP, self.EMULATOR_PORT)
-        self.server.open()
-        self.thread = threading.Thread(target = self._service)
-        self.thread.start()
+        self._resetState()
+        self._openServer()
         
-        self.commandProcessor = commandProcessor.CommandProcessor()
+    def _openServer(self):
+        if self.MULTI_CLIENT:
+            self.server = interfaceTcp.TcpMultiServer()
+            self.server.setAddress(self.EMULATOR_IP, self.EMULATOR_PORT)
+            self.server.setPayloadSink(commandRegistry.DataCommand.NAME, self._streamData)
+            self.server.setCommandHandler(self._processPeerCommand)
+            self.server.open()
+            self.thread = None
+        else:
+            self.server = interfaceTcp.TcpServer()
+            self.server.setAddress(self.EMULATOR_IP, self.EMULATOR_PORT)
+            self.server.setReadMode(ringBuffer = True)
+            self.server.setPayloadSink(commandRegistry.DataCommand.NAME, self._streamData)
+            self.server.open()
+            self.thread = threading.Thread(target = self._service)
+            self.thread.start()
+            
+    def dropLink(self):
+        ''' emulate lost link: server is reopened, received image is kept '''
+        self.subscription = None
+        self.close()
+        self._openServer()
+        
+    def _resetState(self):
+        self.peer = None # client of multi-client server sent current command
+        self.frameSize = 0 # agreed max binary frame payload, 0 for text commands
         
         self.id = None
         self.name = None
@@ -48,6 +100,12 @@ class UpperLayerEmulator():
         self.transSize = None
         self.powerLevel = None
         self.imageSource = None
+        self.imageBuffer = np.empty(0, dtype = np.uint8) # grows by doubling, imageSource is its filled part
+        self.imageSize = 0
+        self.imageData = None # decompressed imageSource
+        self.manifest = None # of image received by chunks
+        self.chunkReceived = np.zeros(0, dtype = bool) # per manifest chunk, verified by VX!HAVE reply
+        self.chunkCount = 0 # received VX!CHNK chunks, for DROP_LINK_AFTER
         self.start = None
         self.stop = None
         self.progress = 0
@@ -55,119 +113,388 @@ class UpperLayerEmulator():
         self.ber = 2.35e-3
         self.bler = 1.34e-2
         self.stat = '        Pack N|     TX, bytes|    ACK, bytes|         Total|   Rate, bit\s|'
+        self.blockStamp = np.zeros(0, dtype = np.uint32) # per image block sequence of receiving, 0 for missing
+        self.blockNext = 0 # first block not received yet
+        self.blockSeq = 0 # of last change of blocks
+        self.blockReset = 0 # sequence of VX!START, older bases are answered by full delta
+        self.pushedSeq = 0 # of last VX!IMBD sent to subscriber
+        self.subscription = None # SubscribeCommand of pushed telemetry
+        self.subscriber = None # peer of multi-client server
+        self.subscriptionId = 0 # timer chain of older subscription stops when it differs
+        self.pushLock = threading.Lock()
             
     def close(self):        
         if self.server is not None:
             self.server.close()
             self.server = None
-            self.thread.join()
+            if self.thread is not None:
+                self.thread.join()
             
     def _service(self):
         while True:
-            data = self.server.read(self.TIMEOUT_LIMIT)
-            commandFound = self.commandProcessor.process(data)
-            for data in commandFound:
-                if data == b'VX?UVER\n':
-                    self.server.write('VX!UVER {}\n'.format(self.UPPER_LAYER_VERSION).encode())
-                elif data == b'VX?LVER\n':
-                    self.server.write('VX!LVER {}\n'.format(self.LOWER_LAYER_VERSION).encode())
-                elif data[:7] == b'VX!DATA':                   
-                    startIdx = data.index(b' ') + 1
-                    endIdx = startIdx + data[startIdx:].index(b' ')
-                    byteSize = data[startIdx:endIdx]
-                    byteSize = int(byteSize)
-                    commandSize = byteSize + endIdx + 1
-                    res = data[endIdx + 1:commandSize]
-                    res = np.frombuffer(res, dtype = np.uint8)
-                    if self.imageSource is None:
-                        self.imageSource = res
-                    else:
-                        self.imageSource = np.concatenate((self.imageSource, res))
-                else:                
-                    data = data.decode(encoding="ascii", errors="ignore")
-                    res = re.findall(r'VX!ID (\d+)\n', data)
-                    if res:
-                        self.id = int(res[0])
-                        print('id = {}'.format(self.id))
-                        self.server.write(b'VX!OK\n')
-                        
-                    res = re.findall(r'VX!NAME (\w+)\n', data)
-                    if res:
-                        self.name = res[0]
-                        print('name = {}'.format(self.name))
-                        self.server.write(b'VX!OK\n')
-                        
-                    res = re.findall(r'VX!MODE (\w+)\n', data)
-                    if res:
-                        self.mode = res[0].capitalize()
-                        print('mode = {}'.format(self.mode))
-                        self.server.write(b'VX!OK\n')
-                        
-                    res = re.findall(r'VX!ROB (\w)\n', data)                
-                    if res:
-                        self.rob = res[0]
-                        print('rob = {}'.format(self.rob))
-                        self.server.write(b'VX!OK\n')
-                        
-                    res = re.findall(r'VX!MDL (\w+)\n', data)                
-                    if res:
-                        self.mdl = res[0]
-                        print('mdl = {}'.format(self.mdl))
-                        self.server.write(b'VX!OK\n')
-                        
-                    res = re.findall(r'VX!RATE ([\d/]+)\n', data)                
-                    if res:
-                        self.rate = res[0]
-                        print('rate = {}'.format(self.rate))
-                        self.server.write(b'VX!OK\n')
-                        
-                    res = re.findall(r'VX!BLOCKSIZE (\d+)\n', data)                
-                    if res:
-                        self.blockSize = res[0]
-                        print('blockSize = {}'.format(self.blockSize))
-                        self.server.write(b'VX!OK\n')
-                        
-                    res = re.findall(r'VX!TRANSSIZE (\d+)\n', data)                
-                    if res:
-                        self.transSize = res[0]
-                        print('transSize = {}'.format(self.transSize))
-                        self.server.write(b'VX!OK\n')
-                        
-                    res = re.findall(r'VX!POWERLEVEL (\d+)\n', data)                
-                    if res:
-                        self.powerLevel = res[0]
-                        print('powerLevel = {}'.format(self.powerLevel))
-                        self.server.write(b'VX!OK\n')
-                        
-                    if data == 'VX!START\n':
-                        self.server.write(b'VX!OK\n')
-                        
-                    if data == 'VX!STOP\n':
-                        print('stop transfer')
-                        self.server.write(b'VX!OK\n')
-                        
-                    if data == 'VX?INFO\n':
-                        print('request for info')
-                        data = 'VX!INFO {progress:d} {datarate:.1f} {ber:.2e} {bler:.2e}\n'.\
-                                                format(progress = self.progress,
-                                                       datarate = self.datarate,
-                                                       ber = self.ber,
-                                                       bler = self.bler)
-                        self.server.write(data.encode())
-                        if self.progress < 100:
-                            self.progress += 1
-                            
-                    if data == 'VX?STAT\n':                    
-                        data = 'VX!STAT {}\n'.format(self.stat)
-                        self.server.write(data.encode())
-            
-            if self.server is None:                
+            server = self.server
+            if server is None:
                 break
+            try:
+                frame = server.readFrame(self.TIMEOUT_LIMIT)
+            except IOError: # closed during reading
+                break
+            if frame is not None:
+                self._dispatch(commandRegistry.parseFrame(frame))
+            
+    def _processPeerCommand(self, peer: interfaceTcp.TcpPeer, data: bytes):
+        self.peer = peer
+        self._processCommand(data)
+        
+    def _reply(self, data: bytes):
+        peer = self.peer
+        if self.REPLY_DELAY > 0:
+            self._callLater(self.REPLY_DELAY, lambda: self._send(peer, data))
+        else:
+            self._send(peer, data)
+            
+    def _callLater(self, delay: float, callback):
+        ''' run callback after delay in seconds by timer of TcpSelectorLoop '''
+        interfaceTcp.TcpSelectorLoop.instance().callLater(delay, callback)
+            
+    def _send(self, peer: interfaceTcp.TcpPeer, data: bytes):
+        server = self.server
+        if server is None or not server.isOpened(): # closed before delayed reply
+            return
+        if peer is not None:
+            server.writeTo(peer, data)
+        else:
+            server.write(data)
+            
+    def _processCommand(self, data: bytes):
+        self._dispatch(commandRegistry.parse(data))
+        
+    def _dispatch(self, command: commandRegistry.Command):
+        handler = self.COMMAND_HANDLER.get(type(command))
+        if handler is not None: # unknown and broken commands are ignored
+            handler(self, command)
+            
+    def _setParameter(self, command: commandRegistry.ParameterCommand):
+        self._storeParameter(command)
+        self._reply(b'VX!OK\n')
+        
+    def _setMultiParameter(self, command: commandRegistry.MultiSetCommand):
+        for parameter in command.parameters:
+            self._storeParameter(parameter)
+        self._reply(b'VX!OK\n')
+        
+    def _storeParameter(self, command: commandRegistry.ParameterCommand):
+        value = command.value
+        if command.KEY == 'mode':
+            value = value.capitalize()
+        setattr(self, command.KEY, value)
+        print('{} = {}'.format(command.KEY, value))
+        
+    def _replyVersion(self, command: commandRegistry.Command):
+        if isinstance(command, commandRegistry.UverRequest):
+            self._reply(commandRegistry.UverCommand(self.UPPER_LAYER_VERSION).encode())
+        else:
+            self._reply(commandRegistry.LverCommand(self.LOWER_LAYER_VERSION).encode())
+            
+    def _replyStart(self, command: commandRegistry.StartCommand):
+        if self.imageSource is not None:
+            try:
+                self.imageData = payloadCodec.decode(self.imageSource)
+                print('image {} bytes, decompressed {} bytes'.format(self.imageSource.size, self.imageData.size))
+            except ValueError as err:
+                self.imageData = None
+                print('broken image: {}'.format(err))
+        size = self.imageData.size - payloadCodec.IMAGE_HEADER_SIZE if self.imageData is not None else 0
+        with self.pushLock:
+            self.blockSeq += 1
+            self.blockReset = self.blockSeq
+            self.blockStamp = np.zeros(blockBitmap.blockCount(max(0, size)), dtype = np.uint32)
+            self.blockNext = 0
+            self.progress = 0
+        self._reply(b'VX!OK\n')
+        
+    def _replyStop(self, command: commandRegistry.StopCommand):
+        print('stop transfer')
+        self._reply(b'VX!OK\n')
+        
+    def _replyInfo(self, command: commandRegistry.InfoRequest):
+        print('request for info')
+        with self.pushLock:
+            data = self._telemetry('INFO')
+        self._reply(data)
+            
+    def _replyStat(self, command: commandRegistry.StatRequest):
+        with self.pushLock:
+            data = self._telemetry('STAT')
+        self._reply(data)
+        
+    def _replyImbl(self, command: commandRegistry.ImblRequest):
+        with self.pushLock:
+            data = self._telemetry('IMBL')
+        self._reply(data)
+        
+    def _replyImbd(self, command: commandRegistry.ImbdRequest):
+        with self.pushLock:
+            data = commandRegistry.ImbdCommand(self._blockDelta(command.value)).encode(binary = self.frameSize > 0)
+            if self.subscription is not None and self.peer is self.subscriber: # next push follows this delta
+                self.pushedSeq = self.blockSeq
+        self._reply(data)
+        
+    def _telemetry(self, topic: str) -> bytes:
+        ''' requested or pushed command of SubscribeCommand topic, call with pushLock '''
+        if topic == 'INFO':
+            data = commandRegistry.InfoCommand(self.progress, self.datarate, self.ber, self.bler).encode()
+            if self.progress < 100:
+                self.progress += 1
+                self._receiveBlocks()
+            return data
+        elif topic == 'STAT':
+            return commandRegistry.StatCommand(self.stat.encode()).encode(binary = self.frameSize > 0)
+        elif topic == 'IMBL':
+            bitmap = np.packbits(self.blockStamp > 0).tobytes() or b'\x00'
+            return commandRegistry.ImblCommand(bitmap).encode(binary = self.frameSize > 0)
+        else: # pushed IMBD, None when no block is received since last one
+            base = self.pushedSeq
+            if base == self.blockSeq:
+                return None
+            self.pushedSeq = self.blockSeq
+            return commandRegistry.ImbdCommand(self._blockDelta(base)).encode(binary = self.frameSize > 0)
+        
+    def _receiveBlocks(self):
+        ''' blocks up to progress are received, some of them are lost with BLER '''
+        end = self.blockStamp.size * self.progress // 100
+        if end > self.blockNext:
+            self.blockSeq += 1
+            received = np.random.random_sample(end - self.blockNext) >= self.bler
+            self.blockStamp[self.blockNext:end][received] = self.blockSeq
+            self.blockNext = end
+            
+    def _blockDelta(self, base: int) -> bytes:
+        ''' full delta from 0 for base unknown to emulator '''
+        if base > self.blockSeq or base < self.blockReset:
+            base = 0
+        return blockBitmap.encodeDelta(self.blockStamp, base, self.blockSeq)
+        
+    def _subscribe(self, command: commandRegistry.SubscribeCommand):
+        ''' no push of older subscription follows VX!OK '''
+        with self.pushLock:
+            self.subscriptionId += 1
+            self.subscription = command if command.period > 0 else None
+            self.subscriber = self.peer
+            self.pushedSeq = 0
+            self._reply(b'VX!OK\n')
+        if self.subscription is not None: # first push follows VX!OK
+            self._schedulePush(command.period, self.subscriptionId)
+            
+    def _schedulePush(self, period: float, job: int):
+        self._callLater(period, lambda: self._push(job))
+        
+    def _push(self, job: int):
+        ''' called by timer of _callLater every period of subscription job '''
+        with self.pushLock:
+            subscription = self.subscription
+            server = self.server
+            if job != self.subscriptionId or subscription is None:
+                return
+            if server is None or not server.hasConnection():
+                self.subscription = None
+                return
+            for topic in subscription.topics:
+                data = self._telemetry(topic)
+                if data is not None:
+                    self._send(self.subscriber, data)
+        self._schedulePush(subscription.period, job)
+        
+    def _replyCaps(self, command: commandRegistry.CapsRequest):
+        self.frameSize = max(0, min(command.value, self.FRAME_SIZE_MAX))
+        self._reply(commandRegistry.CapsCommand(self.frameSize).encode())
+        
+    def _receiveData(self, command: commandRegistry.DataCommand):
+        ''' payload is empty when it is already streamed to _streamData '''
+        if len(command.payload):
+            self._streamData(command.payload)
+        self.imageSource = self.imageBuffer[:self.imageSize]
+        self._reply(b'VX!OK\n')
+        
+    def _receiveChunk(self, command: commandRegistry.ChunkCommand):
+        ''' chunks can come in any order and repeatedly after retransmission '''
+        self.chunkCount += 1
+        if self.chunkCount == self.DROP_LINK_AFTER: # chunk is lost with link
+            threading.Thread(target = self.dropLink).start()
+            return
+        self._storeImage(command.offset, command.payload)
+        self.imageSource = self.imageBuffer[:self.imageSize]
+        if self.manifest is not None:
+            end = command.offset + len(command.payload)
+            self.chunkReceived[command.offset // self.manifest.chunkSize:-(-end // self.manifest.chunkSize)] = True
+        self._reply(commandRegistry.AckCommand(command.offset).encode())
+        
+    def _receiveManifest(self, command: commandRegistry.ManifestCommand):
+        ''' new image resets received chunks, held ones of the same image are verified by hash '''
+        try:
+            manifest = transferManifest.TransferManifest.decode(command.payload)
+        except ValueError:
+            return
+        if self.manifest is None or self.manifest.id != manifest.id:
+            self.manifest = manifest
+            self.chunkReceived = np.zeros(len(manifest), dtype = bool)
+            self.imageBuffer = np.empty(manifest.size, dtype = np.uint8)
+            self.imageSize = 0
+        for idx in np.flatnonzero(self.chunkReceived):
+            self.chunkReceived[idx] = self.manifest.verify(self.imageBuffer, int(idx))
+        held = transferManifest.TransferManifest.encodeHeld(self.chunkReceived)
+        self._reply(commandRegistry.HaveCommand(held).encode(binary = self.frameSize > 0))
+        
+    def _streamData(self, chunk: memoryview):
+        ''' payload chunk of VX!DATA, appended to image '''
+        self._storeImage(self.imageSize, chunk)
+        
+    def _storeImage(self, offset: int, chunk: memoryview):
+        ''' copy chunk once into image buffer at offset '''
+        size = offset + len(chunk)
+        if size > self.imageBuffer.size:
+            imageBuffer = np.empty(max(size, 2 * self.imageBuffer.size), dtype = np.uint8)
+            imageBuffer[:self.imageSize] = self.imageBuffer[:self.imageSize]
+            self.imageBuffer = imageBuffer
+        self.imageBuffer[offset:size] = np.frombuffer(chunk, dtype = np.uint8)
+        self.imageSize = max(self.imageSize, size)
             
     def __del__(self):
         self.close()
         
+    COMMAND_HANDLER = {commandRegistry.UverRequest: _replyVersion,
+                       commandRegistry.LverRequest: _replyVersion,
+                       commandRegistry.StartCommand: _replyStart,
+                       commandRegistry.StopCommand: _replyStop,
+                       commandRegistry.InfoRequest: _replyInfo,
+                       commandRegistry.StatRequest: _replyStat,
+                       commandRegistry.ImblRequest: _replyImbl,
+                       commandRegistry.ImbdRequest: _replyImbd,
+                       commandRegistry.SubscribeCommand: _subscribe,
+                       commandRegistry.CapsRequest: _replyCaps,
+                       commandRegistry.DataCommand: _receiveData,
+                       commandRegistry.ChunkCommand: _receiveChunk,
+                       commandRegistry.ManifestCommand: _receiveManifest,
+                       commandRegistry.MultiSetCommand: _setMultiParameter}
+    COMMAND_HANDLER.update(dict.fromkeys(commandRegistry.PARAMETER.values(), _setParameter))
+        
+class AsyncUpperLayerEmulator(UpperLayerEmulator):
+    ''' Emulator served by asyncio event loop, commands are handled right from data_received '''
+    
+    async def open(self):
+        self.loop = asyncio.get_running_loop()
+        self.reopen = None # future of reopening by last dropLink
+        self._resetState()
+        await self._openServer()
+        
+    async def _openServer(self):
+        self.server = interfaceAsync.AsyncTcpServer()
+        self.server.setAddress(self.EMULATOR_IP, self.EMULATOR_PORT)
+        self.server.setCommandHandler(self._processCommand)
+        await self.server.open()
+        
+    def dropLink(self) -> concurrent.futures.Future:
+        ''' emulate lost link: server is reopened by event loop, can be called from any thread.
+            Return future of reopening, it is kept in reopen too. '''
+        self.reopen = asyncio.run_coroutine_threadsafe(self._reopenServer(), self.loop)
+        return self.reopen
+    
+    async def _reopenServer(self):
+        self.subscription = None
+        self.close()
+        await self._openServer()
+        
+    def close(self):
+        if self.server is not None:
+            self.server.close()
+            self.server = None
+            
+    def _callLater(self, delay: float, callback):
+        ''' timer of event loop, can be started from any thread '''
+        self.loop.call_soon_threadsafe(self.loop.call_later, delay, callback)
+        
+# test of asyncio emulator and benchmark of image upload
 if __name__ == '__main__':
-    emu = UpperLayerEmulator()
-    emu.open()
-    emu.close()
+    
+    import time
+    from PyQt5 import QtCore as qtc
+    import upperLayerConnector
+    
+    interfaceTcp.TcpLogger.LOGGING_ENABLE = False
+    
+    async def testAsyncSubscribe():
+        ''' delayed replies and pushes of subscription are written by loop thread '''
+        AsyncUpperLayerEmulator.REPLY_DELAY = 0.005
+        emu = AsyncUpperLayerEmulator()
+        await emu.open()
+        writeThread = set()
+        write = emu.server.write
+        def threadWrite(*data):
+            writeThread.add(threading.current_thread())
+            write(*data)
+        emu.server.write = threadWrite
+        client = interfaceAsync.AsyncTcpClient()
+        client.setAddress(emu.EMULATOR_IP, emu.EMULATOR_PORT)
+        await client.open()
+        client.write(commandRegistry.SubscribeCommand(['INFO', 'STAT'], 0.01).encode())
+        assert await client.readCommand(1.0) == b'VX!OK\n'
+        pushed = [type(commandRegistry.parse(await client.readCommand(1.0))) for _ in range(6)]
+        assert pushed == [commandRegistry.InfoCommand, commandRegistry.StatCommand] * 3, pushed
+        client.write(commandRegistry.SubscribeCommand(['INFO'], 0).encode())
+        while await client.readCommand(1.0) != b'VX!OK\n': # pushes sent before VX!OK
+            pass
+        assert await client.readCommand(0.05) == b''
+        assert writeThread == {threading.current_thread()}, writeThread
+        client.close()
+        emu.close()
+        AsyncUpperLayerEmulator.REPLY_DELAY = 0.0
+        
+    async def testAsyncDropLink():
+        ''' AsyncTcpServer is reopened by link drop, chunk received before it is kept '''
+        AsyncUpperLayerEmulator.DROP_LINK_AFTER = 2
+        emu = AsyncUpperLayerEmulator()
+        await emu.open()
+        client = interfaceAsync.AsyncTcpClient()
+        client.setAddress(emu.EMULATOR_IP, emu.EMULATOR_PORT)
+        await client.open()
+        client.write(commandRegistry.ChunkCommand(b'abc', 0).encode())
+        assert await client.readCommand(1.0) == commandRegistry.AckCommand(0).encode()
+        client.write(commandRegistry.ChunkCommand(b'def', 3).encode()) # lost with link
+        assert await client.readCommand(0.5) == b''
+        while emu.reopen is None: # dropLink is called from other thread
+            await asyncio.sleep(0.01)
+        await asyncio.wrap_future(emu.reopen)
+        assert isinstance(emu.server, interfaceAsync.AsyncTcpServer) and emu.server.isOpened()
+        client.close()
+        client = interfaceAsync.AsyncTcpClient()
+        client.setAddress(emu.EMULATOR_IP, emu.EMULATOR_PORT)
+        await client.open()
+        client.write(commandRegistry.ChunkCommand(b'def', 3).encode())
+        assert await client.readCommand(1.0) == commandRegistry.AckCommand(3).encode()
+        assert bytes(emu.imageSource) == b'abcdef'
+        client.close()
+        emu.close()
+        AsyncUpperLayerEmulator.DROP_LINK_AFTER = 0
+        
+    asyncio.run(testAsyncSubscribe())
+    asyncio.run(testAsyncDropLink())
+    
+    app = qtc.QCoreApplication([])
+    image = np.random.randint(0, 256, 2 ** 21, dtype = np.uint8)
+    for replyDelay in (0.0, 0.005, 0.02):
+        for windowed in (False, True):
+            UpperLayerEmulator.REPLY_DELAY = replyDelay
+            emu = UpperLayerEmulator()
+            emu.open()
+            con = upperLayerConnector.UpperLayerConnector(testMode = True)
+            con.requestConnection({'action': 'Connection', 'type': 'Hardware', 'protocol': 'TCPIP'})
+            con.windowed = windowed # stop-and-wait VX!DATA otherwise
+            start = time.perf_counter()
+            con.startTransfer(image)
+            duration = time.perf_counter() - start
+            assert np.array_equal(emu.imageSource, image)
+            print('round trip {:4.0f} ms, {:<14s}: {:6.2f} s, {:8.2f} MB/s'.\
+                  format(replyDelay * 1e3, 'sliding window' if windowed else 'stop-and-wait', 
+                         duration, image.size / duration / 1e6))
+            con.close()
+            emu.close()
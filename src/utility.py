@@ -18,6 +18,8 @@ from PyQt5 import QtGui as qtg
 from PyQt5 import QtCore as qtc
 
 from PyQt5 import QtSerialPort as qtsp
+
+import time
    
 def getComPortList() -> list:
     '''Return a sorted list with names of available COM ports.'''
@@ -92,6 +94,46 @@ class IpAdrValidator(qtg.QValidator):
             state = qtg.QValidator.Acceptable
         return (state, strInput, pos)
     
+class StallWatchdog(qtc.QObject):
+    ''' Measure stalls of event loop of thread it was created in: timer is expected every TICK_INTERVAL,
+        lateness above STALL_LIMIT is reported by stallDetected (in seconds). '''
+    
+    stallDetected = qtc.pyqtSignal(float)
+    
+    TICK_INTERVAL = 0.005 # in sec
+    STALL_LIMIT = 0.016 # in sec, one frame at 60 Hz
+    
+    def __init__(self, parent = None):
+        super().__init__(parent)
+        self.timer = qtc.QTimer(self)
+        self.timer.setTimerType(qtc.Qt.PreciseTimer)
+        self.timer.setInterval(int(self.TICK_INTERVAL * 1000))
+        self.timer.timeout.connect(self._tick)
+        self.maxStall = 0.0
+        self.stallCount = 0
+        self.lastTick = 0.0
+        
+    @qtc.pyqtSlot()
+    def start(self):
+        self.maxStall = 0.0
+        self.stallCount = 0
+        self.lastTick = time.perf_counter()
+        self.timer.start()
+        
+    @qtc.pyqtSlot()
+    def stop(self):
+        self.timer.stop()
+        
+    @qtc.pyqtSlot()
+    def _tick(self):
+        now = time.perf_counter()
+        stall = now - self.lastTick - self.TICK_INTERVAL
+        self.lastTick = now
+        self.maxStall = max(self.maxStall, stall)
+        if stall > self.STALL_LIMIT:
+            self.stallCount += 1
+            self.stallDetected.emit(stall)
+    
 def changeRelativePath(classWidget): 
     '''Using for testing'''
            
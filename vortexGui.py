@@ -26,6 +26,8 @@ from informationWidget import InformationWidget
 
 from upperLayerConnector import UpperLayerConnector
 from upperLayerEmulator import UpperLayerEmulator
+import interfaceTcp
+import utility
 
 sys.path.append('res')
 import resources
@@ -40,10 +42,13 @@ class MainWindow(qtw.QMainWindow):
     # test application using emulator of upper layer (localhost server)
     RUN_UPPER_LAYER_EMULATOR = False
     
+    LOG_FILE_PATH = 'vortexGui.log' # rotated by interfaceTcp.TcpLogFile
+    
     def __init__(self):
         super().__init__()
         
         self.updateLayerVersion('not connected', 'not connected') # unknown, read on connection
+        self.logFile = interfaceTcp.TcpLogDrain.instance().addSink(interfaceTcp.TcpLogFile(self.LOG_FILE_PATH))
 
         self._setupUi()
         self.show()
@@ -75,6 +80,8 @@ class MainWindow(qtw.QMainWindow):
         self.transferWidget.setSizePolicy(qtw.QSizePolicy.Preferred, qtw.QSizePolicy.Maximum)
         
         self.upperLayerConnector = UpperLayerConnector(self.RUN_UPPER_LAYER_EMULATOR)
+        self.upperLayerConnector.startWorker()
+        self.stallWatchdog = utility.StallWatchdog(self)
         
         if self.RUN_UPPER_LAYER_EMULATOR:
             self.upperLayerEmulator = UpperLayerEmulator()
@@ -95,6 +102,7 @@ class MainWindow(qtw.QMainWindow):
         self.connectionWidget.connectionRequested.connect(self.upperLayerConnector.requestConnection)
         self.upperLayerConnector.connectionStatusChanged.connect(self.connectionWidget.changeConnectionStatus)
         self.upperLayerConnector.errorShown.connect(self.connectionWidget.showError)
+        self.upperLayerConnector.linkStateChanged.connect(self.connectionWidget.showLinkState)
         self.upperLayerConnector.layerVersionUpdated.connect(self.updateLayerVersion)
         self.upperLayerConnector.parameterAllRequested.connect(self.modemWidget.requestAllParameter)
         
@@ -104,16 +112,44 @@ class MainWindow(qtw.QMainWindow):
         self.transferWidget.transferStarted.connect(self.informationWidget.startImage)
         self.transferWidget.transferStopped.connect(self.informationWidget.clearImage)
         
+        self.transferWidget.sourceLoaded.connect(self.upperLayerConnector.setSourcePath)
         self.transferWidget.transferStarted.connect(self.upperLayerConnector.startTransfer)
+        # cancel running transfer directly, connector thread is busy with it
+        self.transferWidget.transferStopped.connect(self.upperLayerConnector.cancel, qtc.Qt.DirectConnection)
         self.transferWidget.transferStopped.connect(self.upperLayerConnector.stopTtransfer)
+        self.upperLayerConnector.transferProgressed.connect(self.showTransferProgress)
+        self.upperLayerConnector.requestTimedOut.connect(self.showRequestTimeout)
+        
+        self.transferWidget.transferStarted.connect(self.stallWatchdog.start)
+        self.transferWidget.transferStopped.connect(self.stallWatchdog.stop)
+        self.stallWatchdog.stallDetected.connect(self.showStall)
+        self.upperLayerConnector.writeBufferChanged.connect(self.transferWidget.showWriteBuffer)
         
         self.informationWidget.infoRequested.connect(self.upperLayerConnector.requestInfo)
+        self.informationWidget.infoSubscribed.connect(self.upperLayerConnector.subscribeInfo)
         self.upperLayerConnector.infoShown.connect(self.informationWidget.showInfo)
+        self.upperLayerConnector.infoShown.connect(self.transferWidget.updateLinkRate)
+        self.upperLayerConnector.logShown.connect(self.informationWidget.showLog)
+        
+    @qtc.pyqtSlot(int, int, float)
+    def showTransferProgress(self, numByte, total, rate):
+        self.statusBar().showMessage(f'Transferred {numByte} of {total} bytes, {rate / 1e3:.1f} kB/s.')
+        
+    @qtc.pyqtSlot(str)
+    def showRequestTimeout(self, name):
+        self.statusBar().showMessage(f'No response for command {name}.')
+        
+    @qtc.pyqtSlot(float)
+    def showStall(self, stall):
+        self.statusBar().showMessage(f'GUI was not responding for {stall * 1e3:.0f} ms.')
         
     def closeEvent(self, event):
         self.upperLayerConnector.close()
         if self.RUN_UPPER_LAYER_EMULATOR:
             self.upperLayerEmulator.close()
+        interfaceTcp.TcpLogDrain.instance().flush()
+        interfaceTcp.TcpLogDrain.instance().removeSink(self.logFile)
+        self.logFile.close()
         event.accept()
         
     def showAboutDialog(self):            